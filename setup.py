@@ -21,7 +21,6 @@ requirements = [
     'exifread',
     'flir_ptu',
     'pyserial',
-    'ocrd-pyexiftool',
     'remi'
 ]
 
@@ -40,6 +39,10 @@ setup(
                  'stereosim'},
     include_package_data=True,
     install_requires=requirements,
+    extras_require={
+        # Downscaled previews in the shared frame buffer
+        'preview': ['Pillow'],
+    },
     dependency_links=[
         'git+https://genovesa.sese.asu.edu/timv/flir_ptu.git#egg=flir_ptu'],
     license="BSD",
@@ -58,7 +61,8 @@ setup(
         "console_scripts": [
             "generate_pds = stereosim.generate_pds:main",
             "populate_pds = stereosim.populate_pds:main",
-            "maze = stereosim.console:main"
+            "maze = stereosim.console:main",
+            "maze_benchmark = stereosim.maze.benchmark:main"
         ]
     }
 )
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""End-to-end benchmark of the capture pipeline
+
+Runs MAZE against the simulated cameras, PTU and IMU of `simulator` and
+reports pairs per minute, the per-phase latencies of `metrics.registry` and
+the peak RSS of every scenario. Scenarios that cannot run here, such as
+'pds' without its optional dependencies, are reported as skipped. Device latencies come from a simulator
+profile, a built-in one or a YAML file of latencies recorded on the rig.
+The results can be saved as a baseline and later runs compared against it:
+
+    python -m stereosim.maze.benchmark --profile usb2 --save-baseline b.json
+    python -m stereosim.maze.benchmark --profile usb2 --baseline b.json
+"""
+import argparse
+import json
+import logging
+import platform
+import resource
+import sys
+import tempfile
+import time
+from stereosim.maze import metrics, label, pipeline
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ('preview', 'capture', 'capture_pipelined', 'bulk', 'mosaic',
+             'label', 'pds')
+
+# Phase statistics compared against the baseline
+PHASE_KEYS = ('mean', 'p95')
+
+
+def reset_peak_rss():
+    """ Restart the peak RSS at the current RSS, Linux only.
+
+    Returns
+    -------
+    bool : False if the peak could not be reset and keeps covering the
+        whole process
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_kb():
+    """ Peak resident set size of this process in KiB, since the last
+    `reset_peak_rss`."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Bytes on macOS, KiB elsewhere
+        peak //= 1024
+    return peak
+
+
+def run_scenario(func, pairs=None):
+    """ Run `func` with fresh metrics and summarize them.
+
+    Parameters
+    ----------
+    func : callable
+        Runs the scenario
+    pairs : int
+        Pairs processed, defaults to the 'pairs_captured' counter
+
+    Returns
+    -------
+    dict : pairs, duration in seconds, pairs per minute, phase histograms,
+        counters and the peak RSS in KiB, of this scenario where
+        `reset_peak_rss` works and of the process so far elsewhere
+    """
+    metrics.registry.reset()
+    reset_peak_rss()
+    start = time.monotonic()
+    func()
+    duration = time.monotonic() - start
+    snapshot = metrics.registry.snapshot()
+    if pairs is None:
+        pairs = snapshot['counters'].get('pairs_captured', 0)
+    return {'pairs': pairs,
+            'duration': duration,
+            'pairs_per_minute': pairs * 60.0 / duration if duration else None,
+            'phases': snapshot['histograms'],
+            'counters': snapshot['counters'],
+            'peak_rss_kb': peak_rss_kb()}
+
+
+def _label_pairs(pairs):
+    for images in pairs:
+        for image_path, camera_name in zip(images, ('Left', 'Right')):
+            with metrics.registry.timer('label'):
+                label.create_label(image_path, camera_name, (0.0, 0.0),
+                                   {'quat': [1.0, 0.0, 0.0, 0.0]})
+
+
+def _generate_pds(pairs, generator):
+    for images in pairs:
+        for image_path in images:
+            try:
+                with metrics.registry.timer('pds'):
+                    generator(image_path)
+            except Exception as e:
+                metrics.registry.increment('pds_errors')
+                logger.exception("PDS Generation Failed")
+                logger.exception(e)
+
+
+def run_benchmark(profile='usb2', pairs=10, mosaic_extent=(40, 20),
+                  session_path=None, scenarios=SCENARIOS):
+    """ Run the benchmark scenarios on simulated hardware.
+
+    Parameters
+    ----------
+    profile : str or dict
+        Simulator profile, see `simulator.Simulator`
+    pairs : int
+        Pairs per scenario, the mosaic size follows from `mosaic_extent`
+    mosaic_extent : tuple
+        Azimuth and elevation extent of the mosaic in degrees
+    session_path : str
+        Folder for the captured images, a temporary one by default
+
+    Returns
+    -------
+    dict : profile, settings and a result of `run_scenario` per scenario,
+        or {'skipped': reason} for a scenario that could not run
+    """
+    # Not needed for comparing results, and needs the PTU driver
+    from stereosim.maze.maze import MAZE
+
+    tmp = None
+    if session_path is None:
+        tmp = tempfile.TemporaryDirectory(prefix='stereosim_benchmark_')
+        session_path = tmp.name
+    maze = MAZE(simulate=profile, session_path=session_path)
+    captured = []
+    results = {}
+    try:
+        maze.connect()
+        if 'preview' in scenarios:
+            results['preview'] = run_scenario(
+                lambda: [maze.preview() for i in range(pairs)], pairs)
+        if 'capture' in scenarios:
+            def capture():
+                for i in range(pairs):
+                    images = maze.capture()
+                    if images is not None:
+                        captured.append(list(images))
+            results['capture'] = run_scenario(capture)
+        if 'capture_pipelined' in scenarios:
+            def capture_pipelined():
+                for i in range(pairs):
+                    maze.capture(pipelined=True)
+                try:
+                    maze.pipeline.join()
+                except pipeline.TransferError as e:
+                    # Counted in 'transfer_errors'
+                    logger.warning(str(e))
+            results['capture_pipelined'] = run_scenario(capture_pipelined)
+        if 'bulk' in scenarios:
+            results['bulk'] = run_scenario(
+                lambda: maze.bulk(pairs, pipelined=True))
+        if 'mosaic' in scenarios:
+            az, el = mosaic_extent
+            positions = maze.plan_mosaic((-az / 2.0, az / 2.0),
+                                         (-el / 2.0, el / 2.0))
+            results['mosaic'] = run_scenario(lambda: maze.mosaic(positions))
+        if 'label' in scenarios:
+            results['label'] = run_scenario(
+                lambda: _label_pairs(captured), len(captured))
+        if 'pds' in scenarios:
+            try:
+                from stereosim.scripts.generate_pds import PDSGenerator
+            except ImportError as e:
+                logger.warning("Skipping PDS Generation: {}".format(e))
+                results['pds'] = {'skipped': str(e)}
+            else:
+                results['pds'] = run_scenario(
+                    lambda: _generate_pds(captured, PDSGenerator),
+                    len(captured))
+    finally:
+        maze.disconnect()
+        if maze.simulator is not None:
+            maze.simulator.stop()
+        if tmp is not None:
+            tmp.cleanup()
+    return {'profile': profile,
+            'pairs': pairs,
+            'mosaic_extent': list(mosaic_extent),
+            'python': platform.python_version(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'scenarios': results}
+
+
+def _change(current, baseline):
+    if not baseline:
+        return None
+    return (current - baseline) / float(baseline)
+
+
+def compare(results, baseline, tolerance=0.1, min_delta=0.005):
+    """ Regressions of `results` against `baseline`.
+
+    A scenario regressed when its pairs per minute dropped, or a phase
+    latency (mean or p95) or the peak RSS grew, by more than `tolerance`.
+    Latencies must also have grown by `min_delta` seconds, so that noise on
+    sub-millisecond phases is not flagged. Scenarios and phases missing
+    from either side, or skipped on either side, are not compared.
+
+    Returns
+    -------
+    list : dicts with scenario, metric, baseline and current value and the
+        relative change
+    """
+    if results.get('profile') != baseline.get('profile'):
+        logger.warning("Comparing profile {} against a baseline of {}"
+                       .format(results.get('profile'),
+                               baseline.get('profile')))
+    regressions = []
+
+    def check(scenario, metric, base, current, higher_is_worse, delta=0):
+        if base is None or current is None:
+            return
+        change = _change(current, base)
+        if change is None:
+            return
+        worse = change if higher_is_worse else -change
+        if worse > tolerance and abs(current - base) >= delta:
+            regressions.append({'scenario': scenario, 'metric': metric,
+                                'baseline': base, 'current': current,
+                                'change': change})
+
+    for name, base in sorted(baseline.get('scenarios', {}).items()):
+        current = results.get('scenarios', {}).get(name)
+        if current is None:
+            logger.warning("Scenario {} not in the results".format(name))
+            continue
+        if 'skipped' in current or 'skipped' in base:
+            logger.warning("Scenario {} skipped, not compared".format(name))
+            continue
+        check(name, 'pairs_per_minute', base.get('pairs_per_minute'),
+              current.get('pairs_per_minute'), False)
+        for phase, stats in sorted(base.get('phases', {}).items()):
+            now = current.get('phases', {}).get(phase)
+            if now is None:
+                continue
+            for key in PHASE_KEYS:
+                check(name, '{}.{}'.format(phase, key), stats.get(key),
+                      now.get(key), True, min_delta)
+        check(name, 'peak_rss_kb', base.get('peak_rss_kb'),
+              current.get('peak_rss_kb'), True)
+    return regressions
+
+
+def format_results(results, regressions=None):
+    """ Plain text table of the results and regressions."""
+    lines = ['Profile: {}, {} pairs per scenario'.format(
+        results['profile'], results['pairs'])]
+    for name in SCENARIOS:
+        result = results['scenarios'].get(name)
+        if result is None:
+            continue
+        if 'skipped' in result:
+            lines.append('{:<18} skipped: {}'.format(name, result['skipped']))
+            continue
+        lines.append('{:<18} {:>5} pairs {:>8.1f} s {:>8} pairs/min '
+                     '{:>9} KiB peak RSS'.format(
+                         name, result['pairs'], result['duration'],
+                         'n/a' if result['pairs_per_minute'] is None else
+                         '{:.1f}'.format(result['pairs_per_minute']),
+                         result['peak_rss_kb']))
+        for phase, stats in sorted(result['phases'].items()):
+            if not stats['count']:
+                continue
+            lines.append('    {:<16} mean {:8.4f} s  p95 {:8.4f} s  '
+                         'max {:8.4f} s  ({})'.format(
+                             phase, stats['mean'], stats['p95'],
+                             stats['max'], stats['count']))
+    for regression in regressions or []:
+        lines.append('REGRESSION {scenario} {metric}: {baseline:.4g} -> '
+                     '{current:.4g} ({change:+.0%})'.format(**regression))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the MAZE capture pipeline on simulated '
+                    'hardware')
+    parser.add_argument('--profile', default='usb2',
+                        help="simulator profile: 'ideal', 'usb2', 'field' "
+                             "or a YAML file of recorded latencies")
+    parser.add_argument('--pairs', type=int, default=10,
+                        help='pairs per scenario')
+    parser.add_argument('--mosaic-extent', type=float, nargs=2,
+                        default=(40, 20), metavar=('AZ', 'EL'),
+                        help='mosaic extent in degrees')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS,
+                        default=SCENARIOS)
+    parser.add_argument('--session', help='folder for the captured images')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='baseline JSON to compare with')
+    parser.add_argument('--save-baseline', metavar='PATH',
+                        help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative change flagged as a regression')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run_benchmark(args.profile, args.pairs, args.mosaic_extent,
+                            args.session, args.scenarios)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+    print(format_results(results, regressions))
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
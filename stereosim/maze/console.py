@@ -1,3 +1,4 @@
+import argparse
 import sys
 from subprocess import call
 import logging
@@ -23,6 +24,7 @@ class Console(object):
         manager.connect()
         self.maze = manager.get_maze()
         self.maze.connect()
+        self.liveview_on = False
 
     def command_help(self):
         print('-----------------------------------------------------------------')
@@ -38,9 +40,14 @@ class Console(object):
         print('-----------------------------------------------------------------')
         print(' b - To take a bunch of pictures at one PTU direction')
         print(' m - To take a mosaic')
+        print(' i - To take pictures at a fixed interval')
+        print(' k - To resume an interrupted mosaic or bulk job')
+        print(' j - To show the progress of jobs')
+        print(' x - To cancel a job')
         print('-----------------------------------------------------------------')
         print(' s - To print most recent camera parameters')
         print(' v - To take a preview image')
+        print(' l - To start/stop live view on the web preview')
         print('-----------------------------------------------------------------')
 
     def test_case(self, command_input):
@@ -49,10 +56,15 @@ class Console(object):
                    's': self.get_stats,
                    'c': self.capture,
                    'v': self.preview,
+                   'l': self.liveview,
                    'm': self.mosaic,
                    'd': self.maze.disconnect,
-                   'r': self.maze.connect,
+                   'r': self.reconnect,
                    'b': self.bulk,
+                   'i': self.interval,
+                   'k': self.resume,
+                   'j': self.jobs,
+                   'x': self.cancel,
                    'q': self.quit,
                    '?': self.command_help}
         try:
@@ -67,12 +79,26 @@ class Console(object):
         return True
 
     def capture(self):
-        print('Capturing an Image...')
-        self.maze.capture()
+        # Queued behind running jobs, which use the same cameras
+        job_id = self.maze.submit_job('capture')
+        print('Capturing an Image... (job {})'.format(job_id))
 
     def preview(self):
-        print('Capturing an Preview...')
-        self.maze.preview()
+        job_id = self.maze.submit_job('preview')
+        print('Capturing an Preview... (job {})'.format(job_id))
+
+    def liveview(self):
+        if self.liveview_on:
+            print('Stopping Live View...')
+            self.maze.stop_liveview()
+        else:
+            try:
+                self.maze.start_liveview()
+            except RuntimeError as e:
+                print("{}, wait for them or cancel them with 'x'".format(e))
+                return
+            print('Starting Live View...')
+        self.liveview_on = not self.liveview_on
 
     def pos_arr(self, pos):
         """Make an (x,2) position array from a comma seperated list.
@@ -105,6 +131,7 @@ class Console(object):
         print('-' * 50)
         positions = input("\n Enter comma separated list of az/el positions for mosaic"
                           "\n enter 'd' for default positions"
+                          "\n enter 'g' to cover an az/el extent"
                           "\n enter 'q' to quit program: ")
         print('-' * 50)
         if positions == 'd':
@@ -114,8 +141,28 @@ class Console(object):
             print('-' * 50)
         if positions == 'q':
             self.quit()
-        positions = self.pos_arr(positions)
-        self.maze.mosaic(positions)
+        if positions == 'g':
+            positions = self.grid()
+            if positions is None:
+                return
+        else:
+            positions = self.pos_arr(positions)
+        job_id = self.maze.submit_job('mosaic', positions)
+        print("Mosaic queued as job {}, use 'j' for its progress".format(job_id))
+
+    def grid(self):
+        """Plan mosaic positions from an az/el extent and overlap."""
+        try:
+            az_min, az_max = map(float, input('Enter Azimuth min,max: ').split(','))
+            el_min, el_max = map(float, input('Enter Elevation min,max: ').split(','))
+            overlap = float(input('Enter overlap in percent: ')) / 100.0
+        except ValueError:
+            logger.error("Value Input Error")
+            return None
+        positions = self.maze.plan_mosaic((az_min, az_max), (el_min, el_max),
+                                          overlap)
+        print('{} positions planned'.format(len(positions)))
+        return positions
 
     def get_stats(self):
         print('Camera Parameters:')
@@ -139,7 +186,9 @@ class Console(object):
         except ValueError:
             logger.error("Value Input Error")
         else:
-            self.maze.point((az, el))
+            # Queued, so a running mosaic is not moved off its positions
+            job_id = self.maze.submit_job('point', (az, el))
+            print('Pointing to {}, {}... (job {})'.format(az, el, job_id))
 
     def bulk(self):
         # take  a bunch of pictures
@@ -149,20 +198,105 @@ class Console(object):
         except ValueError:
             logger.error("Value Input Error")
         else:
-            self.maze.bulk(num)
+            job_id = self.maze.submit_job('bulk', num)
+            print("Bulk capture queued as job {}".format(job_id))
+
+    def interval(self):
+        # take pictures at a fixed cadence
+        try:
+            interval = float(input("Input the interval in seconds: "))
+            num = int(input("Input the number of images you want to take: "))
+        except ValueError:
+            logger.error("Value Input Error")
+        else:
+            job_id = self.maze.submit_job('interval', interval, num)
+            print("Interval capture queued as job {}".format(job_id))
+
+    def resume(self):
+        job_ids = self.maze.unfinished_jobs()
+        if not job_ids:
+            print('No interrupted jobs')
+            return
+        for idx, job_id in enumerate(job_ids):
+            print(' {} - {}'.format(idx, job_id))
+        try:
+            job_id = job_ids[int(input('Select a job to resume: '))]
+        except (ValueError, IndexError):
+            logger.error("Value Input Error")
+        else:
+            queued_id = self.maze.submit_job('resume', job_id)
+            print("Resume of {} queued as job {}".format(job_id, queued_id))
+
+    def jobs(self):
+        jobs = self.maze.job_status()
+        if not jobs:
+            print('No jobs')
+        for job in jobs:
+            print(' {job_id} - {kind}: {status}, {completed}/{total}'.format(**job))
+            if job['error'] is not None:
+                print('     {}'.format(job['error']))
+            elif job['kind'] == 'mosaic' and job['report'] is not None:
+                report = job['report']
+                print('     took {:.1f} s, slewing {:.1f} s (estimated {:.1f} s)'.format(
+                    report['actual_duration'], report['actual_slew'],
+                    report['estimated_slew']))
+            elif job['kind'] == 'new_session' and job['report'] is not None:
+                print('     session number {}'.format(job['report']))
+            elif job['kind'] == 'interval' and job['report'] is not None:
+                report = job['report']
+                print('     {} slots missed, max jitter: {}'.format(
+                    len(report['missed']), report['jitter_max']))
+            if isinstance(job['report'], dict) and \
+                    job['report'].get('unarchived'):
+                print('     {} files not archived, still staged'.format(
+                    job['report']['unarchived']))
+
+    def cancel(self):
+        try:
+            job_id = int(input('Enter the job to cancel: '))
+            self.maze.cancel_job(job_id)
+        except (ValueError, KeyError):
+            logger.error("Value Input Error")
 
     def new_session(self):
-        no = self.maze.new_session()
-        print("New session with no: {} started".format(no))
+        # Queued, so running jobs finish in their session folder
+        job_id = self.maze.submit_job('new_session')
+        print("New session queued as job {}, use 'j' for its number".format(
+            job_id))
+
+    def reconnect(self):
+        job_id = self.maze.submit_job('reconnect')
+        print('Reconnect queued as job {}'.format(job_id))
 
     def quit(self):
         self.maze.disconnect()
 
 
 def main():
+    parser = argparse.ArgumentParser(description='MAZE capture console')
+    parser.add_argument('--simulate', metavar='PROFILE',
+                        help="run on simulated hardware: 'ideal', 'usb2', "
+                             "'field' or a YAML profile file")
+    parser.add_argument('--staging', metavar='PATH',
+                        help='stage captures in this RAM-backed folder, '
+                             'e.g. /dev/shm/stereosim, and archive them in '
+                             'the background')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='fetch images into memory and write them once')
+    parser.add_argument('--capture-mode', choices=('blocking', 'event'),
+                        default='blocking',
+                        help='trigger the cameras with a blocking capture '
+                             'per camera or wait for their file events')
+    parser.add_argument('--cameras', nargs='+', metavar='NAME',
+                        help='ownernames of the rig cameras, left first')
+    args = parser.parse_args()
 
         # Start MAZE Process
-    maze_proc = Process(target=maze.main)
+    maze_proc = Process(target=maze.main, args=(args.simulate,),
+                        kwargs={'in_memory': args.in_memory,
+                                'capture_mode': args.capture_mode,
+                                'camera_names': args.cameras,
+                                'staging_path': args.staging})
     maze_proc.start()
     logger.info('Started MAZE in PID: {}'.format(maze_proc.pid))
     time.sleep(0.1)  # Wait for manager to spin up
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus(object):
+    """
+    In-memory event log that clients long-poll
+
+    Every event gets an increasing id. `get_events` returns the events
+    after a given id, waiting for a new one if there are none, so clients
+    hear about changes without polling for them.
+
+    Attributes
+    ----------
+    history : int
+        Number of most recent events kept
+    """
+
+    def __init__(self, history=256):
+        self.history = history
+        self.last_id = 0
+        self._events = collections.deque(maxlen=history)
+        self._cond = threading.Condition()
+
+    def publish(self, kind, data=None):
+        """ Add an event, e.g. publish('capture', {'images': [...]}).
+
+        Returns
+        -------
+        int : id of the event
+        """
+        with self._cond:
+            self.last_id += 1
+            self._events.append({'id': self.last_id, 'kind': kind,
+                                 'time': time.time(), 'data': data})
+            self._cond.notify_all()
+            return self.last_id
+
+    def get_events(self, since=0, timeout=None):
+        """ Events with an id above `since`, oldest first.
+
+        Parameters
+        ----------
+        since : int
+            Id of the last event the client has seen
+        timeout : float
+            Seconds to wait for a new event, returns an empty list after
+        """
+        with self._cond:
+            # A restarted source starts over with smaller ids
+            if since > self.last_id:
+                since = 0
+            self._cond.wait_for(lambda: self.last_id > since, timeout)
+            return [event for event in self._events if event['id'] > since]
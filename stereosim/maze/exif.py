@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Header-only EXIF reader
+
+Only the APP1 segment at the start of a JPEG is read and parsed, the image
+data itself is never touched. Only the tags used by the capture stats,
+labels and PDS generation are decoded.
+"""
+import io
+import logging
+import struct
+from collections import namedtuple
+from fractions import Fraction
+
+logger = logging.getLogger(__name__)
+
+ExifRecord = namedtuple('ExifRecord', ['focal_length', 'exposure_time',
+                                       'f_number', 'iso',
+                                       'date_time_original', 'model'])
+ExifRecord.__doc__ = """ EXIF tags of an image, None where missing.
+
+Rational tags (focal length in mm, exposure time in seconds, f-number) are
+`fractions.Fraction`, so `str()` gives the usual '1/200' notation."""
+
+# Tag ids
+MODEL = 0x0110
+EXIF_IFD_POINTER = 0x8769
+EXPOSURE_TIME = 0x829A
+F_NUMBER = 0x829D
+ISO_SPEED = 0x8827
+DATE_TIME_ORIGINAL = 0x9003
+FOCAL_LENGTH = 0x920A
+
+# TIFF field type: (struct format, size)
+TYPES = {1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('L', 4), 5: ('LL', 8),
+         7: ('B', 1), 9: ('l', 4), 10: ('ll', 8)}
+
+SOI = b'\xff\xd8'
+APP1 = 0xE1
+SOS = 0xDA
+
+
+def read_app1(f):
+    """ Find the EXIF APP1 payload, reading only the segment headers.
+
+    Parameters
+    ----------
+    f : file object
+        JPEG opened in binary mode, positioned at its start
+
+    Returns
+    -------
+    bytes or None : the TIFF structure after the 'Exif' marker
+    """
+    if f.read(2) != SOI:
+        return None
+    while True:
+        header = f.read(4)
+        if len(header) < 4 or header[0] != 0xFF:
+            return None
+        marker = header[1]
+        length = struct.unpack('>H', header[2:])[0]
+        if marker == SOS:
+            return None
+        if marker == APP1:
+            payload = f.read(length - 2)
+            if payload.startswith(b'Exif\x00\x00'):
+                return payload[6:]
+        else:
+            f.seek(length - 2, io.SEEK_CUR)
+
+
+def _read_ifd(tiff, offset, endian):
+    """ Decode one IFD into a dict of tag id to value.
+
+    A truncated IFD, e.g. of a partially transferred image, yields the
+    tags before the cut.
+    """
+    tags = {}
+    try:
+        _read_entries(tiff, offset, endian, tags)
+    except struct.error:
+        logger.debug("Truncated EXIF IFD at offset {}".format(offset))
+    return tags
+
+
+def _read_entries(tiff, offset, endian, tags):
+    count = struct.unpack(endian + 'H', tiff[offset:offset + 2])[0]
+    for idx in range(count):
+        entry = offset + 2 + 12 * idx
+        tag, field_type, num = struct.unpack(endian + 'HHL',
+                                             tiff[entry:entry + 8])
+        if field_type not in TYPES:
+            continue
+        fmt, size = TYPES[field_type]
+        value_offset = entry + 8
+        if size * num > 4:
+            value_offset = struct.unpack(endian + 'L',
+                                         tiff[entry + 8:entry + 12])[0]
+        data = tiff[value_offset:value_offset + size * num]
+        if field_type == 2:
+            tags[tag] = data.split(b'\x00', 1)[0].decode('ascii', 'replace')
+        elif field_type in (5, 10):
+            num_den = struct.unpack(endian + fmt * num, data)
+            values = [Fraction(n, d) if d else None
+                      for n, d in zip(num_den[::2], num_den[1::2])]
+            tags[tag] = values[0] if num == 1 else values
+        else:
+            values = struct.unpack(endian + fmt * num, data)
+            tags[tag] = values[0] if num == 1 else values
+
+
+def parse_tiff(tiff):
+    """ Decode the tags we use from an EXIF TIFF structure."""
+    if len(tiff) < 8:
+        return ExifRecord(None, None, None, None, None, None)
+    endian = '<' if tiff[:2] == b'II' else '>'
+    ifd0 = struct.unpack(endian + 'L', tiff[4:8])[0]
+    tags = _read_ifd(tiff, ifd0, endian)
+    if EXIF_IFD_POINTER in tags:
+        tags.update(_read_ifd(tiff, tags[EXIF_IFD_POINTER], endian))
+    return ExifRecord(focal_length=tags.get(FOCAL_LENGTH),
+                      exposure_time=tags.get(EXPOSURE_TIME),
+                      f_number=tags.get(F_NUMBER),
+                      iso=tags.get(ISO_SPEED),
+                      date_time_original=tags.get(DATE_TIME_ORIGINAL),
+                      model=tags.get(MODEL))
+
+
+def read_exif(image):
+    """ Read the EXIF tags of a JPEG from its header only.
+
+    Parameters
+    ----------
+    image : str or bytes
+        Path of the image, or the image data itself
+
+    Returns
+    -------
+    ExifRecord : with every field None if the image has no EXIF
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        tiff = read_app1(io.BytesIO(image))
+    else:
+        with open(image, 'rb') as f:
+            tiff = read_app1(f)
+    if tiff is None:
+        return ExifRecord(None, None, None, None, None, None)
+    return parse_tiff(tiff)
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""Latest-frame buffer shared between the MAZE and web preview processes
+
+MAZE publishes a downscaled copy of the most recent frames and their stats
+to a `multiprocessing.shared_memory` block, the web preview reads them
+without a manager call or a disk read. A sequence number guards the block
+(seqlock): it is odd while a write is in progress, and a reader retries
+when it changed during its copy.
+"""
+import io
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from stereosim.maze import metrics
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+NAME = 'stereosim_preview'
+SEQUENCE = struct.Struct('<Q')
+GEOMETRY = struct.Struct('<LLL')
+LENGTH = struct.Struct('<L')
+HEADER_SIZE = SEQUENCE.size + GEOMETRY.size
+
+# Buffers created by this process, which unlinks them on exit
+_created = set()
+
+
+def downscale(data, size=(1024, 1024), quality=85):
+    """ Re-encode a JPEG to fit in `size`.
+
+    Uses the JPEG draft mode of Pillow, which decodes straight to a
+    fraction of the full resolution. Returns `data` unchanged when Pillow
+    is not installed.
+    """
+    if Image is None:
+        return data
+    image = Image.open(io.BytesIO(data))
+    image.draft('RGB', size)
+    image.thumbnail(size)
+    out = io.BytesIO()
+    image.convert('RGB').save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+class FrameBuffer(object):
+    """
+    Shared-memory slot holding the latest frame of every camera and stats
+
+    Layout: sequence number, camera count, frame and stats size, then per
+    camera a frame length and a region of `frame_size` bytes, then a stats
+    length and `stats_size` bytes of JSON. There is a single writer, the
+    MAZE process.
+
+    Attributes
+    ----------
+    count : int
+        Number of cameras
+    frame_size : int
+        Maximum bytes of one frame
+    stats_size : int
+        Maximum bytes of the JSON stats
+    """
+
+    def __init__(self, shm, count, frame_size, stats_size):
+        self.shm = shm
+        self.count = count
+        self.frame_size = frame_size
+        self.stats_size = stats_size
+        # Publishing from several threads would break the seqlock
+        self._write_lock = threading.Lock()
+
+    @staticmethod
+    def _size(count, frame_size, stats_size):
+        return (HEADER_SIZE + count * (LENGTH.size + frame_size) +
+                LENGTH.size + stats_size)
+
+    @classmethod
+    def create(cls, count=2, frame_size=2 * 1024 ** 2, stats_size=64 * 1024,
+               name=NAME):
+        """ Create the buffer, replacing a stale one of a previous run."""
+        size = cls._size(count, frame_size, stats_size)
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _created.add(name)
+        buf = cls(shm, count, frame_size, stats_size)
+        SEQUENCE.pack_into(shm.buf, 0, 0)
+        GEOMETRY.pack_into(shm.buf, SEQUENCE.size, count, frame_size,
+                           stats_size)
+        return buf
+
+    @classmethod
+    def attach(cls, name=NAME):
+        """ Open the buffer created by the MAZE process."""
+        shm = shared_memory.SharedMemory(name)
+        if name not in _created:
+            # Only the creating process may unlink the block on exit
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        count, frame_size, stats_size = GEOMETRY.unpack_from(
+            shm.buf, SEQUENCE.size)
+        return cls(shm, count, frame_size, stats_size)
+
+    def _frame_offset(self, index):
+        return HEADER_SIZE + index * (LENGTH.size + self.frame_size)
+
+    @property
+    def _stats_offset(self):
+        return self._frame_offset(self.count)
+
+    @property
+    def sequence(self):
+        return SEQUENCE.unpack_from(self.shm.buf, 0)[0]
+
+    def publish(self, frames, stats=None):
+        """ Write the latest frames (JPEG bytes or None) and their stats.
+
+        Frames larger than `frame_size` are dropped from the slot.
+        """
+        stats = json.dumps(stats, default=str).encode()
+        if len(stats) > self.stats_size:
+            logger.warning("Preview stats too large for the frame buffer")
+            stats = b'null'
+        with self._write_lock:
+            self._write(frames, stats)
+
+    def _write(self, frames, stats):
+        buf = self.shm.buf
+        seq = self.sequence
+        SEQUENCE.pack_into(buf, 0, seq + 1)
+        for index, frame in enumerate(frames[:self.count]):
+            offset = self._frame_offset(index)
+            if frame is None or len(frame) > self.frame_size:
+                if frame is not None:
+                    logger.warning("Preview frame {} too large ({} bytes)"
+                                   .format(index, len(frame)))
+                LENGTH.pack_into(buf, offset, 0)
+                continue
+            LENGTH.pack_into(buf, offset, len(frame))
+            start = offset + LENGTH.size
+            buf[start:start + len(frame)] = frame
+        LENGTH.pack_into(buf, self._stats_offset, len(stats))
+        start = self._stats_offset + LENGTH.size
+        buf[start:start + len(stats)] = stats
+        SEQUENCE.pack_into(buf, 0, seq + 2)
+
+    def read(self, indices=None, retries=100):
+        """ Consistent copy of the slot.
+
+        Parameters
+        ----------
+        indices : list
+            Only copy the frames of these cameras, all frames if None
+
+        Returns
+        -------
+        tuple : (sequence number, list of frames, stats), frames not
+            copied or not published are None
+        """
+        buf = self.shm.buf
+        if indices is None:
+            indices = range(self.count)
+        for attempt in range(retries):
+            seq = self.sequence
+            if seq % 2:
+                time.sleep(0.001)
+                continue
+            frames = [None] * self.count
+            for idx in indices:
+                offset = self._frame_offset(idx)
+                length = LENGTH.unpack_from(buf, offset)[0]
+                if 0 < length <= self.frame_size:
+                    start = offset + LENGTH.size
+                    frames[idx] = bytes(buf[start:start + length])
+            length = LENGTH.unpack_from(buf, self._stats_offset)[0]
+            start = self._stats_offset + LENGTH.size
+            stats = bytes(buf[start:start + min(length, self.stats_size)])
+            if self.sequence == seq:
+                stats = json.loads(stats.decode()) if length else None
+                return seq, frames, stats
+        raise TimeoutError("Frame buffer kept changing while reading")
+
+    def stale(self):
+        """ Whether the block was unlinked, or replaced by a new one of the
+        same name, e.g. after a restart of the MAZE process.
+        """
+        path = os.path.join('/dev/shm', self.shm.name.lstrip('/'))
+        try:
+            return os.stat(path).st_ino != os.fstat(self.shm._fd).st_ino
+        except FileNotFoundError:
+            return True
+        except (AttributeError, OSError):
+            # No /dev/shm on this platform, assume the block is current
+            return False
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        _created.discard(self.shm.name)
+        self.shm.unlink()
+
+
+class PreviewPublisher(object):
+    """
+    Downscales frames and publishes them to a `FrameBuffer` in the
+    background
+
+    Only the latest submitted pair is kept: a pair that was not picked up
+    before the next one is dropped and counted in 'preview_dropped'.
+
+    Parameters
+    ----------
+    buf : FrameBuffer
+    locate : callable
+        Maps a submitted file path to its current location, e.g.
+        `StagingArea.locate`
+    listener : callable
+        Called as `listener(sequence)` after every publish
+    """
+
+    def __init__(self, buf, locate=None, listener=None):
+        self.buf = buf
+        self.locate = locate
+        self.listener = listener
+        self._pending = None
+        self._busy = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, frames, stats=None):
+        """ Queue a pair for publishing, replacing a pending one.
+
+        Parameters
+        ----------
+        frames : list
+            Per camera the JPEG bytes, a path to read them from or None
+        stats : list
+        """
+        with self._cond:
+            if self._pending is not None:
+                metrics.registry.increment('preview_dropped')
+            self._pending = (list(frames), stats)
+            self._cond.notify_all()
+
+    def _read(self, path):
+        for attempt in range(2):
+            location = path if self.locate is None else self.locate(path)
+            try:
+                with open(location, 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                # Moved to the archive in between, locate it again
+                if attempt:
+                    raise
+
+    def _publish(self, frames, stats):
+        scaled = []
+        for frame in frames:
+            if isinstance(frame, str):
+                frame = self._read(frame)
+            scaled.append(None if frame is None else downscale(frame))
+        self.buf.publish(scaled, stats)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    break
+                frames, stats = self._pending
+                self._pending = None
+                self._busy = True
+            try:
+                with metrics.registry.timer('preview_publish'):
+                    self._publish(frames, stats)
+                if self.listener is not None:
+                    self.listener(self.buf.sequence)
+            except Exception as e:
+                logger.exception("Preview Publish Failed")
+                logger.exception(e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """ Wait until the latest submitted pair is published.
+
+        Returns
+        -------
+        bool : False if `timeout` expired first
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._pending is None and not self._busy, timeout)
+
+    def close(self):
+        """ Publish the pending pair and stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
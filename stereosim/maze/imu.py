@@ -1,29 +1,38 @@
 import serial
 import serial.tools.list_ports as list_ports
 import json
+import time
 from threading import Thread
 from threading import Event
 import logging
+from stereosim.maze import pose
 
 logger = logging.getLogger(__name__)
 
 
 class IMU():
 
-    def __init__(self):
+    def __init__(self, port=None):
+        # None finds the unit by its USB ids, e.g. '/dev/pts/3' for the
+        # simulator
+        self.port = port
         self.last_data = dict()
+        self.history = pose.SampleHistory()
         self.ser_port = serial.Serial(baudrate=115200)
         self.thread = None
         self.kill = Event()
         self.is_connected = False
 
     def connect(self):  # connect to IMU Unit
-        ports = list_ports.comports()
-        imu_port_list = list(
-            filter(lambda x: x.vid == 9025 and x.pid == 32823, ports))
-        self.ser_port.port = imu_port_list[0][0]
-        logger.debug('Found {:d} IMU units, using: {:s}'.format(
-            len(imu_port_list), self.ser_port.port))
+        if self.port is not None:
+            self.ser_port.port = self.port
+        else:
+            ports = list_ports.comports()
+            imu_port_list = list(
+                filter(lambda x: x.vid == 9025 and x.pid == 32823, ports))
+            self.ser_port.port = imu_port_list[0][0]
+            logger.debug('Found {:d} IMU units, using: {:s}'.format(
+                len(imu_port_list), self.ser_port.port))
         try:
             self.ser_port.open()
             # threaded serial listener
@@ -47,8 +56,10 @@ class IMU():
                 # Guaranteed to have at least 2 entries
                 lines = buffer_string.split('\n')
                 IMU_string = lines[-2].strip()
+                received = time.monotonic()
                 try:
                     self.last_data = json.loads(IMU_string)
+                    self.history.append(received, self.last_data)
                 except Exception:
                     logger.warning("IMU Parse Error")
                 buffer_string = lines[-1]  # keeps buffer small
@@ -56,6 +67,20 @@ class IMU():
     def getData(self):  # Fetch latest data
         return self.last_data
 
+    def sample_at(self, timestamp):
+        """ IMU data interpolated to a `time.monotonic()` timestamp.
+
+        Falls back to the latest data while there is no history.
+
+        Returns
+        -------
+        tuple : (data dict, seconds to the nearest received sample or None)
+        """
+        data, offset = self.history.at(timestamp)
+        if data is None:
+            return dict(self.last_data), None
+        return data, offset
+
     def disconnect(self):
         self.kill.set()
         #self.thread.join() #TODO: Change this to processes, so that we can terminate it...
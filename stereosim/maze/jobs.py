@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+import datetime
+import glob
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class JobJournal(object):
+    """
+    Persisted plan and completion journal of a capture job
+
+    The plan is written once to `<job_id>.json`, every completed step is
+    appended to `<job_id>.journal`. After a crash the job can be loaded
+    again and continues with the steps that are not journaled yet.
+
+    Attributes
+    ----------
+    job_id : str
+    kind : str
+        Type of job, e.g. 'mosaic' or 'bulk'
+    steps : list
+        Plan of the job, one JSON serializable entry per step
+    params : dict
+        Options the job was started with
+    """
+
+    def __init__(self, folder, job_id, kind, steps, params=None):
+        self.folder = folder
+        self.job_id = job_id
+        self.kind = kind
+        self.steps = steps
+        self.params = params or {}
+        self.completed = set()
+        self._lock = threading.Lock()
+
+    @property
+    def plan_path(self):
+        return os.path.join(self.folder, self.job_id + '.json')
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.folder, self.job_id + '.journal')
+
+    @classmethod
+    def create(cls, folder, kind, steps, params=None):
+        """ Persist the plan of a new job in `folder`."""
+        os.makedirs(folder, exist_ok=True)
+        job_id = '{}_{}'.format(
+            kind, datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f'))
+        journal = cls(folder, job_id, kind, list(steps), params)
+        plan = {'job_id': job_id, 'kind': kind, 'steps': journal.steps,
+                'params': journal.params}
+        tmp_path = journal.plan_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(plan, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, journal.plan_path)
+        return journal
+
+    @classmethod
+    def load(cls, folder, job_id):
+        """ Load a job plan and the steps it already completed."""
+        journal_file = os.path.join(folder, job_id + '.json')
+        with open(journal_file) as f:
+            plan = json.load(f)
+        journal = cls(folder, plan['job_id'], plan['kind'], plan['steps'],
+                      plan['params'])
+        if os.path.isfile(journal.journal_path):
+            journal._read_journal()
+        return journal
+
+    @classmethod
+    def unfinished(cls, folder):
+        """ Ids of the jobs in `folder` that still have steps to do."""
+        job_ids = []
+        for path in sorted(glob.glob(os.path.join(folder, '*.json'))):
+            job_id = os.path.splitext(os.path.basename(path))[0]
+            if not cls.load(folder, job_id).done:
+                job_ids.append(job_id)
+        return job_ids
+
+    def _read_journal(self):
+        valid = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    self.completed.add(json.loads(line.decode())['step'])
+                except ValueError:
+                    # Torn last line of a crash, that step is redone
+                    logger.warning("Dropping bad journal line in {}".format(
+                        self.journal_path))
+                    break
+                valid += len(line)
+        # Cut off the torn line so new records start on a line of their own
+        if valid < os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(valid)
+
+    def remaining(self):
+        """ (index, step) of the steps that are not completed yet."""
+        return [(index, step) for index, step in enumerate(self.steps)
+                if index not in self.completed]
+
+    def record(self, index, result=None):
+        """ Durably mark step `index` as completed."""
+        with self._lock:
+            with open(self.journal_path, 'a') as f:
+                f.write(json.dumps({'step': index, 'result': result}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.completed.add(index)
+
+    @property
+    def done(self):
+        return len(self.completed) >= len(self.steps)
+
+    def progress(self):
+        return {'job_id': self.job_id, 'kind': self.kind,
+                'completed': len(self.completed), 'total': len(self.steps)}
+
+
+class QueuedJob(object):
+    """
+    A job submitted to a `JobQueue`
+
+    The function running the job reports each finished step with
+    `add_result`, sets `total` once known and checks `cancelled` between
+    steps.
+
+    Attributes
+    ----------
+    job_id : int
+    kind : str
+    status : str
+        'queued', 'running', 'done', 'failed' or 'cancelled'
+    results : list
+        Result of every finished step, in order
+    total : int
+        Number of steps, None while unknown
+    report : object
+        Return value of the job function
+    error : str
+    listener : callable
+        Called with `progress()` on every new result and status
+    """
+
+    FINISHED = ('done', 'failed', 'cancelled')
+
+    def __init__(self, job_id, kind, listener=None):
+        self.listener = listener
+        self.job_id = job_id
+        self.kind = kind
+        self.status = 'queued'
+        self.results = []
+        self.total = None
+        self.report = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self._cond = threading.Condition()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.status in self.FINISHED
+
+    def add_result(self, result):
+        with self._cond:
+            self.results.append(result)
+            self._cond.notify_all()
+        self._notify()
+
+    def set_status(self, status):
+        with self._cond:
+            self.status = status
+            self._cond.notify_all()
+        self._notify()
+
+    def _notify(self):
+        if self.listener is not None:
+            try:
+                self.listener(self.progress())
+            except Exception:
+                logger.exception("Job Listener Failed")
+
+    def results_since(self, since=0, timeout=None):
+        """ Step results from index `since` on, waiting up to `timeout`
+        seconds for new ones unless the job has finished.
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: len(self.results) > since or self.finished, timeout)
+            return self.results[since:]
+
+    def progress(self):
+        with self._cond:
+            return {'job_id': self.job_id, 'kind': self.kind,
+                    'status': self.status, 'completed': len(self.results),
+                    'total': self.total, 'report': self.report,
+                    'error': self.error}
+
+
+class JobQueue(object):
+    """
+    First-in first-out job queue run by a single worker thread
+
+    Jobs run one at a time, as they share the cameras and the PTU.
+    `submit` returns right away with an id to poll, stream or cancel.
+
+    Attributes
+    ----------
+    history : int
+        Number of finished jobs kept for polling
+    listener : callable
+        Passed on to every `QueuedJob`
+    """
+
+    def __init__(self, history=100, listener=None):
+        self.history = history
+        self.listener = listener
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, kind, func, *args, **kwargs):
+        """ Queue `func(*args, task=<QueuedJob>, **kwargs)`.
+
+        Returns
+        -------
+        int : job id
+        """
+        with self._lock:
+            job = QueuedJob(next(self._ids), kind, self.listener)
+            self.jobs[job.job_id] = job
+            self._prune()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker_thread)
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put((job, func, args, kwargs))
+        logger.info("Queued job {} ({})".format(job.job_id, kind))
+        return job.job_id
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def _worker_thread(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                self._queue.task_done()
+                break
+            job, func, args, kwargs = entry
+            try:
+                if job.cancelled:
+                    job.set_status('cancelled')
+                    continue
+                job.set_status('running')
+                job.report = func(*args, task=job, **kwargs)
+                job.set_status('cancelled' if job.cancelled else 'done')
+            except Exception as e:
+                logger.exception("Job {} Failed".format(job.job_id))
+                job.error = repr(e)
+                job.set_status('failed')
+            finally:
+                self._queue.task_done()
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs[job_id]
+
+    def list(self):
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return [job.progress() for job in jobs]
+
+    def busy(self):
+        """ Whether a job is queued or running."""
+        with self._lock:
+            return any(not job.finished for job in self.jobs.values())
+
+    def cancel(self, job_id):
+        """ Cancel a queued job, or stop a running one after its current
+        step.
+        """
+        self.get(job_id).cancel_event.set()
+
+    def join(self):
+        """ Block until every queued job has finished."""
+        self._queue.join()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
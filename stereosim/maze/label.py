@@ -1,25 +1,55 @@
 import os
 import yaml
-import exiftool
 import logging
+from stereosim.maze import exif
 
 logger = logging.getLogger(__name__)
 
-def create_label(image_path, camera_name, ptu_angle, IMU_data,):
+def _parse_focal_length(focal_length):
+    """ Convert a focal length stat such as '100 mm' or '473/10 mm' to mm,
+    None when it is missing or not a number."""
+    if focal_length is None:
+        return None
+    try:
+        value = focal_length.split()[0]
+        if '/' in value:
+            num, den = value.split('/')
+            return float(num) / float(den)
+        return float(value)
+    except (IndexError, ValueError, ZeroDivisionError):
+        return None
+
+
+def label_path(image_path):
+    """ Path of the label belonging to `image_path`."""
+    return '{}.lbl'.format(os.path.splitext(image_path)[0])
+
+
+def create_label(image_path, camera_name, ptu_angle, IMU_data, stats=None,
+                 target=None):
     """ Create label for captured image.
     Parameters
     ----------
     camera : camera_object
     file_path : str
+    stats : dict
+        Image stats from `StereoCamera.process_stats`. When given, the
+        focal length is taken from them instead of re-reading the image.
+    target : tuple
+        Commanded (az, el) of the PTU, next to the measured `ptu_angle`
     """
 
-    with exiftool.ExifTool() as et:
-        flmeta = et.get_tag('FocalLength', image_path)
-        #meta = et.get_metadata(file_path)
+    flmeta = None
+    if stats is not None:
+        flmeta = _parse_focal_length(stats.get('focallength'))
+    if flmeta is None:
+        flmeta = exif.read_exif(image_path).focal_length
+    if flmeta is None:
+        logger.warning("No focal length for {}".format(image_path))
 
     #focal_length = '{}'.format(meta['EXIF FocalLength'])
     #focal_length = '{}'.format(meta['XMP:FocalLength'])
-    focal_length = '{}'.format(flmeta)
+    focal_length = None if flmeta is None else float(flmeta)
 
     #pp = ptu_dict['pp']
     #tp = ptu_dict['tp']
@@ -33,13 +63,12 @@ def create_label(image_path, camera_name, ptu_angle, IMU_data,):
         logger.exception(e)
         IMU_quaternion = None
     
-    yaml_path = os.path.splitext(image_path)[0]
     contents = {
         'AZIMUTH': az,
         'ELEVATION': el,
         # 'PP': float(pp),
         # 'TP': float(tp),
-        'f': float(focal_length),
+        'f': focal_length,
         # 'pr': ptu.pan_res(),
         # 'tr': ptu.tilt_res(),
         # 'temp': ptu.ptu_temp(),
@@ -48,5 +77,19 @@ def create_label(image_path, camera_name, ptu_angle, IMU_data,):
         '': IMU_data,
         'IMU_quaternion': IMU_quaternion
     }
-    with open('{}.lbl'.format(yaml_path), 'w') as lblfile:
+    if target is not None:
+        contents['AZIMUTH_TARGET'] = float(target[0])
+        contents['ELEVATION_TARGET'] = float(target[1])
+    if stats is not None and 'trigger_start' in stats:
+        contents['TRIGGER_START'] = stats['trigger_start']
+        contents['TRIGGER_END'] = stats['trigger_end']
+        contents['TRIGGER_SKEW'] = stats['trigger_skew']
+    if stats is not None and stats.get('pose_time') is not None:
+        contents['POSE_TIME'] = stats['pose_time']
+        contents['PTU_TIME'] = stats['ptu_time']
+        contents['IMU_SAMPLE_OFFSET'] = stats['imu_offset']
+    if stats is not None and 'checksum' in stats:
+        contents['CHECKSUM'] = stats['checksum']
+        contents['CHECKSUM_TYPE'] = stats['checksum_type']
+    with open(label_path(image_path), 'w') as lblfile:
         yaml.dump(contents, lblfile, default_flow_style=False)
@@ -1,54 +1,364 @@
 # -*- coding: utf-8 -*-
 import logging
+import os
+import threading
+import time
+from collections import deque
+from fractions import Fraction
 from flir_ptu import ptu
 from stereosim.maze import stereo_camera, imu, session, label
+from stereosim.maze import pipeline, metrics, staging, planner, scheduler
+from stereosim.maze import jobs, framebuffer, events, simulator
 from multiprocessing import Lock
+from multiprocessing.dummy import Pool as ThreadPool
 from multiprocessing.managers import BaseManager
 
 logger = logging.getLogger(__name__)
 
+# Queries of the PTU for `planner.SlewModel.from_ptu`, per axis ('p', 't')
+PTU_LIMITS = {'speed': ('{}s', r'\sTarget \w+ speed is (?P<expected>\d+)'),
+              'accel': ('{}a', r'\s\w+ acceleration is (?P<expected>\d+)'),
+              'resolution': ('{}r',
+                             r'\s(?P<expected>[\d.]+) seconds arc per')}
+
 
 class MAZE(object):
 
-    def __init__(self):
-        self.cam = stereo_camera.StereoCamera()
-        self.ptu = ptu.PTU("10.5.1.2", 4000)
-        self.imu = imu.IMU()
-        self.session = session.Session("/srv/stereosim")
-        self.last_images = [None, None]
+    def __init__(self, in_memory=False, capture_mode='blocking',
+                 camera_names=None, staging_path=None, simulate=None,
+                 session_path="/srv/stereosim", frame_buffer_name=None):
+        """
+        Parameters
+        ----------
+        simulate : str or dict
+            Run against simulated hardware with this profile instead of
+            the rig, see `simulator.Simulator`. The session state and camera
+            port cache are then kept in `session_path` instead of ~/.config
+        frame_buffer_name : str
+            Name of the shared preview buffer, `framebuffer.NAME` by
+            default and unique to this process when simulating, so a
+            simulation never replaces the buffer of the live server
+        """
+        rig = None
+        if camera_names is not None:
+            rig = stereo_camera.CameraRig(camera_names)
+        self.simulator = None
+        backend = None
+        ptu_address = ("10.5.1.2", 4000)
+        imu_port = None
+        if simulate is not None:
+            if camera_names is None:
+                camera_names = (stereo_camera.StereoCamera.LEFTNAME,
+                                stereo_camera.StereoCamera.RIGHTNAME)
+            self.simulator = simulator.Simulator(simulate, camera_names)
+            self.simulator.start()
+            backend = self.simulator.gphoto2
+            ptu_address = self.simulator.ptu.address
+            imu_port = self.simulator.imu.port
+        self.cam = stereo_camera.StereoCamera(in_memory=in_memory,
+                                              capture_mode=capture_mode,
+                                              rig=rig, backend=backend)
+        self.ptu = ptu.PTU(*ptu_address)
+        self.imu = imu.IMU(port=imu_port)
+        self.pose_pool = ThreadPool(1)
+        self.session = session.Session(session_path)
+        if simulate is not None:
+            # Keep the image numbering and port cache of the rig untouched
+            self.session.config_file_path = os.path.join(
+                session_path, os.path.basename(session.Session.CONFIG_FILE))
+            self.cam.port_cache_path = os.path.join(
+                session_path,
+                os.path.basename(stereo_camera.StereoCamera.PORT_CACHE_FILE))
+        self.jobs_path = os.path.join(self.session.folder_path, 'jobs')
+        self.events = events.EventBus()
+        self.job_queue = jobs.JobQueue(
+            listener=lambda progress: self.events.publish('job', progress))
+        self.pipeline = pipeline.CapturePipeline(self.cam, depth=2)
+        self.slew_model = planner.SlewModel()
+        self.ptu_target = None
+        # End-to-end seconds of the recent pairs, from trigger to stored
+        self.pair_latency = deque(maxlen=50)
+        self.camera_fov = planner.camera_fov()
+        self.staging = None
+        if staging_path is not None:
+            # e.g. /dev/shm/stereosim, flushed to the session folders
+            self.staging = staging.StagingArea(staging_path,
+                                               self.session.folder_path)
+        self.last_images = [None] * len(self.cam.rig)
+        if frame_buffer_name is None:
+            frame_buffer_name = framebuffer.NAME
+            if simulate is not None:
+                frame_buffer_name = '{}_sim_{}'.format(framebuffer.NAME,
+                                                       os.getpid())
+        self.frame_buffer_name = frame_buffer_name
+        self.frame_buffer = None
+        self.preview_publisher = None
+        self._open_frame_buffer()
         self.connected = False
         self.img_stats = None
+        self.liveview_fps = 5
+        self.live_frames = [None] * len(self.cam.rig)
+        self.live_seq = 0
+        self._liveview_thread = None
+        self._liveview_stop = threading.Event()
 
     def get_last_images(self):
+        if self.staging is not None:
+            return [self.staging.locate(path) for path in self.last_images]
         return self.last_images
 
+    def get_last_image_data(self, index):
+        """ Bytes of the last image, or None when not kept in memory."""
+        return self.cam.last_image_data[index]
+
     def connect(self):
         if self.connected:
-            self.disconnect()
+            return self.reconnect()
 
         logger.info("Connecting")
 
-        cam_status = self.cam.detect_cameras()
+        cam_status = self.cam.reconnect()
 
         self.ptu.connect()
         ptu_status = self.ptu.stream.is_connected
+        if ptu_status:
+            self.read_slew_model()
 
         imu_status = self.imu.connect()
 
         self.session.setup()
+        self._open_frame_buffer()
         self.connected = True
         return cam_status, ptu_status, imu_status
 
+    def reconnect(self):
+        """ Recover from a dropped device without a full reconnect.
+
+        Cameras that still respond are kept and dropped ones are re-opened
+        on their cached ports, see `StereoCamera.reconnect`.
+        """
+        logger.info("Reconnecting")
+
+        cam_status = self.cam.reconnect()
+
+        if not self.ptu.stream.is_connected:
+            self.ptu.connect()
+        ptu_status = self.ptu.stream.is_connected
+
+        imu_status = self.imu.is_connected
+        if not imu_status:
+            imu_status = self.imu.connect()
+
+        return cam_status, ptu_status, imu_status
+
     def point(self, angle):
-        self.ptu.slew_to_angle(angle)
+        timer = time.monotonic()
+        with metrics.registry.timer('ptu_slew'):
+            self.ptu.slew_to_angle(angle)
+        if self.ptu_target is not None:
+            self.slew_model.observe(self.ptu_target, angle,
+                                    time.monotonic() - timer)
+        self.ptu_target = tuple(angle)
+        self.events.publish('ptu', {'angle': angle})
+
+    def read_slew_model(self):
+        """ Set `slew_model` from the speed, acceleration and resolution
+        of both PTU axes. Keeps the current model if the PTU does not
+        answer.
+        """
+        try:
+            limits = {}
+            for name, (command, regex) in PTU_LIMITS.items():
+                limits[name] = tuple(
+                    float(self.ptu.read_command(command.format(axis), regex))
+                    for axis in 'pt')
+        except Exception as e:
+            logger.exception("Reading PTU Limits Failed")
+            logger.exception(e)
+            return self.slew_model
+        self.slew_model = planner.SlewModel.from_ptu(
+            limits['speed'], limits['accel'], limits['resolution'],
+            self.slew_model.settle)
+        logger.info("PTU speed {} deg/s, acceleration {} deg/s^2".format(
+            self.slew_model.speed, self.slew_model.accel))
+        return self.slew_model
+
+    def get_events(self, since=0, timeout=None):
+        """ Events after id `since`: 'capture', 'stats', 'preview', 'ptu',
+        'job' and 'liveview', waiting up to `timeout` seconds for a new one.
+        See `events.EventBus`.
+        """
+        return self.events.get_events(since, timeout)
+
+    def get_metrics(self):
+        """ Latency histograms (seconds) and counters of the pipeline."""
+        return metrics.registry.snapshot()
+
+    def reset_metrics(self):
+        metrics.registry.reset()
+
+    def refresh_config(self):
+        """ Re-read camera settings after they were changed on the bodies."""
+        self.cam.refresh_config()
+
+    def apply_config(self, settings):
+        """ Apply a dict of camera settings to all cameras at once."""
+        return self.cam.apply_config(settings)
 
     def get_stats(self):
         return self.img_stats
 
     def preview(self):
         self.last_images, self.img_stats = self.cam.capture_previews()
+        self._publish_preview(self.last_images, self.img_stats)
+        self._publish_capture(self.last_images, self.img_stats, preview=True)
+
+    def get_frame_buffer_name(self):
+        """ Name of the shared preview buffer, None while there is none."""
+        if self.frame_buffer is None:
+            return None
+        return self.frame_buffer_name
+
+    def _open_frame_buffer(self):
+        if self.frame_buffer is not None:
+            return
+        try:
+            self.frame_buffer = framebuffer.FrameBuffer.create(
+                len(self.cam.rig), name=self.frame_buffer_name)
+        except Exception as e:
+            logger.exception("Preview Frame Buffer Failed")
+            logger.exception(e)
+            return
+        locate = None if self.staging is None else self.staging.locate
+        self.preview_publisher = framebuffer.PreviewPublisher(
+            self.frame_buffer, locate,
+            lambda sequence: self.events.publish('preview',
+                                                 {'sequence': sequence}))
+
+    def _close_frame_buffer(self):
+        publisher, self.preview_publisher = self.preview_publisher, None
+        if publisher is not None:
+            publisher.close()
+        buf, self.frame_buffer = self.frame_buffer, None
+        if buf is not None:
+            buf.close()
+            buf.unlink()
+
+    def _publish_capture(self, images, img_stats, preview=False):
+        # The frame buffer sequence follows in a 'preview' event once the
+        # downscaled copies are published
+        self.events.publish('capture', {'images': images, 'preview': preview})
+        self.events.publish('stats', img_stats)
 
-    def capture(self):
+    def _publish_preview(self, image_paths, img_stats, image_data=None):
+        """ Queue downscaled copies of the images for `frame_buffer`.
+
+        Images in `image_data` are handed over as they are, the others are
+        read from `image_paths` by `preview_publisher`, off the capture.
+        """
+        publisher = self.preview_publisher
+        if publisher is None:
+            return
+        if image_data is None:
+            image_data = [None] * len(image_paths)
+        frames = [path if data is None else data
+                  for path, data in zip(image_paths, image_data)]
+        publisher.submit(frames, img_stats)
+
+    def start_liveview(self, fps=None):
+        """ Continuously pull live-view frames from all cameras.
+
+        Parameters
+        ----------
+        fps : float
+            Frame-rate cap, defaults to `liveview_fps`
+
+        Raises
+        ------
+        RuntimeError
+            While a job is queued or running, it would share the cameras
+        """
+        if self._liveview_thread is None and self.job_queue.busy():
+            raise RuntimeError("Live view unavailable while jobs are running")
+        if fps is not None:
+            self.liveview_fps = fps
+        if self._liveview_thread is None:
+            self._liveview_stop.clear()
+            self._liveview_thread = threading.Thread(target=self._liveview)
+            self._liveview_thread.daemon = True
+            self._liveview_thread.start()
+            self.events.publish('liveview', {'running': True})
+            logger.info("Live View Started")
+
+    def stop_liveview(self):
+        if self._liveview_thread is not None:
+            self._liveview_stop.set()
+            self._liveview_thread.join()
+            self._liveview_thread = None
+            self.events.publish('liveview', {'running': False})
+            logger.info("Live View Stopped")
+
+    def get_live_frame(self, index):
+        """ Latest live-view frame of one camera.
+
+        Returns
+        -------
+        tuple : (sequence number, JPEG bytes or None)
+        """
+        return self.live_seq, self.live_frames[index]
+
+    def _liveview(self):
+        while not self._liveview_stop.is_set():
+            timer = time.time()
+            try:
+                self.live_frames = self.cam.capture_preview_frames()
+                self.live_seq += 1
+            except Exception as e:
+                logger.exception("Live View Failed")
+                logger.exception(e)
+                break
+            period = 1.0 / self.liveview_fps
+            self._liveview_stop.wait(max(0, period - (time.time() - timer)))
+
+        try:
+            self.cam.end_preview_frames()
+        except Exception as e:
+            logger.exception(e)
+
+    def capture(self, pipelined=False, target=None, on_stored=None):
+        """ Capture an image pair with the current pose.
+
+        When `pipelined` is set, this returns as soon as all exposures are
+        done and the transfer, stats and labels complete in the background
+        on `pipeline`; use `pipeline.join()` to wait for them, which raises
+        `pipeline.TransferError` for the pairs that failed.
+
+        The PTU is queried while the shutters fire, and this returns only
+        once that query is done, so the PTU may move on while the pair is
+        still being transferred. The IMU data is interpolated to the
+        exposure midpoint, see `_sample_pose`.
+
+        Parameters
+        ----------
+        pipelined : bool
+        target : tuple
+            Commanded (az, el) of the PTU, recorded in the labels
+        on_stored : callable
+            Called as `on_stored(saved_images)` once the pair is stored and
+            labeled, and with a staging area only once it is archived. Not
+            called if the capture fails
+
+        Returns
+        -------
+        list : paths of the saved images, None when pipelined or when the
+            capture failed
+
+        Raises
+        ------
+        OSError
+            When the staging area is full and the archive is failing, see
+            `StagingArea.wait_for_budget`
+        """
         try:
             file_path = self.session.get_folder_path()
             file_name = self.session.get_file_name()
@@ -56,75 +366,488 @@ class MAZE(object):
             logger.exception("Exception in Session")
             logger.exception(e)
 
+        storage_path = file_path
+        if self.staging is not None:
+            self.staging.wait_for_budget()
+            storage_path = self.staging.stage_path(file_path)
+
+        # The PTU holds still during the exposure, query it meanwhile
+        ptu_query = self.pose_pool.apply_async(self._read_ptu)
+        started = time.monotonic()
+
+        def finish(saved_images, img_stats):
+            ptu_angle, imu_data = self._sample_pose(ptu_query, img_stats)
+            with metrics.registry.timer('label'):
+                self._label_images(saved_images, img_stats, ptu_angle,
+                                   imu_data, target)
+            image_data = self.cam.image_data(saved_images)
+            if self.staging is not None:
+                staged = saved_images + [label.label_path(path)
+                                         for path in saved_images]
+                marker = os.path.join(file_path, file_name + '.flushed')
+                count = len(saved_images)
+                archived = None
+                if on_stored is not None:
+                    def report_archived(archive_paths):
+                        on_stored(archive_paths[:count])
+                    archived = report_archived
+                saved_images = self.staging.flush(
+                    staged, marker, archived)[:count]
+            self._publish_preview(saved_images, img_stats, image_data)
+            self._record_checksums(saved_images, img_stats)
+            metrics.registry.increment('pairs_captured')
+            latency = time.monotonic() - started
+            metrics.registry.observe('pair', latency)
+            self.pair_latency.append(latency)
+            logger.info("Captured Image Pair: {}".format(saved_images))
+            self.last_images = saved_images
+            self.img_stats = img_stats
+            self._publish_capture(saved_images, img_stats)
+            if on_stored is not None and self.staging is None:
+                on_stored(saved_images)
+
+        if pipelined:
+            try:
+                self.pipeline.submit(storage_path, file_name, callback=finish)
+            except Exception as e:
+                metrics.registry.increment('capture_errors')
+                logger.exception("Capture Failed")
+                logger.exception(e)
+            ptu_query.wait()
+            self.session.image_count(inc=True)
+            return None
+
+        try:
+            saved_images, img_stats = self.cam.capture_images(storage_path, file_name)
+        except Exception as e:
+            metrics.registry.increment('capture_errors')
+            logger.exception("Capture Failed")
+            logger.exception(e)
+            # Don't reuse the file name of a partially written pair
+            self.session.image_count(inc=True)
+            ptu_query.wait()
+            return None
+
+        self.session.image_count(inc=True)
+        finish(saved_images, img_stats)
+
+        return self.last_images
+
+    def _read_ptu(self):
+        """ PTU angle and the monotonic time in the middle of the query."""
+        with metrics.registry.timer('ptu_read'):
+            start = time.monotonic()
+            angle = self.ptu.get_angle()
+            return angle, (start + time.monotonic()) / 2.0
+
+    @staticmethod
+    def _exposure_midpoint(img_stats):
+        """ Monotonic time in the middle of the exposures of a pair.
+
+        Each exposure is taken to start at its trigger and last the
+        shutter speed of the image; without a shutter speed the middle of
+        the trigger call is used.
+        """
+        midpoints = []
+        for stats in img_stats:
+            if 'trigger_start' not in stats:
+                continue
+            try:
+                exposure = float(Fraction(stats['shutterspeed'].split()[0]))
+                midpoints.append(stats['trigger_start'] + exposure / 2.0)
+            except (KeyError, ValueError, ZeroDivisionError):
+                midpoints.append(
+                    (stats['trigger_start'] + stats['trigger_end']) / 2.0)
+        if not midpoints:
+            return None
+        return sum(midpoints) / len(midpoints)
+
+    def _sample_pose(self, ptu_query, img_stats):
+        """ PTU angle and IMU data of a pair, with the IMU data interpolated
+        to the exposure midpoint. The sample times are added to the stats.
+        """
+        ptu_angle = ptu_time = imu_data = imu_offset = None
+        midpoint = self._exposure_midpoint(img_stats)
         try:
-            imu_data = self.imu.getData()
-            ptu_angle = self.ptu.get_angle()
+            ptu_angle, ptu_time = ptu_query.get()
+            with metrics.registry.timer('imu_read'):
+                if midpoint is None:
+                    imu_data = dict(self.imu.getData())
+                else:
+                    imu_data, imu_offset = self.imu.sample_at(midpoint)
         except Exception as e:
             logger.exception("IMU/PTU Data Failed")
             logger.exception(e)
+        if imu_offset is not None:
+            metrics.registry.observe('imu_offset', imu_offset)
+        for stats in img_stats:
+            stats['pose_time'] = midpoint
+            stats['ptu_time'] = ptu_time
+            stats['imu_offset'] = imu_offset
+        return ptu_angle, imu_data
 
+    def _record_checksums(self, saved_images, img_stats):
         try:
-            saved_images, img_stats = self.cam.capture_images(file_path, file_name)
+            for image_path, stats in zip(saved_images, img_stats):
+                self.session.add_manifest_entry(
+                    image_path, stats['checksum'], stats['checksum_type'])
         except Exception as e:
-            logger.exception("Capture Failed")
+            logger.exception("Manifest Update Failed")
             logger.exception(e)
 
+    def _label_images(self, saved_images, img_stats, ptu_angle, imu_data,
+                      target=None):
         try:
-            for image_path, camera_name in zip(saved_images, ('Left','Right')):
-                label.create_label(image_path, camera_name, ptu_angle, imu_data)
+            camera_names = [name.capitalize() for name in self.cam.rig.names]
+            for image_path, stats, camera_name in zip(
+                    saved_images, img_stats, camera_names):
+                label.create_label(image_path, camera_name, ptu_angle,
+                                   imu_data, stats=stats, target=target)
         except Exception as e:
             logger.exception("Capture Failed")
             logger.exception(e)
 
-        self.session.image_count(inc=True)
+    def plan_mosaic(self, az_range, el_range, overlap=0.2):
+        """ Mosaic positions covering an az/el extent.
+
+        The spacing follows from the camera field of view in the camera
+        model, see `planner.grid_positions`.
+
+        Returns
+        -------
+        array : (x, 2) array of (az, el), ready for `mosaic`
+        """
+        return planner.grid_positions(az_range, el_range,
+                                      self.camera_fov, overlap)
+
+    def mosaic(self, positions, pipelined=True, optimize=True, task=None):
+        """ Capture a mosiac based on the positions provided.
 
-        logger.info("Captured Image Pair: {}".format(saved_images))
+        With `pipelined` set, the PTU slews to the next position as soon as
+        the exposures are done, while the previous pair is still being
+        transferred, analyzed and labeled. With `optimize` set, the
+        positions are reordered to minimize the slew time, see
+        `planner.plan_mosaic`.
 
-        self.last_images = saved_images
-        self.img_stats = img_stats
+        The visit order is saved as a job before the first slew, so an
+        interrupted mosaic can be finished with `resume`. `task` is set
+        when run from `job_queue`, see `submit_job`.
 
-        return saved_images
+        Returns
+        -------
+        dict : job id and visit order with estimated and actual slew time
+            and duration in seconds
+        """
+        if optimize:
+            positions, estimated_slew = planner.plan_mosaic(
+                positions, self.slew_model)
+        else:
+            positions = [(float(az), float(el)) for az, el in positions]
+            estimated_slew = self.slew_model.path_time(positions)
+        job = jobs.JobJournal.create(
+            self.jobs_path, 'mosaic', positions,
+            {'pipelined': pipelined, 'estimated_slew': estimated_slew})
+        return self._run_mosaic(job, task)
 
-    def mosaic(self, positions):
-        """ Capture a mosiac based on the positions provided."""
-        file_name_count = 1
+    def _run_mosaic(self, job, task=None):
+        remaining = job.remaining()
+        if task is not None:
+            task.total = len(remaining)
+        positions = [tuple(pos) for index, pos in remaining]
+        estimated_slew = self.slew_model.path_time(positions)
+        estimated_duration = None
+        if self.pair_latency:
+            pair_time = sum(self.pair_latency) / len(self.pair_latency)
+            estimated_duration = estimated_slew + pair_time * len(positions)
 
         # Move to the origin (0,0)
-        self.ptu.slew_to_angle((0, 0))
+        self.point((0, 0))
 
-        for pos in positions:
+        timer = time.time()
+        actual_slew = 0.0
+        errors = len(self.pipeline.errors)
+        for index, pos in remaining:
+            if task is not None and task.cancelled:
+                logger.info('Mosaic Cancelled')
+                break
+            pos = tuple(pos)
             # point camera
+            slew_timer = time.time()
             self.point(pos)
-            filename = str(file_name_count).zfill(5)
+            actual_slew += time.time() - slew_timer
             logger.info('Current Position:- Az: {}, El: {}, '
-                        'Current File:- {}'.format(pos[0], pos[1], filename))
+                        'Position {}/{}'.format(pos[0], pos[1], index + 1,
+                                                len(job.steps)))
             # capture image
-            self.capture()
-            file_name_count += 1
+            with metrics.registry.timer('capture'):
+                self.capture(pipelined=job.params['pipelined'], target=pos,
+                             on_stored=self._step_done(job, index, task))
+
+        unarchived = self._join_capture(raise_errors=False)
+
+        report = {'job_id': job.job_id,
+                  'positions': positions,
+                  'estimated_slew': estimated_slew,
+                  'actual_slew': actual_slew,
+                  'estimated_duration': estimated_duration,
+                  'actual_duration': time.time() - timer,
+                  'transfer_errors': len(self.pipeline.errors) - errors,
+                  'unarchived': len(unarchived),
+                  'remaining': len(job.remaining())}
+        logger.info('Mosaic took {:.1f} seconds (estimate: {}), slewing '
+                    '{:.1f} seconds (estimate: {:.1f})'.format(
+                        report['actual_duration'], estimated_duration,
+                        actual_slew, estimated_slew))
+        return report
+
+    def bulk(self, count, pipelined=False, task=None):
+        """ Take `count` image pairs at the current PTU direction.
 
-    def bulk(self, count):
+        Saved as a job like `mosaic`, see `resume`.
+
+        Returns
+        -------
+        dict : job id and number of pairs still to capture
+        """
+        job = jobs.JobJournal.create(self.jobs_path, 'bulk', range(count),
+                                     {'pipelined': pipelined})
+        return self._run_bulk(job, task)
+
+    def _run_bulk(self, job, task=None):
+        remaining = job.remaining()
+        if task is not None:
+            task.total = len(remaining)
+        errors = len(self.pipeline.errors)
         # take  a bunch of pictures
-        for x in range(1, count+1):
-            self.capture()
-            logger.info('Bulk Capture Progress: {}/{}'.format(x, count))
+        for index, step in remaining:
+            if task is not None and task.cancelled:
+                logger.info('Bulk Capture Cancelled')
+                break
+            with metrics.registry.timer('capture'):
+                self.capture(pipelined=job.params['pipelined'],
+                             on_stored=self._step_done(job, index, task))
+            logger.info('Bulk Capture Progress: {}/{}'.format(
+                index + 1, len(job.steps)))
+
+        unarchived = self._join_capture(raise_errors=False)
+        return {'job_id': job.job_id, 'unarchived': len(unarchived),
+                'transfer_errors': len(self.pipeline.errors) - errors,
+                'remaining': len(job.remaining())}
+
+    def _join_capture(self, raise_errors=True):
+        """ Wait until the captured pairs are stored, and archived when
+        staged, so that their `on_stored` callbacks have run.
+
+        Parameters
+        ----------
+        raise_errors : bool
+            Raise the failed pipelined transfers, otherwise only log them,
+            e.g. for jobs that count them in their report
+
+        Returns
+        -------
+        list : staged files the archive could not take, see
+            `StagingArea.join`
+
+        Raises
+        ------
+        pipeline.TransferError
+            When pipelined transfers failed since the last join
+        """
+        error = None
+        try:
+            self.pipeline.join()
+        except pipeline.TransferError as e:
+            logger.error(str(e))
+            if raise_errors:
+                error = e
+        unarchived = []
+        if self.staging is not None:
+            unarchived = self.staging.join()
+        if unarchived:
+            logger.error("{} staged files not archived, kept in {}".format(
+                len(unarchived), self.staging.staging_root))
+        if error is not None:
+            raise error
+        return unarchived
+
+    @staticmethod
+    def _step_done(job, index, task=None):
+        """ Callback journaling a stored pair and reporting it to `task`.
+        Only called once the pair is durable, see `capture`."""
+        def on_stored(saved_images):
+            job.record(index, saved_images)
+            if task is not None:
+                task.add_result({'step': index, 'images': saved_images,
+                                 'target': job.steps[index]})
+        return on_stored
+
+    def unfinished_jobs(self):
+        """ Ids of mosaic and bulk jobs that did not complete."""
+        return jobs.JobJournal.unfinished(self.jobs_path)
+
+    def resume(self, job_id, task=None):
+        """ Capture the steps of an interrupted job that are not done yet,
+        e.g. after a crash or a reconnect.
+
+        Returns
+        -------
+        dict : report of `mosaic` or `bulk`
+        """
+        job = jobs.JobJournal.load(self.jobs_path, job_id)
+        logger.info('Resuming {} at {}/{} completed'.format(
+            job_id, len(job.completed), len(job.steps)))
+        if job.kind == 'mosaic':
+            return self._run_mosaic(job, task)
+        return self._run_bulk(job, task)
+
+    def interval(self, interval, count, pipelined=False, skip_missed=True,
+                 task=None):
+        """ Capture at a fixed cadence, e.g. for time-lapse.
+
+        Parameters
+        ----------
+        interval : float
+            Seconds between captures
+        count : int
+            Number of capture slots
+        skip_missed : bool
+            Skip slots that a slow capture overran instead of capturing late
+
+        Returns
+        -------
+        dict : slot and jitter report, see `scheduler.IntervalScheduler`
+        """
+        cadence = scheduler.IntervalScheduler(interval, skip_missed)
+        stop = None
+        on_stored = None
+        if task is not None:
+            task.total = count
+            stop = task.cancel_event
+
+            def report_stored(saved_images):
+                task.add_result({'images': saved_images})
+            on_stored = report_stored
+
+        def capture():
+            with metrics.registry.timer('capture'):
+                self.capture(pipelined=pipelined, on_stored=on_stored)
+
+        errors = len(self.pipeline.errors)
+        report = cadence.run(capture, count, stop)
+        self._join_capture(raise_errors=False)
+        report['transfer_errors'] = len(self.pipeline.errors) - errors
+        return report
+
+    def _capture_job(self, pipelined=False, target=None, task=None):
+        task.total = 1
+
+        def on_stored(saved_images):
+            task.add_result({'step': 0, 'images': saved_images,
+                             'target': target})
+
+        self.capture(pipelined=pipelined, target=target, on_stored=on_stored)
+        self._join_capture()
+        return self.last_images
+
+    def _preview_job(self, task=None):
+        task.total = 1
+        self.preview()
+        task.add_result({'step': 0, 'images': self.last_images,
+                         'target': None})
+        return self.last_images
+
+    def _point_job(self, angle, task=None):
+        task.total = 1
+        self.point(angle)
+        task.add_result({'step': 0, 'target': angle})
+        return angle
+
+    def _new_session_job(self, task=None):
+        return self.new_session()
+
+    def _reconnect_job(self, task=None):
+        return self.connect()
+
+    def submit_job(self, kind, *args, **kwargs):
+        """ Queue a capture job and return right away.
+
+        Parameters
+        ----------
+        kind : str
+            'capture', 'preview', 'mosaic', 'bulk', 'interval', 'resume',
+            'point', 'new_session' or 'reconnect', run with the arguments
+            of the method of that name
+
+        Jobs run one after the other, so a capture or preview queued
+        during a mosaic waits for it instead of sharing the cameras, and
+        a slew, new session or reconnect does not change the PTU, folder
+        or cameras under a running capture.
+
+        Returns
+        -------
+        int : job id for `job_status`, `job_results` and `cancel_job`
+        """
+        runners = {'capture': self._capture_job,
+                   'preview': self._preview_job,
+                   'mosaic': self.mosaic,
+                   'bulk': self.bulk,
+                   'interval': self.interval,
+                   'resume': self.resume,
+                   'point': self._point_job,
+                   'new_session': self._new_session_job,
+                   'reconnect': self._reconnect_job}
+        if kind not in runners:
+            raise ValueError("Unknown job kind: {}".format(kind))
+        return self.job_queue.submit(kind, runners[kind], *args, **kwargs)
+
+    def job_status(self, job_id=None):
+        """ Progress of one job, or of all known jobs if `job_id` is None."""
+        if job_id is None:
+            return self.job_queue.list()
+        return self.job_queue.get(job_id).progress()
+
+    def job_results(self, job_id, since=0, timeout=None):
+        """ Results of the steps of a job from index `since` on.
+
+        Waits up to `timeout` seconds for a new step, so clients can stream
+        results by calling again with `since` advanced.
+        """
+        return self.job_queue.get(job_id).results_since(since, timeout)
+
+    def cancel_job(self, job_id):
+        """ Cancel a queued job, or stop a running one after its current
+        capture. Cancelled mosaic and bulk jobs can still be resumed.
+        """
+        self.job_queue.cancel(job_id)
 
     def new_session(self):
         return self.session.new_session()
 
     def disconnect(self):
         if(self.connected):
+            self.stop_liveview()
+            for job in self.job_queue.list():
+                if job['status'] in ('queued', 'running'):
+                    self.job_queue.cancel(job['job_id'])
+            self.job_queue.join()
+            self._join_capture(raise_errors=False)
             self.cam.disconnect()
             self.imu.disconnect()
             self.ptu.stream.close()
             self.session.save()
+            self._close_frame_buffer()
             logger.info("Disconnected")
             self.connected = False
         else:
             logger.info("Already Disconnected")
 
 
-def main():
-    maze = MAZE()
+def main(simulate=None, in_memory=False, capture_mode='blocking',
+         camera_names=None, staging_path=None):
+    maze = MAZE(in_memory=in_memory, capture_mode=capture_mode,
+                camera_names=camera_names, staging_path=staging_path,
+                simulate=simulate)
     BaseManager.register('get_maze', callable=lambda: maze)
     manager = BaseManager(address=('', 50000), authkey=b'abc')
     server = manager.get_server()
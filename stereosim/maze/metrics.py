@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import threading
+import time
+from collections import deque
+
+
+class Histogram(object):
+    """
+    Latency histogram over the most recent samples
+
+    Attributes
+    ----------
+    count : int
+        Number of samples ever observed
+    max : float
+        Largest sample ever observed
+    """
+
+    def __init__(self, size=1024):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct):
+        """ Nearest-rank percentile of the retained samples."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        rank = int(round(pct / 100.0 * (len(ordered) - 1)))
+        return ordered[rank]
+
+    def snapshot(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'max': self.max if self.count else None}
+
+
+class MetricsRegistry(object):
+    """
+    Latency histograms and counters for the capture pipeline
+
+    Histograms are in seconds and keyed by phase name, e.g. 'trigger',
+    'transfer', 'stats', 'label', 'ptu_slew' and 'imu_read'.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """ Time the enclosed block into the `name` histogram."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start)
+
+    def snapshot(self):
+        """ Plain dict of all metrics, safe to send through the manager."""
+        with self._lock:
+            return {'histograms': {name: hist.snapshot() for name, hist
+                                   in self.histograms.items()},
+                    'counters': dict(self.counters)}
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+# Process wide registry used by the capture pipeline
+registry = MetricsRegistry()
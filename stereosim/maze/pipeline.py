@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import logging
+import queue
+import threading
+import time
+from stereosim.maze import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TransferError(Exception):
+    """ Pipelined transfers or callbacks failed since the last `join`.
+
+    Attributes
+    ----------
+    errors : list
+        The exceptions, the last one is also the `__cause__`
+    """
+
+    def __init__(self, errors):
+        super(TransferError, self).__init__(
+            "{} pipelined transfers failed, last: {!r}".format(
+                len(errors), errors[-1]))
+        self.errors = errors
+
+
+class CapturePipeline(object):
+    """
+    Pipelined capture engine
+
+    Triggers the next image pair while the previous pairs are still being
+    transferred off the cameras. At most `depth` pairs may be triggered but
+    not yet transferred; `submit` blocks until a slot frees up.
+
+    The camera object only needs `trigger_images()` and
+    `transfer_images(triggers, storage_path, filename_base)`, as
+    provided by `StereoCamera`. Callbacks run on a thread of their own so
+    that a slow callback does not hold up the next transfer.
+
+    Attributes
+    ----------
+    depth : int
+        Maximum number of image pairs in flight
+    errors : list
+        Exceptions raised by the transfer worker or a callback. Those not
+        reported yet are raised by the next `join` as `TransferError`.
+    """
+
+    def __init__(self, cam, depth=2):
+        self.cam = cam
+        self.depth = depth
+        self.errors = []
+        self._unreported = []
+        self._errors_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(depth)
+        self._queue = queue.Queue()
+        self._callbacks = queue.Queue()
+        self._thread = None
+        self._callback_thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._transfer_thread)
+            self._thread.daemon = True
+            self._thread.start()
+        if self._callback_thread is None:
+            self._callback_thread = threading.Thread(
+                target=self._run_callbacks)
+            self._callback_thread.daemon = True
+            self._callback_thread.start()
+
+    def submit(self, storage_path, filename_base, callback=None):
+        """ Trigger an image pair and queue it for transfer.
+
+        Parameters
+        ----------
+        storage_path : str
+            Location where the files will be stored
+        filename_base : str
+        callback : callable
+            Called as `callback(saved_images, img_stats)` from the
+            callback thread once the pair is stored
+
+        Returns
+        -------
+        Array : trigger results of the image pair
+        """
+        self.start()
+        timer = time.time()
+        self._slots.acquire()  # backpressure, wait for a free slot
+        logger.debug("Waited {:f} seconds for a pipeline slot.".format(
+            time.time() - timer))
+        try:
+            triggers = self.cam.trigger_images()
+        except Exception:
+            self._slots.release()
+            raise
+        self._queue.put((triggers, storage_path, filename_base,
+                         callback))
+        return triggers
+
+    def _transfer_thread(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                break
+            triggers, storage_path, filename_base, callback = job
+            try:
+                saved_images, img_stats = self.cam.transfer_images(
+                    triggers, storage_path, filename_base)
+                if callback is not None:
+                    self._callbacks.put((callback, saved_images, img_stats))
+            except Exception as e:
+                logger.exception("Pipelined Transfer Failed")
+                metrics.registry.increment('transfer_errors')
+                self._add_error(e)
+            finally:
+                # The slot only covers the cameras, free it before the
+                # callback runs
+                self._slots.release()
+                self._queue.task_done()
+
+    def _run_callbacks(self):
+        while True:
+            job = self._callbacks.get()
+            if job is None:
+                self._callbacks.task_done()
+                break
+            callback, saved_images, img_stats = job
+            try:
+                callback(saved_images, img_stats)
+            except Exception as e:
+                logger.exception("Pipelined Callback Failed")
+                self._add_error(e)
+            finally:
+                self._callbacks.task_done()
+
+    def _add_error(self, error):
+        with self._errors_lock:
+            self.errors.append(error)
+            self._unreported.append(error)
+
+    def join(self):
+        """ Block until every submitted pair has been transferred and its
+        callback has returned.
+
+        Raises
+        ------
+        TransferError
+            When transfers or callbacks failed since the last `join`
+        """
+        self._queue.join()
+        self._callbacks.join()
+        with self._errors_lock:
+            errors, self._unreported = self._unreported, []
+        if errors:
+            raise TransferError(errors) from errors[-1]
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._callback_thread is not None:
+            self._callbacks.put(None)
+            self._callback_thread.join()
+            self._callback_thread = None
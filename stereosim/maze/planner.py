@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""Mosaic planning for the pan-tilt unit"""
+import logging
+import math
+import os
+import time
+import numpy as np
+import yaml
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'scripts',
+                          'stereosim_model_v1.yml')
+
+# Factory settings of the PTU per (pan, tilt) axis: seconds arc per
+# position, speed in positions/sec and acceleration in positions/sec^2
+PTU_RESOLUTION = (92.5714, 46.2857)
+PTU_SPEED = (2000, 2000)
+PTU_ACCEL = (2000, 2000)
+
+
+class SlewModel(object):
+    """
+    Slew time model of the PTU
+
+    Each axis follows a trapezoidal velocity profile and both axes move at
+    the same time, so a slew takes as long as its slowest axis. The limits
+    default to the factory settings of the PTU; `from_ptu` takes the ones
+    read from the unit, and `observe` learns `settle` from measured slews.
+
+    Attributes
+    ----------
+    speed : tuple
+        (pan, tilt) top speed in degrees per second
+    accel : tuple
+        (pan, tilt) acceleration in degrees per second squared
+    settle : float
+        Fixed time in seconds added to every slew
+    """
+
+    def __init__(self, speed=None, accel=None, settle=0.0):
+        if speed is None:
+            speed = self.degrees(PTU_SPEED, PTU_RESOLUTION)
+        if accel is None:
+            accel = self.degrees(PTU_ACCEL, PTU_RESOLUTION)
+        self.speed = speed
+        self.accel = accel
+        self.settle = settle
+        self._overhead = 0.0
+        self._observed = 0
+
+    @staticmethod
+    def degrees(positions, resolution):
+        """ Per axis values in PTU positions to degrees, with the
+        `resolution` in seconds arc per position."""
+        return tuple(value * res / 3600.0
+                     for value, res in zip(positions, resolution))
+
+    @classmethod
+    def from_ptu(cls, speed, accel, resolution, settle=0.0):
+        """ Model of a PTU with the (pan, tilt) `speed`, `accel` and
+        `resolution` it reports, in positions/sec, positions/sec^2 and
+        seconds arc per position."""
+        return cls(cls.degrees(speed, resolution),
+                   cls.degrees(accel, resolution), settle)
+
+    def observe(self, start, end, seconds):
+        """ Update `settle` from a measured slew.
+
+        `settle` becomes the mean time the measured slews took on top of
+        the modeled axis motion, e.g. for the command round trips and
+        position polling of the driver.
+        """
+        if tuple(start) == tuple(end):
+            return
+        motion = self.slew_time(start, end) - self.settle
+        self._overhead += seconds - motion
+        self._observed += 1
+        self.settle = max(0.0, self._overhead / self._observed)
+
+    @staticmethod
+    def axis_time(distance, speed, accel):
+        distance = abs(distance)
+        if distance == 0:
+            return 0.0
+        if distance < speed ** 2 / accel:
+            # Never reaches top speed
+            return 2 * math.sqrt(distance / accel)
+        return distance / speed + speed / accel
+
+    def slew_time(self, start, end):
+        """ Seconds to slew from `start` to `end`, both (az, el)."""
+        if tuple(start) == tuple(end):
+            return 0.0
+        return self.settle + max(
+            self.axis_time(end[axis] - start[axis], self.speed[axis],
+                           self.accel[axis]) for axis in (0, 1))
+
+    def path_time(self, positions, start=(0, 0)):
+        """ Total slew time to visit `positions` in order from `start`."""
+        total = 0.0
+        for pos in positions:
+            total += self.slew_time(start, pos)
+            start = pos
+        return total
+
+
+def serpentine_order(positions):
+    """ Order positions row by row in elevation, alternating the azimuth
+    direction on every row.
+    """
+    rows = {}
+    for pos in positions:
+        rows.setdefault(pos[1], []).append(pos)
+    ordered = []
+    for idx, el in enumerate(sorted(rows, reverse=True)):
+        ordered.extend(sorted(rows[el], key=lambda pos: pos[0],
+                              reverse=idx % 2 == 1))
+    return ordered
+
+
+def _nearest(path, model, count):
+    """ Indices of the `count` positions of `path` (not the start at index
+    0) closest to each position, by the time of its slower axis at top
+    speed.
+    """
+    coords = np.array(path, dtype=float)
+    rates = 1.0 / np.array(model.speed, dtype=float)
+    count = min(count, len(path) - 2)
+    nearest = []
+    for idx, pos in enumerate(coords):
+        cost = np.max(np.abs(coords[1:] - pos) * rates, axis=1)
+        if idx > 0:
+            cost[idx - 1] = np.inf
+        nearest.append(np.argpartition(cost, count)[:count] + 1
+                       if count < len(cost) else np.argsort(cost) + 1)
+    return nearest
+
+
+def improve_order(positions, model, start=(0, 0), neighbours=10,
+                  time_budget=2.0):
+    """ 2-opt improvement of an open path that starts at `start`.
+
+    Segments of the visit order are reversed as long as that shortens the
+    total slew time. Only reversals joining a position to one of its
+    `neighbours` closest positions are tried, and the search stops with the
+    best order so far after `time_budget` seconds.
+    """
+    path = [tuple(start)] + [tuple(pos) for pos in positions]
+    if len(path) < 4:
+        return path[1:]
+    deadline = time.monotonic() + time_budget
+    nearest = _nearest(path, model, neighbours)
+    # Node ids are indices into `path`, the visit order is kept in `order`
+    order = list(range(len(path)))
+    where = list(range(len(path)))
+
+    def slew(a, b):
+        return model.slew_time(path[a], path[b])
+
+    def try_reverse(i, j):
+        """ Reverse order[i:j + 1] if that shortens the path."""
+        before = slew(order[i - 1], order[i])
+        after = slew(order[i - 1], order[j])
+        if j + 1 < len(order):
+            before += slew(order[j], order[j + 1])
+            after += slew(order[i], order[j + 1])
+        if after < before - 1e-9:
+            order[i:j + 1] = reversed(order[i:j + 1])
+            for k in range(i, j + 1):
+                where[order[k]] = k
+            return True
+        return False
+
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(1, len(order) - 1):
+            for node in nearest[order[i - 1]]:
+                # Join order[i - 1] and `node` next to each other
+                j = where[node]
+                if j > i:
+                    improved |= try_reverse(i, j)
+                elif j < i - 1:
+                    improved |= try_reverse(j + 1, i - 1)
+            if time.monotonic() > deadline:
+                logger.debug("Mosaic planning stopped at the time budget")
+                break
+    return [path[node] for node in order[1:]]
+
+
+def plan_mosaic(positions, model=None, start=(0, 0)):
+    """ Reorder mosaic positions to minimize the total slew time.
+
+    Parameters
+    ----------
+    positions : array
+        (az, el) positions in any order
+    model : SlewModel
+    start : tuple
+        (az, el) the PTU starts from
+
+    Returns
+    -------
+    tuple : (ordered positions, estimated slew time in seconds)
+    """
+    if model is None:
+        model = SlewModel()
+    positions = [(float(az), float(el)) for az, el in positions]
+    serpentine = serpentine_order(positions)
+    if positions == serpentine:
+        # A grid from `grid_positions`, near optimal already
+        return positions, model.path_time(positions, start)
+    candidates = [positions, serpentine]
+    candidates = [improve_order(order, model, start) for order in candidates]
+    best = min(candidates, key=lambda order: model.path_time(order, start))
+    estimate = model.path_time(best, start)
+    logger.debug("Mosaic slew estimate: {:f} seconds, as given: {:f}".format(
+        estimate, model.path_time(positions, start)))
+    return best, estimate
+
+
+def camera_fov(model_path=MODEL_FILE):
+    """ Field of view of the cameras from the photogrammetric model.
+
+    Parameters
+    ----------
+    model_path : str
+        Camera model as used by `CAHVmodel`, with focal length `f` and
+        `pixelsize` in mm and `image_size` as [lines, samples]
+
+    Returns
+    -------
+    tuple : (horizontal, vertical) field of view in degrees
+    """
+    with open(model_path, 'r') as fp:
+        model = yaml.safe_load(fp)
+    lines, samples = model['image_size']
+    size = np.array([samples, lines]) * model['pixelsize']
+    fov = np.degrees(2 * np.arctan(size / (2.0 * model['f'])))
+    return float(fov[0]), float(fov[1])
+
+
+def _centers(low, high, fov, step):
+    """ Evenly spaced frame centers covering [low, high] with at most
+    `step` between them. Works on arrays of fields of view.
+
+    Returns
+    -------
+    tuple : (number of centers, first center, spacing)
+    """
+    extent = high - low
+    count = np.maximum(np.ceil((extent - fov) / step), 0).astype(int) + 1
+    start = np.where(extent > fov, low + fov / 2.0, low + extent / 2.0)
+    spacing = np.maximum(extent - fov, 0) / np.maximum(count - 1, 1)
+    return count, start, spacing
+
+
+def grid_positions(az_range, el_range, fov=None, overlap=0.2):
+    """ Mosaic positions covering an az/el extent with a given overlap.
+
+    Rows closer to the zenith or nadir need fewer frames in azimuth, as a
+    frame covers `fov / cos(el)` degrees of azimuth there.
+
+    Parameters
+    ----------
+    az_range : tuple
+        (min, max) azimuth in degrees to cover
+    el_range : tuple
+        (min, max) elevation in degrees to cover
+    fov : tuple
+        (horizontal, vertical) field of view in degrees, defaults to
+        `camera_fov()`
+    overlap : float
+        Minimum overlap between neighbouring frames, 0 to 1
+
+    Returns
+    -------
+    array : (x, 2) array of (az, el) in serpentine order, top row first
+    """
+    if fov is None:
+        fov = camera_fov()
+    fov_az, fov_el = fov
+    el_count, el_start, el_step = _centers(
+        el_range[0], el_range[1], fov_el, fov_el * (1 - overlap))
+    els = el_start + el_step * np.arange(el_count)
+
+    # Azimuth footprint of each row, using its edge closest to the horizon
+    edge = np.clip(np.abs(els) - fov_el / 2.0, 0, 89.0)
+    row_fov = np.minimum(fov_az / np.cos(np.radians(edge)), 360.0)
+    az_count, az_start, az_step = _centers(
+        az_range[0], az_range[1], row_fov, row_fov * (1 - overlap))
+
+    rows = []
+    for idx in np.argsort(-els):
+        azs = az_start[idx] + az_step[idx] * np.arange(az_count[idx])
+        if len(rows) % 2 == 1:
+            azs = azs[::-1]
+        rows.append(np.column_stack((azs, np.full(len(azs), els[idx]))))
+    return np.round(np.concatenate(rows), 3)
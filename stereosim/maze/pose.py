@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Time-stamped sensor samples interpolated to capture time"""
+import bisect
+import collections
+import math
+import numbers
+import threading
+
+
+def nlerp(q0, q1, fraction):
+    """ Normalized linear interpolation of two quaternions.
+
+    Takes the shorter way round, as q and -q are the same rotation.
+    """
+    if sum(a * b for a, b in zip(q0, q1)) < 0:
+        q1 = [-b for b in q1]
+    q = [a + (b - a) * fraction for a, b in zip(q0, q1)]
+    norm = math.sqrt(sum(c * c for c in q))
+    if norm == 0:
+        return list(q0)
+    return [c / norm for c in q]
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def interpolate(sample0, sample1, fraction, quaternion_keys=('quat',)):
+    """ Interpolate two samples of the same sensor.
+
+    Numbers and lists of numbers are interpolated linearly, quaternions
+    with `nlerp`. Anything else is taken from the nearer sample.
+    """
+    nearest = sample0 if fraction < 0.5 else sample1
+    sample = dict(nearest)
+    for key, v0 in sample0.items():
+        v1 = sample1.get(key)
+        if key in quaternion_keys and isinstance(v0, list) and \
+                isinstance(v1, list) and len(v0) == len(v1) == 4:
+            sample[key] = nlerp(v0, v1, fraction)
+        elif _is_number(v0) and _is_number(v1):
+            sample[key] = v0 + (v1 - v0) * fraction
+        elif isinstance(v0, list) and isinstance(v1, list) and \
+                len(v0) == len(v1) and \
+                all(_is_number(v) for v in v0 + v1):
+            sample[key] = [a + (b - a) * fraction for a, b in zip(v0, v1)]
+    return sample
+
+
+class SampleHistory(object):
+    """
+    Recent samples of a sensor stamped with `time.monotonic()`
+
+    Attributes
+    ----------
+    maxlen : int
+        Number of samples kept
+    """
+
+    def __init__(self, maxlen=1000):
+        self.maxlen = maxlen
+        self._times = collections.deque(maxlen=maxlen)
+        self._samples = collections.deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._times)
+
+    def append(self, timestamp, sample):
+        with self._lock:
+            if self._times and timestamp < self._times[-1]:
+                return
+            self._times.append(timestamp)
+            self._samples.append(sample)
+
+    def at(self, timestamp):
+        """ Sample interpolated to `timestamp`.
+
+        Outside the recorded span the nearest sample is returned.
+
+        Returns
+        -------
+        tuple : (sample dict or None if empty, seconds to the nearest
+            recorded sample)
+        """
+        with self._lock:
+            times = list(self._times)
+            samples = list(self._samples)
+        if not times:
+            return None, None
+        idx = bisect.bisect_left(times, timestamp)
+        if idx == 0:
+            return dict(samples[0]), times[0] - timestamp
+        if idx == len(times):
+            return dict(samples[-1]), timestamp - times[-1]
+        t0, t1 = times[idx - 1], times[idx]
+        offset = min(timestamp - t0, t1 - timestamp)
+        if t1 == t0:
+            return dict(samples[idx]), offset
+        fraction = (timestamp - t0) / (t1 - t0)
+        return interpolate(samples[idx - 1], samples[idx], fraction), offset
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IntervalScheduler(object):
+    """
+    Fixed cadence scheduler
+
+    Slot `k` is due at `start + k * interval` on the monotonic clock, so
+    the cadence does not drift however long each action takes. A slot
+    whose deadline has already passed by a full interval when the previous
+    action returns is missed: skipped if `skip_missed` is set, run late and
+    flagged otherwise.
+
+    Attributes
+    ----------
+    interval : float
+        Seconds between slots
+    skip_missed : bool
+    sleep : callable
+        Waits a number of seconds. By default `stop.wait` when `run` is
+        given a stop event, so setting it ends the wait, else `time.sleep`
+    """
+
+    def __init__(self, interval, skip_missed=True, clock=time.monotonic,
+                 sleep=None):
+        self.interval = interval
+        self.skip_missed = skip_missed
+        self.clock = clock
+        self.sleep = sleep
+
+    def run(self, action, count, stop=None):
+        """ Run `action()` once per slot for `count` slots.
+
+        Parameters
+        ----------
+        action : callable
+        count : int
+            Number of slots
+        stop : threading.Event
+            Ends the run early when set
+
+        Returns
+        -------
+        dict : executed, missed and late slots and the start jitter in
+            seconds (mean, standard deviation, max)
+        """
+        start = self.clock()
+        jitter = []
+        missed = []
+        late = []
+        slot = 0
+        while slot < count:
+            if stop is not None and stop.is_set():
+                break
+            deadline = start + slot * self.interval
+            now = self.clock()
+            if now < deadline:
+                if self.sleep is not None:
+                    self.sleep(deadline - now)
+                elif stop is not None:
+                    if stop.wait(deadline - now):
+                        break
+                else:
+                    time.sleep(deadline - now)
+                now = self.clock()
+            elif now - deadline >= self.interval:
+                if self.skip_missed:
+                    # Resume at the next slot that is still ahead
+                    next_slot = min(count, slot + int(math.ceil(
+                        (now - deadline) / self.interval)))
+                    missed.extend(range(slot, next_slot))
+                    logger.warning("Missed slots {} to {}".format(
+                        slot, next_slot - 1))
+                    slot = next_slot
+                    continue
+                late.append(slot)
+            jitter.append(now - deadline)
+            try:
+                action()
+            except Exception as e:
+                logger.exception("Scheduled Action Failed")
+                logger.exception(e)
+            slot += 1
+
+        return self._report(jitter, missed, late)
+
+    def _report(self, jitter, missed, late):
+        report = {'executed': len(jitter),
+                  'missed': missed,
+                  'late': late,
+                  'jitter_mean': None,
+                  'jitter_std': None,
+                  'jitter_max': None}
+        if jitter:
+            mean = sum(jitter) / len(jitter)
+            report['jitter_mean'] = mean
+            report['jitter_std'] = math.sqrt(
+                sum((value - mean) ** 2 for value in jitter) / len(jitter))
+            report['jitter_max'] = max(jitter)
+        logger.info("Interval run: {} executed, {} missed, {} late, "
+                    "max jitter {}".format(report['executed'], len(missed),
+                                           len(late), report['jitter_max']))
+        return report
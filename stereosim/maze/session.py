@@ -83,6 +83,19 @@ class Session:
         self.save()
         return no
 
+    def add_manifest_entry(self, file_path, checksum, checksum_type='sha256'):
+        """ Record a file checksum in the session manifest.
+
+        The manifest is `MANIFEST.<checksum_type>` in the session folder,
+        in the format used by `sha256sum -c`.
+        """
+        folder = self.get_folder_path()
+        manifest_path = os.path.join(
+            folder, 'MANIFEST.{}'.format(checksum_type))
+        with open(manifest_path, 'a') as f:
+            f.write('{}  {}\n'.format(checksum,
+                                      os.path.relpath(file_path, folder)))
+
     def save(self):
         with open(self.config_file_path, 'w') as f:
             self.config.write(f)
\ No newline at end of file
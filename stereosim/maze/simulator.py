@@ -0,0 +1,934 @@
+# -*- coding: utf-8 -*-
+"""Simulated hardware for running MAZE without the rig
+
+`SimulatedGPhoto2` stands in for the gphoto2 module and produces JPEGs
+with EXIF, `PTUEmulator` serves the FLIR PTU ASCII protocol over TCP and
+`IMUEmulator` streams JSON lines on a pseudo-terminal. Each device follows
+a `Profile` of latencies, bandwidth and injected failures.
+"""
+import copy
+import json
+import logging
+import math
+import os
+import pty
+import random
+import re
+import socketserver
+import struct
+import threading
+import time
+import tty
+from collections import namedtuple
+from fractions import Fraction
+import yaml
+from stereosim.maze import planner
+
+logger = logging.getLogger(__name__)
+
+# Per device settings of the built-in profiles, see `Profile`
+PROFILES = {
+    'ideal': {},
+    'usb2': {
+        'camera': {'command_latency': 0.01, 'jitter': 0.005,
+                   'bandwidth': 30e6, 'capture_latency': 0.25,
+                   'image_size': 12 * 1024 ** 2},
+        'ptu': {'command_latency': 0.005},
+    },
+    'field': {
+        'camera': {'command_latency': 0.02, 'jitter': 0.02,
+                   'bandwidth': 20e6, 'capture_latency': 0.4,
+                   'image_size': 20 * 1024 ** 2, 'failure_rate': 0.01,
+                   'drop_rate': 0.002},
+        'ptu': {'command_latency': 0.01, 'jitter': 0.01},
+        'imu': {'failure_rate': 0.01},
+    },
+}
+
+
+class Profile(object):
+    """
+    Timing and failure behaviour of a simulated device
+
+    Attributes
+    ----------
+    command_latency : float
+        Seconds added to every command
+    jitter : float
+        Up to this many seconds are randomly added to every command
+    bandwidth : float
+        Bytes per second of data transfers, None for unlimited
+    capture_latency : float
+        Seconds from trigger to file on the card, on top of the exposure
+    image_size : int
+        Bytes of a full size image
+    preview_size : int
+        Bytes of a live-view frame
+    failure_rate : float
+        Probability of an I/O error per command
+    drop_rate : float
+        Probability of the device dropping off the bus per capture
+    """
+
+    def __init__(self, command_latency=0.0, jitter=0.0, bandwidth=None,
+                 capture_latency=0.0, image_size=1024 ** 2,
+                 preview_size=64 * 1024, failure_rate=0.0, drop_rate=0.0,
+                 seed=None):
+        self.command_latency = command_latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.capture_latency = capture_latency
+        self.image_size = int(image_size)
+        self.preview_size = int(preview_size)
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+
+    @classmethod
+    def load(cls, profile=None):
+        """ Profile from a dict of its attributes, or the default one."""
+        if isinstance(profile, cls):
+            return profile
+        return cls(**(profile or {}))
+
+    def delay(self, nbytes=0):
+        """ Seconds a command transferring `nbytes` takes."""
+        delay = self.command_latency
+        if self.jitter:
+            delay += self.jitter * self.random.random()
+        if self.bandwidth and nbytes:
+            delay += nbytes / float(self.bandwidth)
+        return delay
+
+    def wait(self, nbytes=0):
+        delay = self.delay(nbytes)
+        if delay > 0:
+            time.sleep(delay)
+
+    def fails(self, rate=None):
+        """ Whether to inject a failure now."""
+        rate = self.failure_rate if rate is None else rate
+        return rate > 0 and self.random.random() < rate
+
+
+def load_profiles(profile=None):
+    """ Per device profiles from a built-in profile name, a YAML file or a
+    dict with 'camera', 'ptu' and 'imu' sections.
+
+    Returns
+    -------
+    dict : device name to `Profile`
+    """
+    if profile is None:
+        profile = 'ideal'
+    if isinstance(profile, str):
+        if profile in PROFILES:
+            profile = PROFILES[profile]
+        else:
+            with open(profile) as f:
+                profile = yaml.safe_load(f) or {}
+    return {device: Profile.load(profile.get(device))
+            for device in ('camera', 'ptu', 'imu')}
+
+
+# EXIF / JPEG generation
+
+_EXIF_TYPES = {'ascii': 2, 'short': 3, 'long': 4, 'rational': 5}
+
+
+def _tiff_value(kind, value):
+    if kind == 'ascii':
+        return value.encode('ascii') + b'\x00', len(value) + 1
+    if kind == 'short':
+        return struct.pack('<H', value), 1
+    if kind == 'long':
+        return struct.pack('<L', value), 1
+    value = Fraction(value).limit_denominator(100000)
+    return struct.pack('<LL', value.numerator, value.denominator), 1
+
+
+def _tiff_ifd(entries, start):
+    """ Little-endian IFD at TIFF offset `start`, with its data after it.
+
+    Parameters
+    ----------
+    entries : list
+        (tag, kind, value) with kind one of `_EXIF_TYPES`
+    """
+    entries = sorted(entries)
+    data_offset = start + 2 + 12 * len(entries) + 4
+    table = struct.pack('<H', len(entries))
+    data = b''
+    for tag, kind, value in entries:
+        raw, count = _tiff_value(kind, value)
+        table += struct.pack('<HHL', tag, _EXIF_TYPES[kind], count)
+        if len(raw) <= 4:
+            table += raw.ljust(4, b'\x00')
+        else:
+            table += struct.pack('<L', data_offset + len(data))
+            data += raw + b'\x00' * (len(raw) % 2)
+    return table + struct.pack('<L', 0) + data
+
+
+def make_exif(model, focal_length, exposure_time, f_number, iso,
+              date_time_original):
+    """ EXIF APP1 payload with the tags read by `exif.read_exif`."""
+    ifd0 = [(0x0110, 'ascii', model), (0x8769, 'long', 0)]
+    exif_offset = 8 + len(_tiff_ifd(ifd0, 8))
+    ifd0[1] = (0x8769, 'long', exif_offset)
+    exif_ifd = [(0x829A, 'rational', exposure_time),
+                (0x829D, 'rational', f_number),
+                (0x8827, 'short', iso),
+                (0x9003, 'ascii', date_time_original),
+                (0x920A, 'rational', focal_length)]
+    tiff = (b'II*\x00' + struct.pack('<L', 8) + _tiff_ifd(ifd0, 8) +
+            _tiff_ifd(exif_ifd, exif_offset))
+    return b'Exif\x00\x00' + tiff
+
+
+def _segment(marker, payload):
+    return struct.pack('>BBH', 0xFF, marker, len(payload) + 2) + payload
+
+
+_FULL_PADDING = _segment(0xFE, b'\x00' * 65533)
+
+
+def make_jpeg(width, height, size=0, exif=None, comment=b''):
+    """ Valid baseline JPEG of a flat grey YCbCr image.
+
+    The Huffman tables only hold the codes of an empty block, so the scan
+    takes only 12 bits per 16x16 pixels; comment segments pad the file to
+    `size` bytes to give it a realistic transfer time.
+    """
+    head = b'\xff\xd8'
+    if exif is not None:
+        head += _segment(0xE1, exif)
+    if comment:
+        head += _segment(0xFE, comment)
+    tables = _segment(0xDB, b'\x00' + b'\x01' * 64)
+    # Three components like a camera JPEG, chroma subsampled 4:2:0 and all
+    # sharing the tables
+    tables += _segment(0xC0, struct.pack('>BHHB', 8, height, width, 3) +
+                       b'\x01\x22\x00\x02\x11\x00\x03\x11\x00')
+    one_code = b'\x01' + b'\x00' * 15 + b'\x00'  # symbol 0 coded as '0'
+    tables += _segment(0xC4, b'\x00' + one_code)  # DC: no difference
+    tables += _segment(0xC4, b'\x10' + one_code)  # AC: end of block
+    scan = _segment(0xDA, b'\x03\x01\x00\x02\x00\x03\x00\x00\x3f\x00')
+    # Two bits per block, six blocks per 16x16 MCU
+    bits = 12 * int(math.ceil(width / 16.0)) * int(math.ceil(height / 16.0))
+    data = bytearray(int(math.ceil(bits / 8.0)))
+    if bits % 8:
+        data[-1] = (1 << (8 - bits % 8)) - 1
+    scan += bytes(data) + b'\xff\xd9'
+
+    # Joined once, concatenating in the loop is quadratic in `size`
+    padding = []
+    missing = size - len(head) - len(tables) - len(scan)
+    while missing > 4:
+        chunk = min(missing - 4, 65533)
+        if chunk == 65533:
+            padding.append(_FULL_PADDING)
+        else:
+            padding.append(_segment(0xFE, b'\x00' * chunk))
+        missing -= chunk + 4
+    return b''.join([head] + padding + [tables, scan])
+
+
+# gphoto2 stand-in
+
+CameraFilePath = namedtuple('CameraFilePath', ['folder', 'name'])
+CameraAbilities = namedtuple('CameraAbilities', ['model'])
+_FileInfo = namedtuple('_FileInfo', ['size'])
+CameraFileInfo = namedtuple('CameraFileInfo', ['file'])
+
+
+class GPhoto2Error(Exception):
+    """ Same interface as `gphoto2.GPhoto2Error`."""
+    MESSAGES = {-2: 'Bad parameters', -7: 'I/O problem',
+                -52: 'Could not find the requested device on the USB port',
+                -108: 'File not found'}
+
+    def __init__(self, code):
+        self.code = code
+        super(GPhoto2Error, self).__init__('[{}] {}'.format(
+            code, self.MESSAGES.get(code, 'Unspecified error')))
+
+
+class CameraWidget(object):
+    """ Config widget with the subset of the gphoto2 API that is used."""
+
+    def __init__(self, name, value=None, choices=None, children=None):
+        self.name = name
+        self.value = value
+        self.choices = choices
+        self.children = children or {}
+
+    def get_child_by_name(self, name):
+        if name in self.children:
+            return self.children[name]
+        for child in self.children.values():
+            try:
+                return child.get_child_by_name(name)
+            except GPhoto2Error:
+                pass
+        raise GPhoto2Error(-2)
+
+    def get_value(self):
+        return self.value
+
+    def set_value(self, value):
+        if self.choices is not None and value not in self.choices:
+            raise GPhoto2Error(-2)
+        self.value = value
+
+    def count_choices(self):
+        if self.choices is None:
+            raise GPhoto2Error(-2)
+        return len(self.choices)
+
+    def get_choice(self, index):
+        return self.choices[index]
+
+
+class CameraFile(object):
+
+    def __init__(self, data):
+        self.data = data
+
+    def get_data_and_size(self):
+        return self.data
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+
+class SimulatedBody(object):
+    """ State of one simulated camera: settings, card and pending events.
+
+    The card works like the internal RAM capture target: an image is gone
+    once downloaded, and only the last `CARD_FILES` images are kept.
+    """
+    CARD_FILES = 16
+    IMAGE_SIZES = {'Large Fine JPEG': (6000, 4000),
+                   'Small Normal JPEG': (1920, 1280),
+                   'RAW': (6000, 4000)}
+    FOLDER = '/store_00020001/DCIM/100CANON'
+
+    def __init__(self, ownername, addr, profile):
+        self.ownername = ownername
+        self.addr = addr
+        self.profile = profile
+        self.model = 'Simulated EOS'
+        self.dropped = False
+        self.unplugged = False
+        self.count = 0
+        self.files = {}
+        self.events = []
+        self.lock = threading.Lock()
+        self.config = CameraWidget('main', children={
+            'settings': CameraWidget('settings', children={
+                'ownername': CameraWidget('ownername', ownername),
+                'viewfinder': CameraWidget('viewfinder', 0, [0, 1]),
+            }),
+            'imgsettings': CameraWidget('imgsettings', children={
+                'imageformat': CameraWidget(
+                    'imageformat', 'Large Fine JPEG',
+                    sorted(self.IMAGE_SIZES)),
+                'iso': CameraWidget(
+                    'iso', '100', ['100', '200', '400', '800', '1600']),
+            }),
+            'capturesettings': CameraWidget('capturesettings', children={
+                'aperture': CameraWidget(
+                    'aperture', '8', ['4', '5.6', '8', '11', '16']),
+                'shutterspeed': CameraWidget(
+                    'shutterspeed', '1/200',
+                    ['1/1000', '1/500', '1/200', '1/100', '1/50']),
+                'focallength': CameraWidget('focallength', '100'),
+            }),
+        })
+
+    def setting(self, name):
+        return self.config.get_child_by_name(name).get_value()
+
+    def exposure(self):
+        return float(Fraction(self.setting('shutterspeed')))
+
+    def take_picture(self):
+        """ Store a new image on the card and return its path."""
+        with self.lock:
+            self.count += 1
+            count = self.count
+        width, height = self.IMAGE_SIZES[self.setting('imageformat')]
+        size = self.profile.image_size
+        if self.setting('imageformat') == 'Small Normal JPEG':
+            size = size // 8
+        exif = make_exif(self.model, Fraction(self.setting('focallength')),
+                         Fraction(self.setting('shutterspeed')),
+                         Fraction(self.setting('aperture')),
+                         int(self.setting('iso')),
+                         time.strftime('%Y:%m:%d %H:%M:%S'))
+        comment = '{} {}'.format(self.ownername, count).encode()
+        data = make_jpeg(width, height, size, exif, comment)
+        path = CameraFilePath(self.FOLDER, 'IMG_{:04d}.JPG'.format(count))
+        with self.lock:
+            self.files[path] = data
+            while len(self.files) > self.CARD_FILES:
+                del self.files[next(iter(self.files))]
+        return path
+
+    def delete(self, path):
+        with self.lock:
+            self.files.pop(path, None)
+
+
+class Context(object):
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    def camera_autodetect(self):
+        return [(body.model, body.addr) for body in self.bodies
+                if not body.unplugged]
+
+
+class PortInfo(object):
+
+    def __init__(self, body):
+        self.body = body
+        self.path = body.addr
+
+
+class PortInfoList(object):
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    def load(self):
+        pass
+
+    def lookup_path(self, path):
+        for index, body in enumerate(self.bodies):
+            if body.addr == path:
+                return index
+        raise GPhoto2Error(-52)
+
+    def __getitem__(self, index):
+        return PortInfo(self.bodies[index])
+
+
+class Camera(object):
+    """ Same interface as `gphoto2.Camera` for the calls StereoCamera
+    makes, backed by a `SimulatedBody`.
+    """
+
+    def __init__(self):
+        self.body = None
+
+    def set_port_info(self, port_info):
+        self.body = port_info.body
+
+    def _command(self, nbytes=0, fail=True):
+        body = self.body
+        if body is None or body.unplugged or body.dropped:
+            raise GPhoto2Error(-52)
+        body.profile.wait(nbytes)
+        if fail and body.profile.fails():
+            raise GPhoto2Error(-7)
+
+    def init(self, context):
+        if self.body is None or self.body.unplugged:
+            raise GPhoto2Error(-52)
+        self.body.profile.wait()
+        self.body.dropped = False
+
+    def exit(self, context):
+        pass
+
+    def get_summary(self, context):
+        self._command(fail=False)
+        return 'Model: {}\nOwner: {}'.format(self.body.model,
+                                             self.body.ownername)
+
+    def get_storageinfo(self, context):
+        self._command(fail=False)
+        return []
+
+    def get_config(self, context):
+        self._command(4096)
+        return copy.deepcopy(self.body.config)
+
+    def get_single_config(self, name, context):
+        self._command()
+        return copy.deepcopy(self.body.config.get_child_by_name(name))
+
+    def set_config(self, config, context):
+        self._command(4096)
+        self.body.config = copy.deepcopy(config)
+
+    def _maybe_drop(self):
+        if self.body.profile.fails(self.body.profile.drop_rate):
+            logger.warning("Simulated {} camera dropped".format(
+                self.body.ownername))
+            self.body.dropped = True
+            raise GPhoto2Error(-7)
+
+    def capture(self, capture_type, context):
+        self._command()
+        self._maybe_drop()
+        time.sleep(self.body.exposure() + self.body.profile.capture_latency)
+        return self.body.take_picture()
+
+    def trigger_capture(self, context):
+        self._command()
+        self._maybe_drop()
+        ready = (time.monotonic() + self.body.exposure() +
+                 self.body.profile.capture_latency)
+        with self.body.lock:
+            self.body.events.append(ready)
+
+    def wait_for_event(self, timeout, context):
+        self._command(fail=False)
+        deadline = time.monotonic() + timeout / 1000.0
+        while True:
+            now = time.monotonic()
+            with self.body.lock:
+                pending = sorted(self.body.events)
+                if pending and pending[0] <= now:
+                    self.body.events.remove(pending[0])
+                    break
+            if now >= deadline:
+                return GP_EVENT_TIMEOUT, None
+            wake = deadline if not pending else min(deadline, pending[0])
+            time.sleep(max(0, wake - now))
+        return GP_EVENT_FILE_ADDED, self.body.take_picture()
+
+    def _file(self, folder, name):
+        try:
+            return self.body.files[CameraFilePath(folder, name)]
+        except KeyError:
+            raise GPhoto2Error(-108)
+
+    def file_get_info(self, folder, name, context):
+        self._command(fail=False)
+        return CameraFileInfo(_FileInfo(len(self._file(folder, name))))
+
+    def file_read(self, folder, name, file_type, offset, buf, context):
+        data = self._file(folder, name)
+        chunk = data[offset:offset + len(buf)]
+        self._command(len(chunk))
+        buf[:len(chunk)] = chunk
+        if offset + len(chunk) >= len(data):
+            self.body.delete(CameraFilePath(folder, name))
+        return len(chunk)
+
+    def file_get(self, folder, name, file_type, context):
+        data = self._file(folder, name)
+        self._command(len(data))
+        self.body.delete(CameraFilePath(folder, name))
+        return CameraFile(data)
+
+    def file_delete(self, folder, name, context):
+        self._command(fail=False)
+        self._file(folder, name)
+        self.body.delete(CameraFilePath(folder, name))
+
+    def capture_preview(self, context):
+        self._command(self.body.profile.preview_size)
+        self.body.config.get_child_by_name('viewfinder').set_value(1)
+        return CameraFile(make_jpeg(960, 640, self.body.profile.preview_size))
+
+
+GP_OK = 0
+GP_CAPTURE_IMAGE = 0
+GP_FILE_TYPE_NORMAL = 1
+GP_EVENT_TIMEOUT = 1
+GP_EVENT_FILE_ADDED = 2
+
+
+def check_result(result):
+    """ Same as `gphoto2.check_result`."""
+    if not isinstance(result, (tuple, list)):
+        result = [result]
+    if result[0] < GP_OK:
+        raise GPhoto2Error(result[0])
+    values = result[1:]
+    if not values:
+        return None
+    return values[0] if len(values) == 1 else values
+
+
+def gp_camera_get_abilities(camera):
+    return [GP_OK, CameraAbilities(camera.body.model)]
+
+
+class SimulatedGPhoto2(object):
+    """
+    Stand-in for the gphoto2 module, for `StereoCamera(backend=...)`
+
+    Each camera of the rig shows up on its own `sim:` port with its rig
+    name as ownername.
+
+    Attributes
+    ----------
+    bodies : list
+        `SimulatedBody` per camera
+    """
+    GPhoto2Error = GPhoto2Error
+    Camera = Camera
+    GP_OK = GP_OK
+    GP_CAPTURE_IMAGE = GP_CAPTURE_IMAGE
+    GP_FILE_TYPE_NORMAL = GP_FILE_TYPE_NORMAL
+    GP_EVENT_TIMEOUT = GP_EVENT_TIMEOUT
+    GP_EVENT_FILE_ADDED = GP_EVENT_FILE_ADDED
+
+    def __init__(self, names=('LEFT', 'RIGHT'), profile=None):
+        profile = Profile.load(profile)
+        self.bodies = [SimulatedBody(name, 'sim:{:03d}'.format(index + 1),
+                                     profile)
+                       for index, name in enumerate(names)]
+
+    def Context(self):
+        return Context(self.bodies)
+
+    def PortInfoList(self):
+        return PortInfoList(self.bodies)
+
+    check_result = staticmethod(check_result)
+    gp_camera_get_abilities = staticmethod(gp_camera_get_abilities)
+
+    def body(self, ownername):
+        for body in self.bodies:
+            if body.ownername == ownername:
+                return body
+        raise KeyError(ownername)
+
+
+# PTU
+
+class _Axis(object):
+    """ One PTU axis moving with a trapezoidal velocity profile."""
+
+    def __init__(self, name, resolution, minimum, maximum, speed=2000,
+                 accel=2000):
+        self.name = name
+        self.resolution = resolution
+        self.minimum = minimum
+        self.maximum = maximum
+        self.speed = speed
+        self.accel = accel
+        self.start = 0
+        self.target = 0
+        self.move_start = 0.0
+        self.move_time = 0.0
+
+    def position(self, now):
+        if now >= self.move_start + self.move_time:
+            return self.target
+        fraction = (now - self.move_start) / self.move_time
+        return int(round(self.start + (self.target - self.start) * fraction))
+
+    def remaining(self, now):
+        return max(0.0, self.move_start + self.move_time - now)
+
+    def move_to(self, target, now):
+        self.start = self.position(now)
+        self.target = target
+        self.move_start = now
+        self.move_time = planner.SlewModel.axis_time(
+            target - self.start, self.speed, self.accel)
+
+    def halt(self, now):
+        self.move_to(self.position(now), now)
+        self.move_time = 0.0
+
+
+class PTUEmulator(object):
+    """
+    TCP server speaking the FLIR PTU ASCII command protocol
+
+    Supports position, offset, speed, acceleration, resolution and limit
+    commands of both axes (e.g. 'PP1000', 'TP', 'PS2000'), await 'A',
+    halt 'H', immediate 'I' and slaved 'S' execution, echo 'EE'/'ED' and
+    verbose/terse feedback 'FV'/'FT'. Like the real unit, it greets every
+    new connection with its version and 'Initializing...', ended by the
+    '*' that `flir_ptu` waits for on connect.
+
+    Attributes
+    ----------
+    address : tuple
+        (host, port) the server listens on, once started
+    """
+    PAN_RESOLUTION = 92.5714  # seconds arc per position
+    TILT_RESOLUTION = 46.2857
+    COMMAND = re.compile(r'^([PT])([POSARNX])(-?\d*)$')
+    NAMES = {'P': 'Pan', 'T': 'Tilt'}
+    VERSION = 'Pan-Tilt Controller v3.4.0, Simulated by stereosim'
+    GREETING = VERSION + '\r\nInitializing...\r\n*'
+
+    def __init__(self, host='127.0.0.1', port=0, profile=None, echo=False,
+                 terse=False):
+        self.host = host
+        self.port = port
+        self.profile = Profile.load(profile)
+        self.echo = echo
+        self.terse = terse
+        self.slaved = False
+        self.axes = {'P': _Axis('P', self.PAN_RESOLUTION, -3090, 3090),
+                     'T': _Axis('T', self.TILT_RESOLUTION, -2000, 600)}
+        self.pending = {}
+        self.address = None
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        emulator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                emulator._serve(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer(
+            (self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("PTU emulator listening on {}:{}".format(*self.address))
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def _serve(self, sock):
+        sock.sendall(self.GREETING.encode('ascii'))
+        buffer = b''
+        while True:
+            data = sock.recv(1024)
+            if not data:
+                break
+            buffer += data
+            *commands, buffer = re.split(rb'[ \r\n]', buffer)
+            for command in commands:
+                if not command:
+                    continue
+                command = command.decode('ascii', 'replace')
+                reply = self.execute(command)
+                if self.echo:
+                    reply = command + ' ' + reply
+                sock.sendall((reply + '\r\n').encode('ascii'))
+
+    def _reply(self, verbose, value=None):
+        if value is None:
+            return '*'
+        if self.terse:
+            return '* {}'.format(value)
+        return '* ' + verbose.format(value)
+
+    def execute(self, command):
+        """ Reply to one command, without the line ending."""
+        self.profile.wait()
+        if self.profile.fails():
+            return '! Communication error'
+        command = command.upper()
+        if command == 'A':
+            return self._await()
+        with self._lock:
+            now = time.monotonic()
+            if command in ('EE', 'ED'):
+                self.echo = command == 'EE'
+            elif command in ('FT', 'FV'):
+                self.terse = command == 'FT'
+            elif command in ('I', 'S'):
+                self.slaved = command == 'S'
+            elif command in ('H', 'HP', 'HT'):
+                for name, axis in self.axes.items():
+                    if command == 'H' or command[1] == name:
+                        axis.halt(now)
+            elif command == 'R':
+                for axis in self.axes.values():
+                    axis.move_to(0, now)
+            elif command == 'V':
+                return self._reply('{}', self.VERSION)
+            else:
+                return self._axis_command(command, now)
+        return '*'
+
+    def _axis_command(self, command, now):
+        match = self.COMMAND.match(command)
+        if match is None:
+            return '! Illegal Command'
+        name, op, arg = match.groups()
+        axis = self.axes[name]
+        label = self.NAMES[name]
+        value = int(arg) if arg not in ('', '-') else None
+        if op in ('P', 'O'):
+            if value is None:
+                if op == 'O':
+                    return '! Illegal Command Argument'
+                return self._reply('Current {} position is {{}}'.format(
+                    label), axis.position(now))
+            if op == 'O':
+                value += axis.position(now)
+            if value > axis.maximum:
+                return '! Maximum allowable {} position is {}'.format(
+                    label, axis.maximum)
+            if value < axis.minimum:
+                return '! Minimum allowable {} position is {}'.format(
+                    label, axis.minimum)
+            if self.slaved:
+                self.pending[name] = value
+            else:
+                axis.move_to(value, now)
+            return '*'
+        if op in ('S', 'A'):
+            attr = 'speed' if op == 'S' else 'accel'
+            if value is None:
+                text = ('Target {} speed is {{}} positions/sec' if op == 'S'
+                        else '{} acceleration is {{}} positions/sec^2')
+                return self._reply(text.format(label), getattr(axis, attr))
+            if value <= 0:
+                return '! Illegal Command Argument'
+            setattr(axis, attr, value)
+            return '*'
+        if value is not None:
+            return '! Illegal Command Argument'
+        if op == 'R':
+            return self._reply('{{}} seconds arc per {} position'.format(
+                label), axis.resolution)
+        if op == 'N':
+            return self._reply('Minimum {} position is {{}}'.format(label),
+                               axis.minimum)
+        return self._reply('Maximum {} position is {{}}'.format(label),
+                           axis.maximum)
+
+    def _await(self):
+        with self._lock:
+            now = time.monotonic()
+            for name, value in self.pending.items():
+                self.axes[name].move_to(value, now)
+            self.pending = {}
+            remaining = max(axis.remaining(now)
+                            for axis in self.axes.values())
+        time.sleep(remaining)
+        return '*'
+
+    def angle(self):
+        """ Current (pan, tilt) in degrees."""
+        now = time.monotonic()
+        with self._lock:
+            return tuple(axis.position(now) * axis.resolution / 3600.0
+                         for axis in (self.axes['P'], self.axes['T']))
+
+
+# IMU
+
+class IMUEmulator(object):
+    """
+    Pseudo-terminal streaming IMU JSON lines
+
+    `port` is the slave device to open with `IMU(port=...)`. Injected
+    failures send a garbled line.
+
+    Attributes
+    ----------
+    rate : float
+        Samples per second
+    drift : float
+        Yaw drift in degrees per second
+    """
+
+    def __init__(self, rate=50.0, drift=0.1, profile=None):
+        self.rate = rate
+        self.drift = drift
+        self.profile = Profile.load(profile)
+        self.port = None
+        self._master = None
+        self._slave = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._stream)
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("IMU emulator streaming on {}".format(self.port))
+        return self
+
+    def sample(self, elapsed):
+        """ IMU data `elapsed` seconds after the start."""
+        noise = self.profile.random.gauss
+        yaw = math.radians(self.drift * elapsed)
+        return {'quat': [math.cos(yaw / 2), 0.0, 0.0, math.sin(yaw / 2)],
+                'accel': [noise(0, 0.01), noise(0, 0.01),
+                          9.81 + noise(0, 0.01)],
+                'gyro': [noise(0, 0.001), noise(0, 0.001),
+                         math.radians(self.drift)],
+                'temp': 25.0}
+
+    def _stream(self):
+        start = time.monotonic()
+        period = 1.0 / self.rate
+        count = 0
+        while not self._stop.is_set():
+            line = json.dumps(self.sample(time.monotonic() - start))
+            if self.profile.fails():
+                line = line[:len(line) // 2]
+            try:
+                os.write(self._master, (line + '\n').encode())
+            except BlockingIOError:
+                pass  # nobody is reading, drop the sample
+            except OSError:
+                break
+            count += 1
+            self._stop.wait(max(0, start + count * period - time.monotonic()))
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            os.close(self._master)
+            os.close(self._slave)
+
+
+class Simulator(object):
+    """
+    Simulated cameras, PTU and IMU for `MAZE(simulate=...)`
+
+    Parameters
+    ----------
+    profile : str or dict
+        Built-in profile name ('ideal', 'usb2', 'field'), path of a YAML
+        file or a dict, with optional 'camera', 'ptu' and 'imu' sections
+        of `Profile` settings
+    camera_names : list
+        Ownernames of the simulated cameras
+    """
+
+    def __init__(self, profile=None, camera_names=('LEFT', 'RIGHT')):
+        self.profiles = load_profiles(profile)
+        self.gphoto2 = SimulatedGPhoto2(camera_names, self.profiles['camera'])
+        self.ptu = PTUEmulator(profile=self.profiles['ptu'])
+        self.imu = IMUEmulator(profile=self.profiles['imu'])
+
+    def start(self):
+        self.ptu.start()
+        self.imu.start()
+        return self
+
+    def stop(self):
+        self.ptu.stop()
+        self.imu.stop()
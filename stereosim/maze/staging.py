@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StagingArea(object):
+    """
+    RAM-backed staging directory with write-behind flush to the archive
+
+    Captures land in `staging_root`, which mirrors the layout under
+    `archive_root`. A background writer copies each staged pair to the
+    archive, fsyncs a batch of pairs together, writes a `.flushed` marker
+    per pair and removes the staged copies.
+
+    Attributes
+    ----------
+    budget : int
+        Maximum number of staged bytes before `wait_for_budget` blocks
+    fsync_batch : int
+        Maximum number of pairs fsynced together
+    retries : int
+        Attempts at writing a batch before it is set aside in `failed`
+    retry_delay : float
+        Seconds between the attempts
+    errors : list
+        Exceptions raised by the writer
+    failed : list
+        Pairs set aside after `retries` failed attempts, still staged and
+        counted in `staged_bytes`. They are queued again once a later batch
+        was written, by `retry_failed` or by `join`.
+    """
+
+    def __init__(self, staging_root, archive_root, budget=2 * 1024 ** 3,
+                 fsync_batch=4, retries=3, retry_delay=1.0):
+        self.staging_root = staging_root
+        self.archive_root = archive_root
+        self.budget = budget
+        self.fsync_batch = fsync_batch
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.errors = []
+        self.failed = []
+        self.staged_bytes = 0
+        self._staged = set()
+        self._lock = threading.Condition()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def stage_path(self, archive_path):
+        """ Staging directory that mirrors `archive_path`."""
+        relative = os.path.relpath(archive_path, self.archive_root)
+        path = os.path.normpath(os.path.join(self.staging_root, relative))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def archive_path(self, staged_path):
+        relative = os.path.relpath(staged_path, self.staging_root)
+        return os.path.normpath(os.path.join(self.archive_root, relative))
+
+    def locate(self, archive_path):
+        """ Current location of a file, staged or already archived."""
+        if archive_path is None:
+            return None
+        relative = os.path.relpath(archive_path, self.archive_root)
+        staged_path = os.path.normpath(
+            os.path.join(self.staging_root, relative))
+        with self._lock:
+            if staged_path in self._staged:
+                return staged_path
+        return archive_path
+
+    def wait_for_budget(self):
+        """ Block while the staged bytes exceed `budget`.
+
+        Raises
+        ------
+        OSError
+            When over budget with pairs the writer could not archive. The
+            staged bytes would not go down by waiting, so the failed pairs
+            are queued again and the capture is refused.
+        """
+        with self._lock:
+            while self.staged_bytes > self.budget:
+                if self.failed:
+                    count = len(self.failed)
+                    self._retry_failed()
+                    raise OSError(
+                        "Staging over budget ({} bytes) with {} pairs not "
+                        "archived".format(self.staged_bytes, count)) \
+                        from self.errors[-1]
+                self._lock.wait()
+
+    def retry_failed(self):
+        """ Queue the pairs in `failed` for the archive again."""
+        with self._lock:
+            self._retry_failed()
+
+    def _retry_failed(self):
+        failed, self.failed = self.failed, []
+        for job in failed:
+            self._queue.put(job)
+
+    def flush(self, staged_paths, marker, callback=None):
+        """ Queue a staged pair for the archive.
+
+        Parameters
+        ----------
+        staged_paths : list
+            Staged files of the pair, images and labels
+        marker : str
+            Archive path of the marker written once the pair is durable
+        callback : callable
+            Called as `callback(archive_paths)` from the writer thread once
+            the marker is written
+
+        Returns
+        -------
+        list : archive paths of the files
+        """
+        size = sum(os.path.getsize(path) for path in staged_paths)
+        with self._lock:
+            self.staged_bytes += size
+            self._staged.update(staged_paths)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer_thread)
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put((list(staged_paths), marker, size, callback))
+        return [self.archive_path(path) for path in staged_paths]
+
+    def _writer_thread(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.fsync_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            batch = [job for job in batch if job is not None]
+            count = len(batch)
+            try:
+                self._write_with_retries(batch)
+            finally:
+                for job in range(count + stop):
+                    self._queue.task_done()
+            if stop:
+                break
+
+    def _write_with_retries(self, batch):
+        for attempt in range(self.retries):
+            if attempt:
+                time.sleep(self.retry_delay)
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.exception("Staging Flush Failed")
+                with self._lock:
+                    self.errors.append(e)
+                continue
+            with self._lock:
+                # The archive works again, retry what was set aside
+                self._retry_failed()
+            return
+        logger.error("Keeping {} pairs staged after {} failed attempts"
+                     .format(len(batch), self.retries))
+        with self._lock:
+            self.failed.extend(batch)
+            self._lock.notify_all()
+
+    def _write_batch(self, batch):
+        """ Archive a batch of pairs. Archived pairs are removed from
+        `batch`, so a retry only writes the rest.
+        """
+        written = []
+        for staged_paths, marker, size, callback in batch:
+            for staged_path in staged_paths:
+                archive_path = self.archive_path(staged_path)
+                os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+                shutil.copyfile(staged_path, archive_path)
+                written.append(archive_path)
+
+        # One fsync pass for the whole batch, files then directories
+        for path in written:
+            _fsync(path)
+        for directory in set(os.path.dirname(path) for path in written):
+            _fsync(directory)
+
+        for job in list(batch):
+            staged_paths, marker, size, callback = job
+            with open(marker, 'w') as f:
+                f.write('\n'.join(os.path.basename(self.archive_path(path))
+                                  for path in staged_paths) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            with self._lock:
+                for staged_path in staged_paths:
+                    os.remove(staged_path)
+                    self._staged.discard(staged_path)
+                self.staged_bytes -= size
+                batch.remove(job)
+                self._lock.notify_all()
+            if callback is not None:
+                try:
+                    callback([self.archive_path(path)
+                              for path in staged_paths])
+                except Exception as e:
+                    logger.exception("Staging Callback Failed")
+                    logger.exception(e)
+
+    def join(self):
+        """ Block until every queued pair is in the archive or in `failed`.
+
+        Pairs in `failed` get one more round of attempts first.
+
+        Returns
+        -------
+        list : staged paths of the files that are still not archived
+        """
+        self._queue.join()
+        with self._lock:
+            retry = bool(self.failed)
+            self._retry_failed()
+        if retry:
+            self._queue.join()
+        with self._lock:
+            return [path for job in self.failed for path in job[0]]
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
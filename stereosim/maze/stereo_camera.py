@@ -1,10 +1,20 @@
 from multiprocessing.dummy import Pool as ThreadPool
+import configparser
+import hashlib
+import io
 import os
 import logging
+import threading
 import time
-import gphoto2 as gp
+from collections import namedtuple
 from enum import IntEnum
-import exifread
+from stereosim.maze import exif, metrics
+
+try:
+    import gphoto2 as gp
+except ImportError:
+    # Only simulated cameras are available, see `simulator`
+    gp = None
 
 logger = logging.getLogger(__name__)
 
@@ -14,9 +24,44 @@ class CameraID(IntEnum):
     RIGHT = 1
 
 
+TriggerResult = namedtuple('TriggerResult',
+                           ['path', 'start', 'end', 'download'])
+TriggerResult.__new__.__defaults__ = (None,)
+TriggerResult.__doc__ = """ Onboard path of a triggered image with the
+`time.monotonic` timestamps taken around its capture. `download` is the
+pending download started by the event-driven capture, if any."""
+
+
+class CameraRig(object):
+    """
+    Maps camera ownernames to camera slots
+
+    The slot of a camera is the position of its ownername in `names`. The
+    stereo rig is ('LEFT', 'RIGHT'), so its slots match `CameraID`.
+
+    Attributes
+    ----------
+    names : list
+        Ownernames, one per camera slot
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+
+    def slot(self, ownername):
+        """ Slot of `ownername`, or None if it is not part of the rig."""
+        try:
+            return self.names.index(ownername)
+        except ValueError:
+            return None
+
+    def __len__(self):
+        return len(self.names)
+
+
 class StereoCamera():
     """
-    Dual camera representation
+    Multi camera representation, a stereo pair by default
 
     Attributes
     ----------
@@ -24,60 +69,230 @@ class StereoCamera():
         Ownername of the left camera
     RIGHTNAME : str
         Ownername of the right camera
+    CHECKSUM : str
+        hashlib algorithm of the checksums computed during transfer
+    rig : CameraRig
+        Ownernames of the cameras, defaults to `LEFTNAME` and `RIGHTNAME`
+    in_memory : bool
+        Fetch images into memory and write them to storage once, after
+        the stats have been extracted from the same bytes
+    capture_mode : str
+        'blocking' runs a blocking `camera.capture` per camera thread,
+        'event' triggers all cameras and waits for their FILE_ADDED events
+        in a single loop
+    last_image_data : list
+        Bytes of the most recent images when `in_memory` is set
+    gp : module
+        gphoto2, or a stand-in with the same API such as
+        `simulator.SimulatedGPhoto2`
     """
     LEFTNAME = "LEFT"
     RIGHTNAME = "RIGHT"
-
-    def __init__(self):
-        self.context = gp.Context()
-        self.pool = ThreadPool(2)
-        self.cameras = [None, None]
-        self.connected = (self.cameras[CameraID.LEFT] is not None) and (
-            self.cameras[CameraID.RIGHT] is not None)
+    PORT_CACHE_FILE = '.config/stereosim_cameras.ini'
+    BARRIER_TIMEOUT = 10
+    CHECKSUM = 'sha256'
+    CHUNK_SIZE = 1024 * 1024
+    EVENT_TIMEOUT = 30
+    EVENT_POLL_MS = 50
+
+    def __init__(self, in_memory=False, capture_mode='blocking', rig=None,
+                 backend=None):
+        if backend is None:
+            if gp is None:
+                raise ImportError("gphoto2 is required for real cameras")
+            backend = gp
+        self.gp = backend
+        if rig is None:
+            rig = CameraRig((self.LEFTNAME, self.RIGHTNAME))
+        self.rig = rig
+        self.in_memory = in_memory
+        self.capture_mode = capture_mode
+        self.last_image_data = [None] * len(rig)
+        self._last_transfer = ([], [])
+        self.context = self.gp.Context()
+        self.pool = ThreadPool(len(rig))
+        self.transfer_pool = ThreadPool(len(rig))
+        self.cameras = [None] * len(rig)
+        self.port_cache_path = os.path.join(
+            os.path.expanduser('~'), self.PORT_CACHE_FILE)
+
+    @property
+    def connected(self):
+        return all(cam is not None for cam in self.cameras)
 
     def detect_cameras(self):
         """ Detects the connected cameras and if the ownername matches
-        with `LEFTNAME` or `RIGHTNAME`, it will be stored under the variable
-        `cameras`
+        one of the `rig` names, it will be stored under the variable
+        `cameras` in its slot
+
+        Every port that is not already in use is opened and its ownername
+        read from the camera. The resulting port to ownername mapping is
+        cached for `reconnect`.
         """
         _cameras = self.context.camera_autodetect()
-        msg = [(False, "None"), (False, "None")]
         if len(_cameras) == 0:
             raise Exception("Unable to find any camera")
-        # Stores the left and right camera
 
-        ports = gp.PortInfoList()
+        ports = self.gp.PortInfoList()
         ports.load()
+        in_use = [cam._port for cam in self.cameras if cam is not None]
 
         for index, (name, addr) in enumerate(_cameras):
             logger.debug(
                 "Count: {}, Name: {}, Addr: {}".format(index, name, addr))
-            # Get the ports and search for the camera
-            idx = ports.lookup_path(addr)
+            if addr in in_use:
+                continue
             try:
-                camera = gp.Camera()
-                camera.set_port_info(ports[idx])
-                camera.init(self.context)
+                camera = self._open_camera(ports, addr)
                 # Check if the ownername matches to given values
-                ownername = self._get_config("ownername", camera)
-                abilities = gp.check_result(gp.gp_camera_get_abilities(camera))
-            except gp.GPhoto2Error as error:
+                ownername = self._read_ownername(camera)
+            except self.gp.GPhoto2Error as error:
                 logger.error(str(error))
             else:
-                if ownername == self.LEFTNAME:
-                    camera._camera_name = self.LEFTNAME
-                    camera._camera_id = CameraID.LEFT
-                    self.cameras[CameraID.LEFT] = camera
-                    msg[CameraID.LEFT] = True, str(abilities.model)
-                    logger.info("Connected: " + str(abilities.model))
-                elif ownername == self.RIGHTNAME:
-                    camera._camera_name = self.RIGHTNAME
-                    camera._camera_id = CameraID.RIGHT
-                    self.cameras[CameraID.RIGHT] = camera
-                    msg[CameraID.RIGHT] = True, str(abilities.model)
-                    logger.info("Connected: " + str(abilities.model))
-
-        return self.connected, msg
+                self._attach_camera(camera, ownername)
+
+        self._save_port_cache()
+        return self.connected, self._status()
+
+    def reconnect(self):
+        """ Fast (re)connect of the cameras that are missing or dropped.
+
+        Cameras that still respond are kept. Missing ones are re-opened in
+        parallel on the ports cached by `detect_cameras`, reading only
+        their ownername to check that the port still has the same camera.
+        Only if that leaves slots empty are the remaining ports probed with
+        `detect_cameras`.
+
+        Returns
+        -------
+        tuple : (connected, [(found, model) per camera slot])
+        """
+        for slot, cam in enumerate(self.cameras):
+            if cam is not None and not self._camera_alive(cam):
+                logger.warning("{} camera dropped".format(cam._camera_name))
+                try:
+                    cam.exit(self.context)
+                except self.gp.GPhoto2Error:
+                    pass
+                self.cameras[slot] = None
+
+        missing = [name for name, cam in zip(self.rig.names, self.cameras)
+                   if cam is None]
+        if not missing:
+            return self.connected, self._status()
+
+        port_cache = self._load_port_cache()
+        cached = [(addr, port_cache[addr])
+                  for name, addr in self.context.camera_autodetect()
+                  if port_cache.get(addr) in missing]
+
+        ports = self.gp.PortInfoList()
+        ports.load()
+
+        def open_cached(item):
+            addr, ownername = item
+            try:
+                camera = self._open_camera(ports, addr)
+                return camera, self._read_ownername(camera)
+            except self.gp.GPhoto2Error as error:
+                logger.error(str(error))
+                return None, None
+
+        moved = False
+        for (camera, ownername), (addr, cached_name) in zip(
+                self.pool.map(open_cached, cached), cached):
+            if camera is None:
+                continue
+            if ownername != cached_name:
+                logger.warning("Camera on {} is {}, cached as {}".format(
+                    addr, ownername, cached_name))
+                moved = True
+            slot = self.rig.slot(ownername)
+            if slot is not None and self.cameras[slot] is not None:
+                # Still connected elsewhere
+                camera.exit(self.context)
+                continue
+            self._attach_camera(camera, ownername)
+
+        if not self.connected:
+            logger.info("Probing uncached camera ports")
+            return self.detect_cameras()
+        if moved:
+            self._save_port_cache()
+        return self.connected, self._status()
+
+    def _open_camera(self, ports, addr):
+        camera = self.gp.Camera()
+        camera.set_port_info(ports[ports.lookup_path(addr)])
+        camera.init(self.context)
+        camera._lock = threading.Lock()
+        # Guards the cached config tree, `_lock` only guards USB I/O
+        camera._config_lock = threading.Lock()
+        camera._config = None
+        camera._port = addr
+        return camera
+
+    def _attach_camera(self, camera, ownername):
+        slot = self.rig.slot(ownername)
+        if slot is None:
+            camera.exit(self.context)
+            return
+        abilities = self.gp.check_result(self.gp.gp_camera_get_abilities(camera))
+        camera._camera_name = ownername
+        camera._camera_id = slot
+        camera._model = str(abilities.model)
+        self.cameras[slot] = camera
+        logger.info("Connected: " + camera._model)
+
+    def _read_ownername(self, camera):
+        """ Ownername of an opened camera, reading just that widget when
+        the camera driver supports it.
+        """
+        with camera._lock:
+            try:
+                widget = camera.get_single_config('ownername', self.context)
+                return widget.get_value()
+            except (AttributeError, self.gp.GPhoto2Error):
+                pass
+        return self._get_config('ownername', camera)
+
+    def _camera_alive(self, camera):
+        try:
+            with camera._lock:
+                camera.get_storageinfo(self.context)
+        except self.gp.GPhoto2Error:
+            return False
+        return True
+
+    def _status(self):
+        return [(False, "None") if cam is None else (True, cam._model)
+                for cam in self.cameras]
+
+    def _port_cache_config(self):
+        # Ports look like 'usb:001,002', so only '=' separates key and value
+        config = configparser.ConfigParser(delimiters=('=',))
+        config.read(self.port_cache_path)
+        return config
+
+    def _load_port_cache(self):
+        config = self._port_cache_config()
+        if config.has_section('PORTS'):
+            return dict(config['PORTS'])
+        return {}
+
+    def _save_port_cache(self):
+        # Replaced as a whole, ports of cameras that moved are dropped
+        config = self._port_cache_config()
+        config.remove_section('PORTS')
+        config.add_section('PORTS')
+        for cam in self.cameras:
+            if cam is not None:
+                config['PORTS'][cam._port] = cam._camera_name
+        try:
+            with open(self.port_cache_path, 'w') as f:
+                config.write(f)
+        except OSError:
+            logger.warning("Unable to save camera port cache")
 
     def get_summary(self):
         """ Prints the summary of the cameras as defined by gphoto2
@@ -89,7 +304,7 @@ class StereoCamera():
     def _get_config_obj(self, config, name):
         try:
             value_obj = config.get_child_by_name(name)
-        except gp.GPhoto2Error:
+        except self.gp.GPhoto2Error:
             logger.error("Invalid config name: {}".format(name))
             return None
 
@@ -113,13 +328,56 @@ class StereoCamera():
         return self._get_config(name, self.cameras[camera_id])
 
     def _get_config(self, name, camera_obj):
-        config = camera_obj.get_config(self.context)
-        value_obj = self._get_config_obj(config, name)
-        if value_obj:
-            #x = value_obj.get_value()
-            return value_obj.get_value()
-        else:
-            return None
+        # A cached read does not wait for a trigger or transfer on the USB
+        config = camera_obj._config
+        if config is None:
+            with camera_obj._lock:
+                config = self._cached_config(camera_obj)
+        with camera_obj._config_lock:
+            value_obj = self._get_config_obj(config, name)
+            if value_obj:
+                return value_obj.get_value()
+            else:
+                return None
+
+    def _cached_config(self, camera, refresh=False):
+        """ Config tree of `camera`, only fetched over USB when it is not
+        cached yet. The caller must hold `camera._lock`.
+        """
+        if refresh or camera._config is None:
+            camera._config = camera.get_config(self.context)
+        return camera._config
+
+    def refresh_config(self, camera_id=None):
+        """ Re-read the config tree from the camera(s)
+
+        Needed after settings were changed on the camera body itself.
+
+        Parameters
+        ---------
+        camera_id : enum
+            Camera to refresh, or None for all cameras
+        """
+        for camera in self._select_cameras(camera_id):
+            with camera._lock:
+                self._cached_config(camera, refresh=True)
+
+    def invalidate_config(self, camera_id=None):
+        """ Drop the cached config tree, the next read fetches it again
+
+        Parameters
+        ---------
+        camera_id : enum
+            Camera to invalidate, or None for all cameras
+        """
+        for camera in self._select_cameras(camera_id):
+            with camera._lock:
+                camera._config = None
+
+    def _select_cameras(self, camera_id=None):
+        if camera_id is None:
+            return [cam for cam in self.cameras if cam is not None]
+        return [self.cameras[camera_id]]
 
     def get_choices(self, name, camera_id):
         """ Get valid choices for a config
@@ -135,66 +393,152 @@ class StereoCamera():
         Array
             Empty array if the config is invalid
         """
-        config = self.cameras[camera_id].get_config(self.context)
-        value_obj = self._get_config_obj(config, name)
-        try:
-            count = value_obj.count_choices()
-        except gp.GPhoto2Error:
-            count = 0
+        camera = self.cameras[camera_id]
+        with camera._lock:
+            config = self._cached_config(camera)
+            value_obj = self._get_config_obj(config, name)
+            try:
+                count = value_obj.count_choices()
+            except self.gp.GPhoto2Error:
+                count = 0
 
-        valid_choices = []
-        for i in range(count):
-            valid_choices.append(value_obj.get_choice(i))
+            valid_choices = []
+            for i in range(count):
+                valid_choices.append(value_obj.get_choice(i))
         return valid_choices
 
     def set_config(self, name, value, camera_id):
         self._set_config(name,value,self.cameras[camera_id])
 
     def _set_config(self, name, value, camera):
-        config = camera.get_config(self.context)
-        value_obj = self._get_config_obj(config, name)
-        if value_obj:
-            value_obj.set_value(value)
-            camera.set_config(config, self.context)
-
-    def read_exif(self, test_file):
-        with open(test_file, 'rb') as f:
-            meta = exifread.process_file(f, details=False)
-
-        focal_len = '{} mm'.format(meta['EXIF FocalLength'])
-        shutterspeed = '{} sec'.format(meta['EXIF ExposureTime'])
-        
-        return {'focallength' : focal_len, 'shutterspeed' : shutterspeed }
-
-    def process_stats(self, image_path, camera):
-        stats = ['aperture','iso','imageformat']
-        stats_dict = self.read_exif(image_path)
+        """ Write through: update the cached tree and push it to the camera.
+        """
+        with camera._lock:
+            config = self._cached_config(camera)
+            value_obj = self._get_config_obj(config, name)
+            if value_obj:
+                try:
+                    with camera._config_lock:
+                        value_obj.set_value(value)
+                    camera.set_config(config, self.context)
+                except self.gp.GPhoto2Error:
+                    camera._config = None  # cache no longer matches camera
+                    raise
+
+    def apply_config(self, settings, camera_id=None):
+        """ Apply several settings at once
+
+        Each camera gets a single config write, and the cameras are
+        written in parallel.
+
+        Parameters
+        ---------
+        settings : dict
+            Config name to value
+        camera_id : enum
+            Camera to configure, or None for all cameras
+
+        Returns
+        -------
+        Array
+            Previous values of the changed settings, one dict per camera
+        """
+        cameras = self._select_cameras(camera_id)
+        return self.pool.map(
+            lambda camera: self._apply_config(settings, camera), cameras)
+
+    def _apply_config(self, settings, camera):
+        old_settings = {}
+        with camera._lock:
+            config = self._cached_config(camera)
+            for name, value in settings.items():
+                value_obj = self._get_config_obj(config, name)
+                if value_obj:
+                    old_settings[name] = value_obj.get_value()
+                    try:
+                        with camera._config_lock:
+                            value_obj.set_value(value)
+                    except self.gp.GPhoto2Error:
+                        camera._config = None
+                        raise
+            if old_settings:
+                try:
+                    camera.set_config(config, self.context)
+                except self.gp.GPhoto2Error:
+                    camera._config = None
+                    raise
+        return old_settings
+
+    def read_exif(self, image):
+        """ Read focal length, shutter speed, aperture and ISO
+
+        Stats the image does not record are left out.
+
+        Parameters
+        ---------
+        image : str or bytes
+            Path of the image, or the image data itself
+        """
+        meta = exif.read_exif(image)
+
+        stats_dict = {}
+        if meta.focal_length is not None:
+            stats_dict['focallength'] = '{} mm'.format(meta.focal_length)
+        if meta.exposure_time is not None:
+            stats_dict['shutterspeed'] = '{} sec'.format(meta.exposure_time)
+        if meta.f_number is not None:
+            stats_dict['aperture'] = '{:g}'.format(float(meta.f_number))
+        if meta.iso is not None:
+            stats_dict['iso'] = '{}'.format(meta.iso)
+        return stats_dict
+
+    def process_stats(self, image, camera):
+        # Settings of this image from its EXIF, the cached config otherwise
+        stats = ['focallength', 'shutterspeed', 'aperture', 'iso',
+                 'imageformat']
+        stats_dict = self.read_exif(image)
         for stat in stats:
-            value = self._get_config(stat, camera)
-            stats_dict[stat] = value
+            if stat not in stats_dict:
+                stats_dict[stat] = self._get_config(stat, camera)
 
         return stats_dict
 
     def capture_previews(self):
         #Save current resolution setting
-        old_image_settings = []
-        for camera in self.cameras:
-            old_image_settings.append(self._get_config(
-                "imageformat", camera))
-            self._set_config("imageformat", "Small Normal JPEG", camera)
+        old_image_settings = self.apply_config(
+            {"imageformat": "Small Normal JPEG"})
 
         #Call a normal capture
-        image_paths, img_stats = self.capture_images("/tmp/","preview_" + str(time.time()))
-
-        #Restore old resolution setting
-        for camera, old_image_setting in zip(self.cameras,old_image_settings):
-            self._set_config("imageformat", old_image_setting, camera)
+        try:
+            image_paths, img_stats = self.capture_images(
+                "/tmp/", "preview_" + str(time.time()))
+        finally:
+            #Restore old resolution setting
+            self.pool.starmap(self._apply_config, zip(
+                old_image_settings, self._select_cameras()))
 
         return image_paths, img_stats
 
+    def capture_preview_frames(self):
+        """ Grab a live-view frame from all cameras, without the shutter.
+
+        Returns
+        -------
+        Array : JPEG bytes, one frame per camera slot
+        """
+        return self.pool.map(self.preview_frame_thread, self.cameras)
+
+    def preview_frame_thread(self, camera):
+        with camera._lock:
+            cfile = camera.capture_preview(self.context)
+        return bytes(memoryview(cfile.get_data_and_size()))
+
+    def end_preview_frames(self):
+        """ Leave live-view mode, so the mirrors drop and screens go dark."""
+        self.apply_config({"viewfinder": 0})
 
     def capture_images(self, storage_path, filename_base=None):
-        """ Capture images on both the cameras
+        """ Capture images on all the cameras
         The files will stored as below
             storage_path
                 LEFT
@@ -210,19 +554,110 @@ class StereoCamera():
 
         Returns
         -------
-        Array : [Left camera filename, Right camera filename]
+        Array : filename per camera slot, e.g. [Left, Right]
         """
+        camera_onboard_paths = self.trigger_images()
+        return self.transfer_images(camera_onboard_paths, storage_path,
+                                    filename_base)
+
+    def trigger_images(self):
+        """ Capture the images to the camera internal memory cards.
+
+        Both camera threads wait on a barrier right before triggering, so
+        the shutters fire as close together as possible.
 
-        # PART ONE: capture the images to the camera internal memory card.
+        Returns
+        -------
+        Array : TriggerResult per camera slot
+        """
         timer = time.time()
 
-        # Spin threads to capture images
-        camera_onboard_paths = self.pool.map(
-            self.capture_image_thread, self.cameras)
+        if self.capture_mode == 'event':
+            triggers = self.trigger_images_events()
+        else:
+            # Spin threads to capture images
+            barrier = threading.Barrier(len(self.cameras),
+                                        timeout=self.BARRIER_TIMEOUT)
+            triggers = self.pool.map(
+                lambda camera: self.capture_image_thread(camera, barrier),
+                self.cameras)
+
+        elapsed = time.time() - timer
+        logger.debug("Capture Process took: {:f} seconds.".format(elapsed))
+        metrics.registry.observe('trigger', elapsed)
+        skew = self.trigger_skew(triggers)
+        logger.debug("Trigger skew: {:f} seconds.".format(skew))
+        metrics.registry.observe('trigger_skew', skew)
+        metrics.registry.increment('pairs_triggered')
+
+        return triggers
+
+    def trigger_images_events(self):
+        """ Trigger all cameras and wait for their files from one loop.
+
+        The triggers fire together from the camera threads, lined up on a
+        barrier as in the blocking mode. After that no thread is blocked
+        inside libgphoto2 per camera. As soon as a camera reports its file,
+        its download is started on `transfer_pool`.
+
+        Returns
+        -------
+        Array : TriggerResult per camera, with `download` set
+        """
+        # Drop stale events on all cameras first, so only this capture's
+        # files are matched and the triggers below fire together
+        self.pool.map(self.drain_events_thread, self.cameras)
+        barrier = threading.Barrier(len(self.cameras),
+                                    timeout=self.BARRIER_TIMEOUT)
+        starts = self.pool.map(
+            lambda camera: self.trigger_capture_thread(camera, barrier),
+            self.cameras)
+
+        triggers = [None] * len(self.cameras)
+        deadline = time.monotonic() + self.EVENT_TIMEOUT
+        while None in triggers:
+            if time.monotonic() > deadline:
+                raise Exception("Timed out waiting for captured files")
+            for idx, camera in enumerate(self.cameras):
+                if triggers[idx] is not None:
+                    continue
+                with camera._lock:
+                    event_type, event_data = camera.wait_for_event(
+                        self.EVENT_POLL_MS, self.context)
+                if event_type == self.gp.GP_EVENT_FILE_ADDED:
+                    end = time.monotonic()
+                    logger.debug("File path: {}/{}".format(
+                        event_data.folder, event_data.name))
+                    download = self.transfer_pool.apply_async(
+                        self.download_image, (camera, event_data))
+                    triggers[idx] = TriggerResult(event_data, starts[idx],
+                                                  end, download)
+        return triggers
+
+    @staticmethod
+    def trigger_skew(triggers):
+        """ Spread of the trigger start times in seconds."""
+        starts = [trigger.start for trigger in triggers]
+        return max(starts) - min(starts)
+
+    def transfer_images(self, triggers, storage_path, filename_base=None):
+        """ Transfer previously triggered images and extract their stats.
+
+        Runs on `transfer_pool`, so it can overlap with `trigger_images`
+        for the next pair.
 
-        logger.debug("Capture Process took: {:f} seconds.".format(
-            time.time() - timer))
+        Parameters
+        ---------
+        triggers : list
+            TriggerResults as returned by `trigger_images`
+        storage_path : str
+            Location where the files will be stored
+        filename_base : str
 
+        Returns
+        -------
+        tuple : (filename per camera slot, stats per camera slot)
+        """
         logger.info("Tranfering...")
         # PART TWO: transfer the images from the camera
         timer = time.time()
@@ -244,57 +679,215 @@ class StereoCamera():
             file_path = os.path.join(camera_dir, filename)
             stored_file_paths.append(file_path)
 
-        get_image_args = list(
-            zip(*(self.cameras, camera_onboard_paths, stored_file_paths)))
+        camera_onboard_paths = [trigger.path for trigger in triggers]
+        downloads = [None if trigger.download is None
+                     else trigger.download.get() for trigger in triggers]
+        get_image_args = list(zip(*(self.cameras, camera_onboard_paths,
+                                    stored_file_paths, downloads)))
 
-        self.pool.starmap(
+        copied = self.transfer_pool.starmap(
             self.copy_image_thread, get_image_args)
+        image_data = [data for data, checksum in copied]
 
-        logger.debug("Transfer Process took: {:f} seconds.".format(
-            time.time() - timer))
+        elapsed = time.time() - timer
+        logger.debug("Transfer Process took: {:f} seconds.".format(elapsed))
+        metrics.registry.observe('transfer', elapsed)
 
         # PART THREE: Extract Stats from Camera and EXIF
         timer = time.time()
 
-        stats_args = zip(stored_file_paths,self.cameras) #args to call process_stats()
-        image_stats = self.pool.starmap(self.process_stats,stats_args) #thread process_stats()
-
-        logger.debug("Stats Extraction took: {:f} seconds.".format(
-            time.time() - timer))
+        if self.in_memory:
+            image_sources = image_data
+        else:
+            image_sources = stored_file_paths
+        stats_args = zip(image_sources,self.cameras) #args to call process_stats()
+        image_stats = self.transfer_pool.starmap(self.process_stats,stats_args) #thread process_stats()
+        skew = self.trigger_skew(triggers)
+        for stats, trigger in zip(image_stats, triggers):
+            stats['trigger_start'] = trigger.start
+            stats['trigger_end'] = trigger.end
+            stats['trigger_skew'] = skew
+        for stats, (data, checksum) in zip(image_stats, copied):
+            stats['checksum'] = checksum
+            stats['checksum_type'] = self.CHECKSUM
+
+        elapsed = time.time() - timer
+        logger.debug("Stats Extraction took: {:f} seconds.".format(elapsed))
+        metrics.registry.observe('stats', elapsed)
+
+        # PART FOUR: Single write of the in-memory images to storage
+        if self.in_memory:
+            timer = time.time()
+            self.transfer_pool.starmap(
+                self.write_image, zip(stored_file_paths, image_data))
+            elapsed = time.time() - timer
+            logger.debug("Storage Write took: {:f} seconds.".format(elapsed))
+            metrics.registry.observe('storage_write', elapsed)
+
+        self.last_image_data = image_data
+        self._last_transfer = (stored_file_paths, image_data)
 
         return stored_file_paths, image_stats
 
-    def capture_image_thread(self, camera):
+    def image_data(self, stored_file_paths):
+        """ Bytes of the images transferred to `stored_file_paths`.
+
+        Returns
+        -------
+        list : bytes per image, None when not kept in memory or when a
+            later transfer replaced them
+        """
+        paths, image_data = self._last_transfer
+        if list(paths) != list(stored_file_paths):
+            return [None] * len(stored_file_paths)
+        return image_data
+
+    def capture_image_thread(self, camera, barrier=None):
         """ Trigger image capture
         Parameters
         ----------
         camera : camera_object
+        barrier : threading.Barrier
+            Waited on right before triggering, to line up the cameras
 
         Returns
         -------
-        str : The path of the captured image on the camera
+        TriggerResult : The path of the captured image on the camera and
+            the trigger timestamps
         """
         logger.debug("Triggering image capture on {} camera".format(
             camera._camera_name))
-        file_path = camera.capture(gp.GP_CAPTURE_IMAGE, self.context)
+        with camera._lock:
+            if barrier is not None:
+                barrier.wait()
+            start = time.monotonic()
+            file_path = camera.capture(self.gp.GP_CAPTURE_IMAGE, self.context)
+            end = time.monotonic()
         logger.debug(
             "File path: {}/{}".format(file_path.folder, file_path.name))
-        return file_path
+        return TriggerResult(file_path, start, end)
+
+    def drain_events_thread(self, camera):
+        """ Discard the pending events of a camera."""
+        with camera._lock:
+            event_type = None
+            while event_type != self.gp.GP_EVENT_TIMEOUT:
+                event_type, event_data = camera.wait_for_event(
+                    0, self.context)
+
+    def trigger_capture_thread(self, camera, barrier=None):
+        """ Fire the shutter without waiting for the file
 
-    def copy_image_thread(self, camera, camera_file_path, storage_file_path):
+        Parameters
+        ----------
+        camera : camera_object
+        barrier : threading.Barrier
+            Waited on right before triggering, to line up the cameras
+
+        Returns
+        -------
+        float : `time.monotonic` timestamp of the trigger
+        """
+        logger.debug("Triggering image capture on {} camera".format(
+            camera._camera_name))
+        with camera._lock:
+            if barrier is not None:
+                barrier.wait()
+            start = time.monotonic()
+            camera.trigger_capture(self.context)
+        return start
+
+    def copy_image_thread(self, camera, camera_file_path, storage_file_path,
+                          download=None):
         """ Capture image on single camera
         Parameters
         ----------
         camera : camera_object
         camera_file_path : path of the image on the camera
         storage_file_path : file location to save
+        download : tuple
+            (data, checksum) of an already downloaded image, if any
+
+        Returns
+        -------
+        tuple : (data, checksum). The data is only kept if `in_memory` is
+            set, otherwise the image is saved to `storage_file_path` and
+            data is None
+        """
+        if download is not None:
+            data, checksum = download
+            if not self.in_memory:
+                self.write_image(storage_file_path, data)
+                data = None
+        elif self.in_memory:
+            data, checksum = self.download_image(camera, camera_file_path)
+        else:
+            with open(storage_file_path, 'wb') as f:
+                checksum = self.stream_image(camera, camera_file_path, f)
+            data = None
+        return data, checksum
+
+    def download_image(self, camera, camera_file_path):
+        """ Download an image into memory
+
+        Returns
+        -------
+        tuple : (data, checksum)
+        """
+        buf = io.BytesIO()
+        checksum = self.stream_image(camera, camera_file_path, buf)
+        return buf.getvalue(), checksum
+
+    def stream_image(self, camera, camera_file_path, out):
+        """ Read an image off the camera in chunks into `out`.
+
+        The checksum is updated as the chunks arrive, so the file never has
+        to be read again to verify it.
+
+        Returns
+        -------
+        str : hex digest of the image, see `CHECKSUM`
         """
-        cfile = camera.file_get(camera_file_path.folder, camera_file_path.name,
-                                gp.GP_FILE_TYPE_NORMAL, self.context)
-        cfile.save(storage_file_path)
+        digest = hashlib.new(self.CHECKSUM)
+        folder, name = camera_file_path.folder, camera_file_path.name
+        # Only the USB commands hold the camera, a chunk at a time, so the
+        # next trigger can go in between
+        with camera._lock:
+            size = camera.file_get_info(folder, name, self.context).file.size
+        buf = bytearray(self.CHUNK_SIZE)
+        view = memoryview(buf)
+        offset = 0
+        while offset < size:
+            with camera._lock:
+                try:
+                    count = camera.file_read(folder, name,
+                                             self.gp.GP_FILE_TYPE_NORMAL, offset,
+                                             buf, self.context)
+                except self.gp.GPhoto2Error:
+                    if offset > 0:
+                        raise
+                    # Driver without partial reads, fetch in one go
+                    cfile = camera.file_get(folder, name,
+                                            self.gp.GP_FILE_TYPE_NORMAL,
+                                            self.context)
+                    chunk = memoryview(cfile.get_data_and_size())
+                    count = len(chunk)
+                else:
+                    chunk = view[:count]
+            if count == 0:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            offset += count
+        return digest.hexdigest()
+
+    def write_image(self, storage_file_path, image_data):
+        with open(storage_file_path, 'wb') as f:
+            f.write(image_data)
 
     def disconnect(self):
         for cam in self.cameras:
             if(cam is not None):
+                cam._config = None
                 cam.exit(self.context)
-                cam = None
+        self.cameras = [None] * len(self.rig)
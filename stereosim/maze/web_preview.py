@@ -1,20 +1,147 @@
 """Web Server Framework"""
-from flask import Flask, jsonify, render_template, request, send_file
+from flask import Flask, Response, jsonify, render_template, request, send_file
+import functools
+import io
+import json
 import logging
 import os
 import sys
+import threading
+import time
+from multiprocessing.dummy import Pool as ThreadPool
 from multiprocessing.managers import BaseManager
+from stereosim.maze import events, framebuffer
 app = Flask(__name__)
 log = logging.getLogger("werkzeug")
 log.setLevel(logging.ERROR)
 
 
+class MazeClient(object):
+    """
+    Long-lived connection to the MAZE manager shared by all requests
+
+    Manager proxies open one connection per calling thread, and Flask runs
+    every request on a new thread. Calls are therefore run on a small pool
+    of threads that each keep their proxy, and each reconnect once when
+    the MAZE process was restarted.
+
+    Long-polls would hold a pooled connection for their whole timeout, so
+    `long_poll` runs them on a second pool of threads and connections of
+    their own.
+
+    Attributes
+    ----------
+    address : tuple
+    pool_size : int
+        Number of connections, i.e. of concurrent calls
+    poll_size : int
+        Number of long-poll connections, further long-polls wait for one
+    """
+
+    def __init__(self, address=('', 50000), authkey=b'abc', pool_size=4,
+                 poll_size=4):
+        self.address = address
+        self.authkey = authkey
+        self.pool_size = pool_size
+        self.poll_size = poll_size
+        self._pool = None
+        self._poll_pool = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        BaseManager.register('get_maze')
+
+    def _proxy(self):
+        maze = getattr(self._local, 'maze', None)
+        if maze is None:
+            manager = BaseManager(address=self.address, authkey=self.authkey)
+            manager.connect()
+            maze = self._local.maze = manager.get_maze()
+        return maze
+
+    def _call(self, name, args, kwargs):
+        try:
+            return getattr(self._proxy(), name)(*args, **kwargs)
+        except (ConnectionError, EOFError):
+            log.warning("Lost MAZE connection, reconnecting")
+            self._local.maze = None
+            return getattr(self._proxy(), name)(*args, **kwargs)
+
+    def call(self, name, *args, **kwargs):
+        """ Call `name` on the MAZE object over a pooled connection."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.pool_size)
+        return self._pool.apply(self._call, (name, args, kwargs))
+
+    def long_poll(self, name, *args, **kwargs):
+        """ Call `name` over a long-poll connection, for calls that wait
+        for news and would otherwise hold a connection of `call`.
+        """
+        with self._lock:
+            if self._poll_pool is None:
+                self._poll_pool = ThreadPool(self.poll_size)
+        return self._poll_pool.apply(self._call, (name, args, kwargs))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return functools.partial(self.call, name)
+
+
+# Seconds a client may ask a long-poll to wait, and the number of client
+# long-polls waiting at once; further ones return right away
+MAX_POLL_TIMEOUT = 30
+MAX_CLIENT_POLLS = 16
+_client_polls = threading.BoundedSemaphore(MAX_CLIENT_POLLS)
+# One long-poll connection per client long-poll, and one for the relay
+maze_client = MazeClient(poll_size=MAX_CLIENT_POLLS + 1)
+frame_buffer = None
+_frame_buffer_lock = threading.Lock()
+event_bus = events.EventBus()
+_relay_lock = threading.Lock()
+_relay_thread = None
+
+
 def get_maze():
-    BaseManager.register('get_maze')
-    manager = BaseManager(address=('', 50000), authkey=b'abc')
-    manager.connect()
-    maze = manager.get_maze()
-    return maze
+    return maze_client
+
+
+def get_frame_buffer():
+    """ Latest-frame buffer of the MAZE process, None until it exists.
+
+    Attached again when MAZE was restarted or disconnected, which replaces
+    or removes the block.
+    """
+    global frame_buffer
+    with _frame_buffer_lock:
+        if frame_buffer is not None and frame_buffer.stale():
+            log.info("Preview frame buffer replaced, attaching again")
+            # Not closed here, requests may still be reading it; the
+            # mapping goes away with the last reference
+            frame_buffer = None
+        if frame_buffer is None:
+            try:
+                name = maze_client.get_frame_buffer_name()
+                if name is None:
+                    return None
+                frame_buffer = framebuffer.FrameBuffer.attach(name)
+            except (FileNotFoundError, ConnectionError, EOFError):
+                return None
+        return frame_buffer
+
+
+def buffered_frame(index=None):
+    """ (sequence, frame, stats) from the frame buffer, sequence 0 if
+    nothing was published yet. Only the stats are read if `index` is None.
+    """
+    buf = get_frame_buffer()
+    if buf is None:
+        return 0, None, None
+    if index is None:
+        seq, frames, stats = buf.read([])
+        return seq, None, stats
+    seq, frames, stats = buf.read([index])
+    return seq, frames[index], stats
 
 
 @app.route('/')
@@ -25,6 +152,10 @@ def index():
 
 @app.route('/refresh_preview', methods=['POST'])
 def refresh_preview():
+    buf = get_frame_buffer()
+    seq = 0 if buf is None else buf.sequence
+    if seq:
+        return jsonify({'image_hash': seq})
     maze = get_maze()
     images = maze.get_last_images()
     image_hash = hash(tuple(images))
@@ -34,14 +165,29 @@ def refresh_preview():
 
 @app.route('/get_stats', methods=['POST'])
 def get_stats():
+    seq, frame, stats = buffered_frame()
+    if seq:
+        return jsonify({'stats': stats})
     maze = get_maze()
     stats = maze.get_stats()
     return jsonify({'stats' : stats})
 
 
+@app.route('/metrics')
+def get_metrics():
+    maze = get_maze()
+    return jsonify(maze.get_metrics())
+
+
 @app.route('/leftImg.jpg')
 def leftImg():
+    seq, frame, stats = buffered_frame(0)
+    if frame is not None:
+        return send_file(io.BytesIO(frame), mimetype='image/jpeg')
     maze = get_maze()
+    image_data = maze.get_last_image_data(0)
+    if(image_data is not None):
+        return send_file(io.BytesIO(image_data), mimetype='image/jpeg')
     image_left, image_right = maze.get_last_images()
     if(image_left is not None):
         return send_file(image_left, mimetype='image/jpeg')
@@ -51,7 +197,13 @@ def leftImg():
 
 @app.route('/rightImg.jpg')
 def rightImg():
+    seq, frame, stats = buffered_frame(1)
+    if frame is not None:
+        return send_file(io.BytesIO(frame), mimetype='image/jpeg')
     maze = get_maze()
+    image_data = maze.get_last_image_data(1)
+    if(image_data is not None):
+        return send_file(io.BytesIO(image_data), mimetype='image/jpeg')
     image_left, image_right = maze.get_last_images()
     if(image_right is not None):
         return send_file(image_right, mimetype='image/jpeg')
@@ -59,6 +211,157 @@ def rightImg():
         return jsonify({'image_left': image_left, 'image_right': image_right})
 
 
+@app.route('/start_liveview', methods=['POST'])
+def start_liveview():
+    maze = get_maze()
+    fps = request.form.get('fps', type=float)
+    maze.start_liveview(fps)
+    return jsonify({'liveview': True})
+
+
+@app.route('/stop_liveview', methods=['POST'])
+def stop_liveview():
+    maze = get_maze()
+    maze.stop_liveview()
+    return jsonify({'liveview': False})
+
+
+@app.route('/jobs', methods=['GET', 'POST'])
+def jobs():
+    maze = get_maze()
+    if request.method == 'POST':
+        job = request.get_json(force=True)
+        try:
+            job_id = maze.submit_job(job['kind'], *job.get('args', []),
+                                     **job.get('kwargs', {}))
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'job_id': job_id})
+    return jsonify({'jobs': maze.job_status()})
+
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    maze = get_maze()
+    try:
+        return jsonify(maze.job_status(job_id))
+    except KeyError:
+        return jsonify({'error': 'unknown job'}), 404
+
+
+@app.route('/jobs/<int:job_id>/results')
+def job_results(job_id):
+    """ Step results from `since` on, long-polling up to `timeout` s."""
+    maze = get_maze()
+    since = request.args.get('since', 0, type=int)
+    timeout = request.args.get('timeout', 0, type=float)
+    timeout = min(max(timeout, 0), MAX_POLL_TIMEOUT)
+    try:
+        if timeout and _client_polls.acquire(blocking=False):
+            try:
+                results = maze.long_poll('job_results', job_id, since,
+                                         timeout)
+            finally:
+                _client_polls.release()
+        else:
+            results = maze.job_results(job_id, since, 0)
+    except KeyError:
+        return jsonify({'error': 'unknown job'}), 404
+    return jsonify({'results': results, 'next': since + len(results)})
+
+
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    maze = get_maze()
+    try:
+        maze.cancel_job(job_id)
+    except KeyError:
+        return jsonify({'error': 'unknown job'}), 404
+    return jsonify(maze.job_status(job_id))
+
+
+def relay_events():
+    """ Mirror the MAZE events into `event_bus`.
+
+    A single long-poll to the MAZE process serves every connected
+    browser.
+    """
+    since = 0
+    while True:
+        try:
+            new_events = maze_client.long_poll('get_events', since, 15)
+        except Exception:
+            log.exception("Event Relay Failed")
+            time.sleep(1)
+            continue
+        for event in new_events:
+            event_bus.publish(event['kind'], event['data'])
+        if new_events:
+            since = new_events[-1]['id']
+
+
+def start_relay():
+    global _relay_thread
+    with _relay_lock:
+        if _relay_thread is None:
+            _relay_thread = threading.Thread(target=relay_events)
+            _relay_thread.daemon = True
+            _relay_thread.start()
+
+
+def event_stream(since):
+    """ Server-sent events stream of `event_bus` after id `since`."""
+    while True:
+        new_events = event_bus.get_events(since, timeout=15)
+        if not new_events:
+            yield ': keep-alive\n\n'
+            continue
+        for event in new_events:
+            yield 'id: {}\nevent: {}\ndata: {}\n\n'.format(
+                event['id'], event['kind'],
+                json.dumps(event['data'], default=str))
+        since = new_events[-1]['id']
+
+
+@app.route('/events')
+def stream_events():
+    start_relay()
+    # Browsers send the last id they saw when they reconnect
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = event_bus.last_id
+    return Response(event_stream(since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+def live_stream(index, fps):
+    """ Multipart MJPEG stream of one camera's live-view frames."""
+    maze = get_maze()
+    last_seq = None
+    while True:
+        timer = time.time()
+        seq, frame = maze.get_live_frame(index)
+        if frame is not None and seq != last_seq:
+            last_seq = seq
+            yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' +
+                   frame + b'\r\n')
+        time.sleep(max(0, 1.0 / fps - (time.time() - timer)))
+
+
+@app.route('/live/left.mjpg')
+def liveLeft():
+    fps = request.args.get('fps', 5, type=float)
+    return Response(live_stream(0, fps),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+@app.route('/live/right.mjpg')
+def liveRight():
+    fps = request.args.get('fps', 5, type=float)
+    return Response(live_stream(1, fps),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
 def startServer():
     try:
         os.remove('flask.log')
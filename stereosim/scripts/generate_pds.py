@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
 from stereosim.compute_coordinates import compute_coordinates
 from stereosim.camera_orientation import CAHVmodel
+from stereosim.maze import exif
 import numpy as np
 from planetaryimage import PDS3Image
 from PIL import Image
-import exifread
 import argparse
 import os.path
 import yaml
@@ -208,9 +208,7 @@ class PDSGenerator(object):
         pds_date: string
             Image acquisition time in PDS format
         """
-        with open(filepath, 'rb') as f:
-            meta = exifread.process_file(f, details=False)
-        date = '{}'.format(meta['EXIF DateTimeOriginal'])
+        date = exif.read_exif(filepath).date_time_original
         print('date exif format:', date)
 
         # Identify parts of the date for PDS application
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+from stereosim.maze import benchmark, metrics
+
+
+def _results(pairs_per_minute=60.0, transfer=0.5, rss=100000):
+    return {'profile': 'usb2', 'pairs': 10, 'scenarios': {
+        'bulk': {'pairs': 10, 'duration': 10.0,
+                 'pairs_per_minute': pairs_per_minute,
+                 'phases': {'transfer': {'count': 10, 'mean': transfer,
+                                         'p50': transfer, 'p95': transfer,
+                                         'max': transfer}},
+                 'counters': {'pairs_captured': 10},
+                 'peak_rss_kb': rss}}}
+
+
+def test_run_scenario_counts_pairs():
+    def scenario():
+        with metrics.registry.timer('trigger'):
+            time.sleep(0.01)
+        metrics.registry.increment('pairs_captured', 3)
+    result = benchmark.run_scenario(scenario)
+    assert result['pairs'] == 3
+    assert result['pairs_per_minute'] > 0
+    assert result['phases']['trigger']['count'] == 1
+    assert result['peak_rss_kb'] > 0
+    assert benchmark.run_scenario(lambda: None, 5)['pairs'] == 5
+
+
+def test_compare_unchanged():
+    assert benchmark.compare(_results(), _results()) == []
+    # Within tolerance
+    assert benchmark.compare(_results(56.0, 0.53, 105000), _results()) == []
+
+
+def test_compare_flags_regressions():
+    regressions = benchmark.compare(_results(40.0, 0.8, 150000), _results())
+    metrics_flagged = sorted(r['metric'] for r in regressions)
+    assert metrics_flagged == ['pairs_per_minute', 'peak_rss_kb',
+                               'transfer.mean', 'transfer.p95']
+    throughput = [r for r in regressions
+                  if r['metric'] == 'pairs_per_minute'][0]
+    assert throughput['scenario'] == 'bulk'
+    assert abs(throughput['change'] + 1 / 3.0) < 1e-9
+    assert 'REGRESSION bulk' in benchmark.format_results(
+        _results(40.0, 0.8, 150000), regressions)
+
+
+def test_compare_ignores_small_and_missing():
+    # Doubled, but by less than min_delta seconds
+    assert benchmark.compare(_results(transfer=0.002),
+                             _results(transfer=0.001)) == []
+    results = _results()
+    del results['scenarios']['bulk']
+    assert benchmark.compare(results, _results()) == []
+
+
+def test_skipped_scenario():
+    results = _results()
+    results['scenarios']['pds'] = {'skipped': 'No module named numpy'}
+    baseline = _results()
+    baseline['scenarios']['pds'] = _results()['scenarios']['bulk']
+    assert benchmark.compare(results, baseline) == []
+    assert 'pds                skipped: No module named numpy' in \
+        benchmark.format_results(results)
+
+
+def test_peak_rss_per_scenario():
+    if not benchmark.reset_peak_rss():
+        return
+    grown = benchmark.run_scenario(lambda: bytearray(200 * 1024 ** 2), 1)
+    after = benchmark.run_scenario(lambda: None, 1)
+    assert grown['peak_rss_kb'] - after['peak_rss_kb'] > 100 * 1024
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+from stereosim.maze.events import EventBus
+
+
+def test_get_events_since():
+    bus = EventBus(history=3)
+    for angle in range(5):
+        bus.publish('ptu', {'angle': (angle, 0)})
+    events = bus.get_events(0)
+    # Only the most recent events are kept
+    assert [event['id'] for event in events] == [3, 4, 5]
+    assert bus.get_events(4)[0]['data'] == {'angle': (4, 0)}
+    assert bus.get_events(5, timeout=0.01) == []
+
+
+def test_get_events_waits():
+    bus = EventBus()
+    timer = threading.Timer(0.05, bus.publish, ('capture',))
+    timer.start()
+    events = bus.get_events(0, timeout=5)
+    assert [event['kind'] for event in events] == ['capture']
+
+
+def test_restarted_source():
+    bus = EventBus()
+    bus.publish('stats', [{}, {}])
+    # A client still holding an id of the previous run gets everything
+    assert len(bus.get_events(42, timeout=0)) == 1
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+from fractions import Fraction
+from stereosim.maze import exif, simulator
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data/')
+filename_right = os.path.join(DATA_DIR, 'IMG_0494.JPG')
+filename_nolabel = os.path.join(DATA_DIR, 'IMG_0608.JPG')
+
+
+def test_read_exif_from_file():
+    meta = exif.read_exif(filename_right)
+    assert meta.focal_length == 100
+    assert meta.exposure_time == Fraction(1, 125)
+    assert str(meta.exposure_time) == '1/125'
+    assert float(meta.f_number) == 5.6
+    assert meta.iso == 1000
+    assert meta.date_time_original == '2016:05:02 14:21:24'
+    assert meta.model == 'Canon EOS D60'
+
+
+def test_read_exif_from_bytes():
+    with open(filename_nolabel, 'rb') as f:
+        data = f.read()
+    assert exif.read_exif(data) == exif.read_exif(filename_nolabel)
+    assert exif.read_exif(data).date_time_original == '2016:05:02 14:22:00'
+
+
+def test_read_exif_header_only():
+    # The EXIF header alone is enough, no image data is needed
+    with open(filename_right, 'rb') as f:
+        data = f.read(64 * 1024)
+    assert exif.read_exif(data) == exif.read_exif(filename_right)
+
+
+def test_read_exif_missing():
+    meta = exif.read_exif(b'\xff\xd8\xff\xda\x00\x02')
+    assert meta == exif.ExifRecord(None, None, None, None, None, None)
+
+
+def test_read_exif_truncated():
+    data = simulator.make_jpeg(
+        64, 48, exif=simulator.make_exif('EOS', Fraction(100), Fraction(1, 200),
+                                         Fraction(8), 400,
+                                         '2020:01:02 03:04:05'))
+    # Cut anywhere in the APP1 segment, e.g. by a partial transfer
+    for size in range(len(data)):
+        meta = exif.read_exif(data[:size])
+        assert meta.focal_length in (None, 100)
+    assert exif.read_exif(data).focal_length == 100
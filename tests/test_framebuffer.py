@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import time
+import pytest
+from stereosim.maze import framebuffer, metrics
+from stereosim.maze.framebuffer import FrameBuffer, PreviewPublisher
+
+
+@pytest.fixture
+def buffers():
+    writer = FrameBuffer.create(count=2, frame_size=1024, stats_size=256,
+                                name='stereosim_preview_test')
+    reader = FrameBuffer.attach(name='stereosim_preview_test')
+    yield writer, reader
+    reader.close()
+    writer.close()
+    writer.unlink()
+
+
+def test_publish_read(buffers):
+    writer, reader = buffers
+    assert reader.read() == (0, [None, None], None)
+    assert (reader.count, reader.frame_size) == (2, 1024)
+
+    writer.publish([b'left', b'right'], [{'iso': 100}, {'iso': 200}])
+    assert reader.read() == (2, [b'left', b'right'],
+                             [{'iso': 100}, {'iso': 200}])
+    seq, frames, stats = reader.read([1])
+    assert frames == [None, b'right']
+
+
+def test_oversized_frame_dropped(buffers):
+    writer, reader = buffers
+    writer.publish([b'x' * 2048, b'right'])
+    assert reader.read()[1] == [None, b'right']
+
+
+def test_reader_waits_for_writer(buffers):
+    writer, reader = buffers
+    writer.publish([b'left', b'right'])
+    # A write in progress leaves an odd sequence number
+    writer.shm.buf[0] = 3
+    with pytest.raises(TimeoutError):
+        reader.read(retries=3)
+
+
+def test_stale_after_restart(buffers):
+    writer, reader = buffers
+    assert not reader.stale()
+    # A restarted MAZE replaces the block of the same name
+    restarted = FrameBuffer.create(count=2, frame_size=1024, stats_size=256,
+                                   name='stereosim_preview_test')
+    try:
+        assert reader.stale()
+        current = FrameBuffer.attach(name='stereosim_preview_test')
+        assert not current.stale()
+        current.close()
+    finally:
+        writer.close()
+        # Closed and unlinked by the fixture
+        writer.shm = restarted.shm
+
+
+def test_concurrent_publish(buffers):
+    writer, reader = buffers
+    threads = [threading.Thread(target=lambda: [
+        writer.publish([b'left', b'right']) for i in range(200)])
+        for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert reader.read()[0] == 2 * 4 * 200
+
+
+def test_preview_publisher_reads_paths(buffers, tmpdir, monkeypatch):
+    writer, reader = buffers
+    monkeypatch.setattr(framebuffer, 'downscale', lambda data: data[:4])
+    path = tmpdir.join('right.jpg')
+    path.write_binary(b'right image')
+    published = []
+    publisher = PreviewPublisher(writer, listener=published.append)
+    publisher.submit([b'left image', str(path)], [{'iso': 100}, None])
+    assert publisher.flush(5)
+    assert reader.read() == (2, [b'left', b'righ'], [{'iso': 100}, None])
+    assert published == [2]
+    publisher.close()
+
+
+def test_preview_publisher_drops_stale(buffers, monkeypatch):
+    writer, reader = buffers
+
+    def slow_downscale(data):
+        time.sleep(0.05)
+        return data
+    monkeypatch.setattr(framebuffer, 'downscale', slow_downscale)
+    metrics.registry.reset()
+    publisher = PreviewPublisher(writer)
+    for x in range(5):
+        publisher.submit([str(x).encode(), None])
+    publisher.close()
+    seq, frames, stats = reader.read()
+    # The latest pair always makes it, the ones in between are skipped
+    assert frames == [b'4', None]
+    dropped = metrics.registry.snapshot()['counters']['preview_dropped']
+    assert dropped >= 3
+    assert seq == 2 * (5 - dropped)
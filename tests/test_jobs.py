@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import pytest
+from stereosim.maze.jobs import JobJournal, JobQueue
+
+
+@pytest.fixture
+def folder(tmpdir):
+    return str(tmpdir.join('jobs'))
+
+
+def test_resume_remaining(folder):
+    positions = [(0.0, 0.0), (15.0, 0.0), (30.0, 0.0), (30.0, -15.0)]
+    job = JobJournal.create(folder, 'mosaic', positions, {'pipelined': True})
+    job.record(0, ['a.jpg', 'b.jpg'])
+    job.record(2)
+
+    resumed = JobJournal.load(folder, job.job_id)
+    assert resumed.kind == 'mosaic'
+    assert resumed.params == {'pipelined': True}
+    assert resumed.completed == {0, 2}
+    assert resumed.remaining() == [(1, [15.0, 0.0]), (3, [30.0, -15.0])]
+    assert JobJournal.unfinished(folder) == [job.job_id]
+
+    resumed.record(1)
+    resumed.record(3)
+    assert resumed.done
+    assert JobJournal.unfinished(folder) == []
+
+
+def test_torn_journal_line(folder):
+    job = JobJournal.create(folder, 'bulk', range(3))
+    job.record(0)
+    with open(job.journal_path, 'a') as f:
+        f.write('{"step": 1, "res')  # crash while appending
+
+    resumed = JobJournal.load(folder, job.job_id)
+    assert resumed.completed == {0}
+    assert [index for index, step in resumed.remaining()] == [1, 2]
+
+    resumed.record(1)
+    assert JobJournal.load(folder, job.job_id).completed == {0, 1}
+
+
+def test_queue_results_and_cancel():
+    queue = JobQueue()
+    assert not queue.busy()
+    release = threading.Event()
+
+    def steps(count, task=None):
+        task.total = count
+        for index in range(count):
+            if task.cancelled:
+                break
+            release.wait()
+            task.add_result(index)
+        return 'report'
+
+    first = queue.submit('steps', steps, 3)
+    second = queue.submit('steps', steps, 3)
+    assert queue.get(second).status == 'queued'
+    assert queue.busy()
+    queue.cancel(second)
+
+    release.set()
+    results = []
+    while len(results) < 3:
+        results += queue.get(first).results_since(len(results), timeout=5)
+    queue.join()
+    assert results == [0, 1, 2]
+    assert queue.get(first).progress()['report'] == 'report'
+    assert [job['status'] for job in queue.list()] == ['done', 'cancelled']
+    assert queue.get(second).results == []
+    assert not queue.busy()
+
+
+def test_queue_failure():
+    queue = JobQueue()
+
+    def fail(task=None):
+        raise IOError('USB gone')
+
+    job_id = queue.submit('fail', fail)
+    queue.join()
+    progress = queue.get(job_id).progress()
+    assert progress['status'] == 'failed'
+    assert 'USB gone' in progress['error']
+    queue.close()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import yaml
+from fractions import Fraction
+from stereosim.maze import label, simulator
+
+
+def write_image(tmpdir, exif=None):
+    path = str(tmpdir.join('IMG_0001.JPG'))
+    with open(path, 'wb') as f:
+        f.write(simulator.make_jpeg(64, 48, exif=exif))
+    return path
+
+
+def read_label(image_path):
+    with open(label.label_path(image_path)) as f:
+        return yaml.safe_load(f)
+
+
+def test_parse_focal_length():
+    assert label._parse_focal_length('100 mm') == 100.0
+    assert label._parse_focal_length('473/10 mm') == 47.3
+    assert label._parse_focal_length('None mm') is None
+    assert label._parse_focal_length(None) is None
+
+
+def test_label_without_focal_length(tmpdir):
+    image_path = write_image(tmpdir)
+    label.create_label(image_path, 'Left', (1.0, 2.0),
+                       {'quat': [1.0, 0.0, 0.0, 0.0]},
+                       {'focallength': None})
+    contents = read_label(image_path)
+    assert contents['f'] is None
+    assert contents['AZIMUTH'] == 1.0
+
+
+def test_label_focal_length_from_exif(tmpdir):
+    exif = simulator.make_exif('EOS', Fraction(473, 10), Fraction(1, 200),
+                               Fraction(8), 400, '2020:01:02 03:04:05')
+    image_path = write_image(tmpdir, exif)
+    label.create_label(image_path, 'Left', (0.0, 0.0),
+                       {'quat': [1.0, 0.0, 0.0, 0.0]})
+    assert read_label(image_path)['f'] == 47.3
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+from stereosim.maze.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_percentiles():
+    hist = Histogram()
+    for value in range(1, 101):
+        hist.observe(float(value))
+    stats = hist.snapshot()
+    assert stats['count'] == 100
+    assert stats['p50'] == 51.0
+    assert stats['p95'] == 95.0
+    assert stats['max'] == 100.0
+    assert stats['mean'] == 50.5
+
+
+def test_histogram_empty():
+    stats = Histogram().snapshot()
+    assert stats['count'] == 0
+    assert stats['p50'] is None
+    assert stats['max'] is None
+
+
+def test_registry_timer_and_counters():
+    registry = MetricsRegistry()
+    with registry.timer('trigger'):
+        time.sleep(0.01)
+    registry.increment('pairs_captured')
+    registry.increment('pairs_captured')
+    snapshot = registry.snapshot()
+    assert snapshot['histograms']['trigger']['count'] == 1
+    assert snapshot['histograms']['trigger']['max'] >= 0.01
+    assert snapshot['counters'] == {'pairs_captured': 2}
+    registry.reset()
+    assert registry.snapshot() == {'histograms': {}, 'counters': {}}
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import time
+import pytest
+from stereosim.maze import simulator
+from stereosim.maze.pipeline import CapturePipeline, TransferError
+from stereosim.maze.stereo_camera import StereoCamera
+
+
+class SimulatedStereoCamera(object):
+    """Stands in for StereoCamera with fixed trigger and transfer latencies.
+    """
+
+    def __init__(self, trigger_time=0.02, transfer_time=0.06):
+        self.trigger_time = trigger_time
+        self.transfer_time = transfer_time
+        self.count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fail_on = None
+        self._lock = threading.Lock()
+
+    def trigger_images(self):
+        time.sleep(self.trigger_time)
+        with self._lock:
+            self.count += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return ['L{}'.format(self.count), 'R{}'.format(self.count)]
+
+    def transfer_images(self, onboard_paths, storage_path, filename_base):
+        time.sleep(self.transfer_time)
+        with self._lock:
+            self.in_flight -= 1
+        if filename_base == self.fail_on:
+            raise IOError("Simulated transfer failure")
+        saved = ['{}/{}_{}'.format(storage_path, p, filename_base)
+                 for p in onboard_paths]
+        return saved, [{'file': p} for p in saved]
+
+    def capture_images(self, storage_path, filename_base=None):
+        return self.transfer_images(self.trigger_images(), storage_path,
+                                    filename_base)
+
+
+def run_pipelined(cam, count, depth=2):
+    results = []
+    pipe = CapturePipeline(cam, depth=depth)
+    timer = time.time()
+    for x in range(count):
+        pipe.submit('/tmp', str(x),
+                    callback=lambda saved, stats: results.append(saved))
+    pipe.join()
+    elapsed = time.time() - timer
+    pipe.close()
+    return elapsed, results, pipe
+
+
+def test_pipeline_preserves_order():
+    cam = SimulatedStereoCamera(trigger_time=0.001, transfer_time=0.005)
+    elapsed, results, pipe = run_pipelined(cam, 10)
+    assert len(results) == 10
+    assert results[0] == ['/tmp/L1_0', '/tmp/R1_0']
+    assert results[-1] == ['/tmp/L10_9', '/tmp/R10_9']
+    assert pipe.errors == []
+
+
+@pytest.mark.parametrize('depth', [1, 2, 3])
+def test_pipeline_backpressure(depth):
+    cam = SimulatedStereoCamera(trigger_time=0.001, transfer_time=0.01)
+    run_pipelined(cam, 8, depth=depth)
+    assert cam.max_in_flight == depth
+
+
+@pytest.fixture
+def stereo_camera(tmpdir):
+    # The real camera locking, on simulated bodies with a slow USB link
+    backend = simulator.SimulatedGPhoto2(
+        profile={'capture_latency': 0.05, 'bandwidth': 40e6,
+                 'image_size': 4 * 1024 ** 2})
+    cam = StereoCamera(backend=backend)
+    cam.port_cache_path = str(tmpdir.join('cameras.ini'))
+    cam.reconnect()
+    yield cam
+    cam.disconnect()
+
+
+def test_pipeline_throughput(stereo_camera, tmpdir):
+    count = 6
+    storage = str(tmpdir)
+
+    def label(saved, stats):
+        # Labels and preview of a pair, off the USB
+        time.sleep(0.1)
+
+    timer = time.time()
+    for x in range(count):
+        label(*stereo_camera.capture_images(storage, 's{}'.format(x)))
+    serial = time.time() - timer
+    pipe = CapturePipeline(stereo_camera, depth=2)
+    timer = time.time()
+    for x in range(count):
+        pipe.submit(storage, 'p{}'.format(x), callback=label)
+    pipe.join()
+    pipelined = time.time() - timer
+    pipe.close()
+    assert pipe.errors == []
+    # The labels overlap the next pair, and the USB is not held for
+    # reading cached settings
+    assert pipelined < 0.8 * serial
+
+
+def test_pipeline_transfer_error():
+    cam = SimulatedStereoCamera(trigger_time=0.001, transfer_time=0.001)
+    cam.fail_on = '2'
+    pipe = CapturePipeline(cam)
+    results = []
+    for x in range(5):
+        pipe.submit('/tmp', str(x), callback=lambda saved, stats:
+                    results.append(saved))
+    with pytest.raises(TransferError) as raised:
+        pipe.join()
+    assert len(results) == 4
+    assert len(raised.value.errors) == 1
+    assert isinstance(raised.value.__cause__, IOError)
+    # Reported once, the next join only raises for new failures
+    pipe.submit('/tmp', '5')
+    pipe.join()
+    assert len(pipe.errors) == 1
+    pipe.close()
+
+
+def test_cached_config_skips_usb_lock(stereo_camera):
+    camera = stereo_camera.cameras[0]
+    assert stereo_camera._get_config('imageformat', camera) is not None
+    values = []
+    reader = threading.Thread(target=lambda: values.append(
+        stereo_camera._get_config('imageformat', camera)))
+    # A transfer holds the USB, cached settings are still readable
+    with camera._lock:
+        reader.start()
+        reader.join(1.0)
+        assert not reader.is_alive()
+    assert values[0] is not None
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+import time
+import numpy
+import pytest
+from stereosim.maze import planner
+
+
+def test_axis_time():
+    # Triangle profile: 2 * sqrt(1 / 100)
+    assert planner.SlewModel.axis_time(1, 50, 100) == pytest.approx(0.2)
+    # Trapezoid profile: 100 / 50 + 50 / 100
+    assert planner.SlewModel.axis_time(-100, 50, 100) == pytest.approx(2.5)
+    assert planner.SlewModel.axis_time(0, 50, 100) == 0
+
+
+def test_slew_time_slowest_axis():
+    model = planner.SlewModel(speed=(50, 10), accel=(100, 100), settle=0.5)
+    assert model.slew_time((0, 0), (0, 0)) == 0
+    assert model.slew_time((0, 0), (30, 30)) == pytest.approx(
+        0.5 + planner.SlewModel.axis_time(30, 10, 100))
+
+
+def test_slew_model_from_ptu():
+    model = planner.SlewModel.from_ptu((2000, 1000), (4000, 2000),
+                                       (90.0, 45.0))
+    assert model.speed == pytest.approx((50.0, 12.5))
+    assert model.accel == pytest.approx((100.0, 25.0))
+    # The factory settings, with the tilt axis at half the pan rate
+    default = planner.SlewModel()
+    assert default.speed[1] == pytest.approx(default.speed[0] / 2, rel=1e-3)
+
+
+def test_slew_model_learns_settle():
+    model = planner.SlewModel(speed=(50, 50), accel=(100, 100))
+    motion = model.slew_time((0, 0), (100, 0))
+    model.observe((0, 0), (100, 0), motion + 0.3)
+    model.observe((100, 0), (100, 0), 5.0)  # no motion, ignored
+    model.observe((100, 0), (0, 0), motion + 0.1)
+    assert model.settle == pytest.approx(0.2)
+    assert model.slew_time((0, 0), (100, 0)) == pytest.approx(motion + 0.2)
+
+
+def test_serpentine_order():
+    positions = [(0, 0), (15, 0), (30, 0), (0, -15), (15, -15), (30, -15)]
+    assert planner.serpentine_order(positions) == [
+        (0, 0), (15, 0), (30, 0), (30, -15), (15, -15), (0, -15)]
+
+
+def test_plan_mosaic_beats_given_order():
+    random.seed(4)
+    grid = [(az, el) for az in range(0, 120, 15) for el in range(-30, 31, 15)]
+    random.shuffle(grid)
+    model = planner.SlewModel()
+    ordered, estimate = planner.plan_mosaic(grid, model)
+    assert sorted(ordered) == sorted((float(az), float(el))
+                                     for az, el in grid)
+    assert estimate == pytest.approx(model.path_time(ordered))
+    assert estimate < 0.6 * model.path_time(grid)
+    assert estimate <= model.path_time(planner.serpentine_order(grid))
+
+
+def test_plan_mosaic_large_grid():
+    grid = planner.grid_positions((-90, 90), (-30, 30))
+    model = planner.SlewModel()
+    # A serpentine grid is kept as it is
+    ordered, estimate = planner.plan_mosaic(grid, model)
+    assert ordered == [tuple(pos) for pos in grid.tolist()]
+    shuffled = [tuple(pos) for pos in grid.tolist()]
+    random.seed(1)
+    random.shuffle(shuffled)
+    start = time.monotonic()
+    ordered, estimate = planner.plan_mosaic(shuffled, model)
+    assert time.monotonic() - start < 5
+    assert estimate <= model.path_time(planner.serpentine_order(shuffled))
+
+
+def test_improve_order_time_budget():
+    grid = [(float(az), float(el)) for az in range(0, 120, 15)
+            for el in range(-30, 31, 15)]
+    random.seed(2)
+    random.shuffle(grid)
+    model = planner.SlewModel()
+    # Out of time right away, the order is returned unchanged
+    assert planner.improve_order(grid, model, time_budget=0) == grid
+    improved = planner.improve_order(grid, model)
+    assert sorted(improved) == sorted(grid)
+    assert model.path_time(improved) < model.path_time(grid)
+
+
+def test_camera_fov():
+    fov_h, fov_v = planner.camera_fov()
+    # 3072 x 2048 pixels of 0.00429 mm behind a 100 mm lens
+    assert fov_h == pytest.approx(7.540, abs=1e-3)
+    assert fov_v == pytest.approx(5.031, abs=1e-3)
+
+
+@pytest.mark.parametrize('overlap', [0.1, 0.2, 0.5])
+def test_grid_positions_cover_extent(overlap):
+    fov = (8.0, 5.0)
+    grid = planner.grid_positions((0, 40), (-10, 10), fov, overlap)
+    els = sorted(set(grid[:, 1]), reverse=True)
+    assert els[0] + fov[1] / 2 == pytest.approx(10)
+    assert els[-1] - fov[1] / 2 == pytest.approx(-10)
+    assert max(-numpy.diff(els)) <= fov[1] * (1 - overlap) + 1e-3
+    # Edges are covered and neighbours overlap by at least `overlap`,
+    # with the azimuth footprint widening away from the horizon
+    row = grid[grid[:, 1] == els[0], 0]
+    row_fov = fov[0] / numpy.cos(numpy.radians(els[0] - fov[1] / 2))
+    assert min(row) - row_fov / 2 == pytest.approx(0, abs=1e-3)
+    assert max(row) + row_fov / 2 == pytest.approx(40, abs=1e-3)
+    assert max(abs(numpy.diff(row))) <= row_fov * (1 - overlap) + 1e-3
+    # Serpentine rows
+    assert list(row) == sorted(row)
+    next_row = grid[grid[:, 1] == els[1], 0]
+    assert list(next_row) == sorted(next_row, reverse=True)
+
+
+def test_grid_positions_fewer_frames_near_zenith():
+    fov = (8.0, 5.0)
+    low = planner.grid_positions((0, 90), (0, 5), fov)
+    high = planner.grid_positions((0, 90), (70, 75), fov)
+    assert len(high) < len(low)
+
+
+def test_grid_positions_single_frame():
+    grid = planner.grid_positions((0, 5), (0, 3), (8.0, 5.0))
+    assert grid.tolist() == [[2.5, 1.5]]
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import math
+import pytest
+from stereosim.maze.pose import SampleHistory, interpolate, nlerp
+
+
+def test_nlerp():
+    half = math.sqrt(0.5)
+    q = nlerp([1, 0, 0, 0], [0, 1, 0, 0], 0.5)
+    assert q == pytest.approx([half, half, 0, 0])
+    assert sum(c * c for c in q) == pytest.approx(1.0)
+    # -q1 is the same rotation as q1
+    q1 = [half, half, 0, 0]
+    assert nlerp([1, 0, 0, 0], [-c for c in q1], 0.5) == \
+        pytest.approx(nlerp([1, 0, 0, 0], q1, 0.5))
+
+
+def test_interpolate():
+    sample = interpolate({'temp': 20.0, 'accel': [0, 0, 9.8], 'id': 'a'},
+                         {'temp': 22.0, 'accel': [1, 0, 9.8], 'id': 'b'},
+                         0.75)
+    assert sample['temp'] == pytest.approx(21.5)
+    assert sample['accel'] == pytest.approx([0.75, 0, 9.8])
+    assert sample['id'] == 'b'
+
+
+def test_history_at():
+    history = SampleHistory(maxlen=10)
+    assert history.at(1.0) == (None, None)
+    history.append(1.0, {'quat': [1, 0, 0, 0], 'temp': 10.0})
+    history.append(2.0, {'quat': [0, 1, 0, 0], 'temp': 20.0})
+
+    sample, offset = history.at(1.25)
+    assert sample['temp'] == pytest.approx(12.5)
+    assert offset == pytest.approx(0.25)
+    assert sample['quat'][0] > sample['quat'][1] > 0
+
+    sample, offset = history.at(3.5)
+    assert sample['temp'] == 20.0
+    assert offset == pytest.approx(1.5)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import time
+import pytest
+from stereosim.maze.scheduler import IntervalScheduler
+
+
+class FakeClock(object):
+    """Monotonic clock that only advances on sleep and simulated work."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_interval_no_drift():
+    clock = FakeClock()
+    starts = []
+
+    def action():
+        starts.append(clock.now)
+        clock.now += 0.3  # capture time
+
+    report = IntervalScheduler(1.0, clock=clock, sleep=clock.sleep).run(
+        action, 100)
+    assert report['executed'] == 100
+    assert report['missed'] == []
+    assert report['jitter_max'] == 0
+    assert starts[-1] == pytest.approx(199.0)
+
+
+def test_interval_skips_missed_slots():
+    clock = FakeClock()
+    durations = iter([0.2, 2.5, 0.2, 0.2, 0.2])
+    starts = []
+
+    def action():
+        starts.append(clock.now - 100.0)
+        clock.now += next(durations)
+
+    report = IntervalScheduler(1.0, clock=clock, sleep=clock.sleep).run(
+        action, 6)
+    # The second capture overran slots 2 and 3, the cadence is kept
+    assert report['missed'] == [2, 3]
+    assert report['executed'] == 4
+    assert starts == pytest.approx([0.0, 1.0, 4.0, 5.0])
+
+
+def test_interval_flags_late_slots():
+    clock = FakeClock()
+    durations = iter([2.5, 0.2, 0.2])
+
+    def action():
+        clock.now += next(durations)
+
+    report = IntervalScheduler(1.0, skip_missed=False, clock=clock,
+                               sleep=clock.sleep).run(action, 3)
+    assert report['missed'] == []
+    assert report['late'] == [1]
+    assert report['executed'] == 3
+    assert report['jitter_max'] == pytest.approx(1.5)
+
+
+def test_interval_real_clock():
+    report = IntervalScheduler(0.02).run(lambda: time.sleep(0.005), 10)
+    assert report['executed'] == 10
+    assert report['jitter_max'] < 0.02
+
+
+def test_interval_stop_ends_wait():
+    stop = threading.Event()
+
+    def action():
+        threading.Timer(0.05, stop.set).start()
+
+    start = time.monotonic()
+    report = IntervalScheduler(60.0).run(action, 2, stop=stop)
+    assert time.monotonic() - start < 5
+    assert report['executed'] == 1
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import socket
+import time
+from fractions import Fraction
+import pytest
+from stereosim.maze import exif, simulator
+from stereosim.maze.stereo_camera import StereoCamera
+
+
+@pytest.fixture
+def cam(tmpdir):
+    backend = simulator.SimulatedGPhoto2(
+        profile={'bandwidth': 200e6, 'capture_latency': 0.01})
+    cam = StereoCamera(backend=backend)
+    cam.port_cache_path = str(tmpdir.join('cameras.ini'))
+    cam.reconnect()
+    yield cam
+    cam.disconnect()
+
+
+def test_jpeg_exif():
+    data = simulator.make_jpeg(
+        6000, 4000, 200000,
+        simulator.make_exif('EOS', Fraction(473, 10), Fraction(1, 200),
+                            Fraction(8), 400, '2020:01:02 03:04:05'))
+    assert len(data) == 200000
+    assert data[:2] == b'\xff\xd8' and data[-2:] == b'\xff\xd9'
+    record = exif.read_exif(data)
+    assert record.focal_length == Fraction(473, 10)
+    assert str(record.exposure_time) == '1/200'
+    assert record.f_number == 8
+    assert record.iso == 400
+    assert record.date_time_original == '2020:01:02 03:04:05'
+    assert record.model == 'EOS'
+    # Three components, as a camera JPEG
+    sof = data.index(b'\xff\xc0')
+    assert data[sof + 9] == 3
+
+
+def test_card_freed_after_download(cam, tmpdir):
+    for x in range(3):
+        cam.capture_images(str(tmpdir), '001_{:04d}'.format(x))
+    body = cam.gp.body(StereoCamera.LEFTNAME)
+    assert body.files == {}
+    for x in range(body.CARD_FILES + 4):
+        body.take_picture()
+    assert len(body.files) == body.CARD_FILES
+
+
+@pytest.mark.parametrize('capture_mode', ['blocking', 'event'])
+def test_capture(cam, tmpdir, capture_mode):
+    cam.capture_mode = capture_mode
+    paths, stats = cam.capture_images(str(tmpdir), '001_0001')
+    assert [os.path.basename(path) for path in paths] == \
+        ['L_001_0001.JPG', 'R_001_0001.JPG']
+    assert os.path.getsize(paths[0]) == 1024 ** 2
+    assert stats[0]['shutterspeed'] == '1/200 sec'
+    assert stats[1]['focallength'] == '100 mm'
+    assert stats[0]['checksum'] != stats[1]['checksum']
+
+
+@pytest.mark.parametrize('capture_mode', ['blocking', 'event'])
+def test_trigger_skew(tmpdir, capture_mode):
+    backend = simulator.SimulatedGPhoto2(
+        profile={'command_latency': 0.02, 'capture_latency': 0.01})
+    cam = StereoCamera(capture_mode=capture_mode, backend=backend)
+    cam.port_cache_path = str(tmpdir.join('cameras.ini'))
+    cam.reconnect()
+    try:
+        triggers = cam.trigger_images()
+        assert cam.trigger_skew(triggers) < 0.01
+    finally:
+        cam.disconnect()
+
+
+def test_stats_follow_dials(cam, tmpdir):
+    cam.capture_images(str(tmpdir), '001_0001')
+    # Turned on the body, the cached config is not refreshed
+    body = cam.gp.body('LEFT')
+    body.config.get_child_by_name('aperture').set_value('5.6')
+    body.config.get_child_by_name('iso').set_value('800')
+    paths, stats = cam.capture_images(str(tmpdir), '001_0002')
+    assert (stats[0]['aperture'], stats[0]['iso']) == ('5.6', '800')
+    assert (stats[1]['aperture'], stats[1]['iso']) == ('8', '100')
+    assert stats[0]['imageformat'] == 'Large Fine JPEG'
+
+
+def test_reconnect_after_drop(cam, tmpdir):
+    cam.gp.body('RIGHT').dropped = True
+    assert cam.reconnect() == (True, [(True, 'Simulated EOS')] * 2)
+    cam.capture_images(str(tmpdir), '001_0002')
+
+
+def test_reconnect_after_port_swap(cam, tmpdir):
+    left, right = cam.gp.body('LEFT'), cam.gp.body('RIGHT')
+    left.addr, right.addr = right.addr, left.addr
+    left.dropped = right.dropped = True
+    assert cam.reconnect()[0]
+    assert [camera._camera_name for camera in cam.cameras] == \
+        ['LEFT', 'RIGHT']
+    paths, stats = cam.capture_images(str(tmpdir), '001_0003')
+    with open(paths[0], 'rb') as f:
+        assert b'LEFT 1' in f.read()
+    # The cache was rewritten with the new ports
+    assert cam._load_port_cache() == {left.addr: 'LEFT',
+                                      right.addr: 'RIGHT'}
+
+
+def test_port_cache_drops_stale_ports(cam):
+    cam.cameras[0]._port = 'usb:009,009'
+    cam._save_port_cache()
+    assert cam._load_port_cache() == {'usb:009,009': 'LEFT',
+                                      'sim:002': 'RIGHT'}
+
+
+def test_ptu_commands():
+    ptu = simulator.PTUEmulator()
+    assert ptu.execute('PR') == '* 92.5714 seconds arc per Pan position'
+    assert ptu.execute('PS4000') == '*'
+    assert ptu.execute('PA40000') == '*'
+    assert ptu.execute('PP1000') == '*'
+    assert ptu.execute('A') == '*'
+    assert ptu.execute('PP') == '* Current Pan position is 1000'
+    assert ptu.execute('TP9000').startswith('! Maximum allowable Tilt')
+    assert ptu.execute('XX') == '! Illegal Command'
+
+    ptu.execute('FT')
+    ptu.execute('S')
+    ptu.execute('TP-100')
+    assert ptu.execute('TP') == '* 0'  # slaved, waits for 'A'
+    ptu.execute('A')
+    assert ptu.execute('TP') == '* -100'
+    assert ptu.angle() == pytest.approx((1000 * 92.5714 / 3600,
+                                         -100 * 46.2857 / 3600))
+
+
+def test_ptu_tcp():
+    ptu = simulator.PTUEmulator(terse=True).start()
+    try:
+        with socket.create_connection(ptu.address, timeout=5) as sock:
+            greeting = ptu.GREETING.encode()
+            sock.sendall(b'PA40000 PP500 A PP ')
+            reply = b''
+            while reply.count(b'\r\n') < 6:
+                reply += sock.recv(1024)
+        assert reply.startswith(greeting)
+        assert reply[len(greeting):] == b'*\r\n*\r\n*\r\n* 500\r\n'
+    finally:
+        ptu.stop()
+
+
+def test_imu_stream():
+    imu = simulator.IMUEmulator(rate=100).start()
+    try:
+        fd = os.open(imu.port, os.O_RDONLY | os.O_NOCTTY)
+        data = b''
+        deadline = time.monotonic() + 5
+        while data.count(b'\n') < 2 and time.monotonic() < deadline:
+            data += os.read(fd, 4096)
+        os.close(fd)
+        sample = json.loads(data.split(b'\n')[1])
+        assert len(sample['quat']) == 4
+    finally:
+        imu.stop()
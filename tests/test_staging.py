@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import pytest
+from stereosim.maze import staging
+from stereosim.maze.staging import StagingArea
+
+
+def stage_pair(area, session_dir, name, callback=None):
+    staged_dir = area.stage_path(session_dir)
+    paths = []
+    for camera in ('LEFT', 'RIGHT'):
+        os.makedirs(os.path.join(staged_dir, camera), exist_ok=True)
+        path = os.path.join(staged_dir, camera, camera[0] + '_' + name)
+        with open(path, 'wb') as f:
+            f.write(b'\xff\xd8' + b'\x00' * 1000)
+        paths.append(path)
+    marker = os.path.join(session_dir, name + '.flushed')
+    return area.flush(paths, marker, callback), paths, marker
+
+
+def test_staging_flush(tmp_path):
+    archive = str(tmp_path / 'archive')
+    session_dir = os.path.join(archive, 'session_001')
+    area = StagingArea(str(tmp_path / 'shm'), archive, fsync_batch=3)
+    results = [stage_pair(area, session_dir, '{:04d}.JPG'.format(x))
+               for x in range(5)]
+    area.join()
+    assert area.errors == []
+    assert area.staged_bytes == 0
+    for archived, staged, marker in results:
+        for archive_path, staged_path in zip(archived, staged):
+            assert os.path.isfile(archive_path)
+            assert not os.path.exists(staged_path)
+            assert area.locate(archive_path) == archive_path
+        with open(marker) as f:
+            assert f.read().split() == [os.path.basename(p) for p in archived]
+    area.close()
+
+
+def test_staging_callback_after_marker(tmp_path):
+    archive = str(tmp_path / 'archive')
+    session_dir = os.path.join(archive, 'session_001')
+    area = StagingArea(str(tmp_path / 'shm'), archive)
+    marker = os.path.join(session_dir, '0001.JPG.flushed')
+    durable = []
+
+    def callback(archive_paths):
+        # Only called once the pair survives a crash of the staging area
+        durable.append((archive_paths, os.path.isfile(marker)))
+        raise RuntimeError("Does not stop the writer")
+    archived, staged, marker = stage_pair(area, session_dir, '0001.JPG',
+                                          callback)
+    stage_pair(area, session_dir, '0002.JPG')
+    area.join()
+    assert durable == [(archived, True)]
+    assert area.staged_bytes == 0
+    area.close()
+
+
+def test_staging_locate_before_flush(tmp_path):
+    archive = str(tmp_path / 'archive')
+    area = StagingArea(str(tmp_path / 'shm'), archive)
+    staged_dir = area.stage_path(os.path.join(archive, 'session_001'))
+    staged_path = os.path.join(staged_dir, 'L_0001.JPG')
+    with open(staged_path, 'wb') as f:
+        f.write(b'\x00' * 10)
+    # Not queued yet, so the archive path is reported
+    archive_path = area.archive_path(staged_path)
+    assert area.locate(archive_path) == archive_path
+    area._staged.add(staged_path)
+    assert area.locate(archive_path) == staged_path
+
+
+def test_staging_budget(tmp_path):
+    archive = str(tmp_path / 'archive')
+    area = StagingArea(str(tmp_path / 'shm'), archive, budget=1500)
+    session_dir = os.path.join(archive, 'session_001')
+    for x in range(4):
+        area.wait_for_budget()
+        assert area.staged_bytes <= 1500
+        stage_pair(area, session_dir, '{:04d}.JPG'.format(x))
+    area.join()
+    assert area.staged_bytes == 0
+    area.close()
+
+
+def test_staging_retries_failed_batch(tmp_path, monkeypatch):
+    archive = str(tmp_path / 'archive')
+    area = StagingArea(str(tmp_path / 'shm'), archive, retry_delay=0.01)
+    session_dir = os.path.join(archive, 'session_001')
+    copyfile = shutil.copyfile
+    failures = [OSError('archive unavailable')] * 2
+
+    def flaky_copyfile(src, dst):
+        if failures:
+            raise failures.pop()
+        return copyfile(src, dst)
+    monkeypatch.setattr(staging.shutil, 'copyfile', flaky_copyfile)
+    archived, staged, marker = stage_pair(area, session_dir, '0001.JPG')
+    area.join()
+    assert len(area.errors) == 2
+    assert area.failed == []
+    assert area.staged_bytes == 0
+    assert all(os.path.isfile(path) for path in archived)
+    area.close()
+
+
+def test_staging_budget_after_failure(tmp_path, monkeypatch):
+    archive = str(tmp_path / 'archive')
+    area = StagingArea(str(tmp_path / 'shm'), archive, budget=1500,
+                       retries=2, retry_delay=0.01)
+    session_dir = os.path.join(archive, 'session_001')
+    copyfile = shutil.copyfile
+    broken = [True]
+
+    def broken_copyfile(src, dst):
+        if broken:
+            raise OSError('archive unavailable')
+        return copyfile(src, dst)
+    monkeypatch.setattr(staging.shutil, 'copyfile', broken_copyfile)
+    archived, staged, marker = stage_pair(area, session_dir, '0001.JPG')
+    # Tried once more, and reported as still staged
+    assert area.join() == staged
+    assert len(area.errors) == 4
+    assert len(area.failed) == 1
+    assert area.staged_bytes == 2004
+    with pytest.raises(OSError):
+        area.wait_for_budget()
+    # The refused capture queued the pair again, which now goes through
+    broken.clear()
+    assert area.join() == []
+    area.wait_for_budget()
+    assert area.failed == []
+    assert area.staged_bytes == 0
+    area.close()